@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""Fill in the typed copy of existing numeric QC metric values.
+
+Metric values used to be stored only as '::' delimited text. New values
+are also stored as an array of numbers, and this script converts any older
+values that are missing it. Values that aren't numeric are left as text.
+It's safe to run more than once and to interrupt, each batch is committed
+as it completes. The metric summary statistics are rebuilt afterwards so
+they include the converted values.
+
+Usage:
+    backfill_metric_values.py [options]
+
+Options:
+    --batch-size N  The number of rows to convert per transaction.
+                    [default: 1000]
+    --quiet, -q     Only report errors.
+    --verbose, -v   Be chatty.
+    --debug, -d     Be extra chatty.
+"""
+import os
+import sys
+import logging
+
+from docopt import docopt
+
+import dashboard
+from dashboard.models import MetricValue, MetricSummary
+
+dashboard.connect_db()
+
+logging.basicConfig(level=logging.WARN,
+                    format="[%(name)s] %(levelname)s: %(message)s")
+logger = logging.getLogger(os.path.basename(__file__))
+
+
+def main():
+    args = docopt(__doc__)
+    batch_size = args["--batch-size"]
+    quiet = args["--quiet"]
+    verbose = args["--verbose"]
+    debug = args["--debug"]
+
+    if verbose:
+        logger.setLevel(logging.INFO)
+    if debug:
+        logger.setLevel(logging.DEBUG)
+        logging.getLogger("dashboard").setLevel(logging.DEBUG)
+    if quiet:
+        logger.setLevel(logging.ERROR)
+
+    try:
+        batch_size = int(batch_size)
+    except ValueError:
+        logger.error(f"Invalid batch size {batch_size}")
+        sys.exit(1)
+
+    try:
+        updated = MetricValue.backfill(batch_size=batch_size)
+    except Exception as e:
+        logger.error(f"Failed to backfill metric values. Reason - {e}")
+        sys.exit(1)
+
+    logger.info(f"Converted {updated} metric values.")
+
+    try:
+        MetricSummary.rebuild()
+    except Exception as e:
+        logger.error(f"Failed to rebuild metric summary. Reason - {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""Index the QC manifest files of each timepoint in the database.
+
+The timepoint pages read QC manifests from the qc_manifests table and only
+go to disk for manifests that have changed since they were indexed. Run
+this after the nightly import and QC generation so page views rarely have
+to, or to backfill the table for existing data.
+
+Usage:
+    index_qc_manifests.py [options] [<study>...]
+    index_qc_manifests.py [options] --timepoint=<name>...
+
+Args:
+    <study>                 One or more study IDs to index. All studies are
+                            indexed if none are given.
+
+Options:
+    --timepoint=<name>      Index only the given timepoint(s).
+    --force                 Re-read every manifest, even those that haven't
+                            been modified since they were indexed.
+    --quiet, -q             Only report errors.
+    --verbose, -v           Be chatty.
+    --debug, -d             Be extra chatty.
+"""
+import os
+import logging
+
+from docopt import docopt
+
+import dashboard
+import dashboard.qc_manifests as qc_manifests
+from dashboard.models import Study, Timepoint
+
+dashboard.connect_db()
+
+logging.basicConfig(level=logging.WARN,
+                    format="[%(name)s] %(levelname)s: %(message)s")
+logger = logging.getLogger(os.path.basename(__file__))
+
+
+def main():
+    args = docopt(__doc__)
+    study_ids = args["<study>"]
+    timepoint_ids = args["--timepoint"]
+    force = args["--force"]
+    quiet = args["--quiet"]
+    verbose = args["--verbose"]
+    debug = args["--debug"]
+
+    if verbose:
+        logger.setLevel(logging.INFO)
+    if debug:
+        logger.setLevel(logging.DEBUG)
+        logging.getLogger("dashboard.qc_manifests").setLevel(logging.DEBUG)
+    if quiet:
+        logger.setLevel(logging.ERROR)
+
+    for timepoint in get_timepoints(study_ids, timepoint_ids):
+        logger.info(f"Indexing QC manifests for {timepoint}")
+        try:
+            records = qc_manifests.update_index(timepoint, force=force)
+        except Exception as e:
+            logger.error(f"Failed to index {timepoint}. Reason - {e}")
+            continue
+        logger.debug(f"{timepoint} has {len(records)} QC manifests")
+
+
+def get_timepoints(study_ids, timepoint_ids):
+    """Get the timepoint records to index.
+
+    Args:
+        study_ids (:obj:`list`): A list of study IDs. May be empty.
+        timepoint_ids (:obj:`list`): A list of timepoint names. May be empty,
+            in which case every timepoint of the given studies is returned.
+
+    Returns:
+        list: A list of :obj:`dashboard.models.Timepoint` records.
+    """
+    if timepoint_ids:
+        timepoints = []
+        for name in timepoint_ids:
+            timepoint = dashboard.models.db.session.get(Timepoint, name)
+            if not timepoint:
+                logger.error(f"Timepoint {name} does not exist. Skipping.")
+                continue
+            timepoints.append(timepoint)
+        return timepoints
+
+    if not study_ids:
+        return Timepoint.query.order_by(Timepoint.name).all()
+
+    timepoints = []
+    for study_id in study_ids:
+        study = dashboard.models.db.session.get(Study, study_id)
+        if not study:
+            logger.error(f"Study {study_id} does not exist. Skipping.")
+            continue
+        timepoints.extend(study.timepoints.order_by(Timepoint.name).all())
+    return timepoints
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""Load the JSON sidecars of each study's scans into the database.
+
+Sidecars are listed and read with a pool of threads, parsed with a pool of
+processes and saved in batches. Only sidecars that have changed since they
+were last loaded are read, unless --force is given. Use this to re-index a
+study's headers after its nifti files have been regenerated (e.g. after a
+dcm2niix upgrade).
+
+Usage:
+    load_scan_sidecars.py [options] [<study>...]
+
+Args:
+    <study>                 One or more study IDs to load. All studies are
+                            loaded if none are given.
+
+Options:
+    --threads=<num>         The number of threads to read files with.
+                            [default: 8]
+    --processes=<num>       The number of processes to parse files with.
+                            Defaults to the number of CPUs. Use 0 to parse
+                            in the main process.
+    --batch-size=<num>      The number of scans to update per transaction.
+    --force                 Re-load every sidecar, even those that haven't
+                            changed since they were last loaded.
+    --quiet, -q             Only report errors.
+    --verbose, -v           Be chatty.
+    --debug, -d             Be extra chatty.
+"""
+import os
+import logging
+
+from docopt import docopt
+
+import dashboard
+import dashboard.scan_sidecars as scan_sidecars
+from dashboard.models import Study
+
+dashboard.connect_db()
+
+logging.basicConfig(level=logging.WARN,
+                    format="[%(name)s] %(levelname)s: %(message)s")
+logger = logging.getLogger(os.path.basename(__file__))
+
+
+def main():
+    args = docopt(__doc__)
+    study_ids = args["<study>"]
+    threads = int(args["--threads"])
+    processes = args["--processes"]
+    batch_size = args["--batch-size"]
+    force = args["--force"]
+    quiet = args["--quiet"]
+    verbose = args["--verbose"]
+    debug = args["--debug"]
+
+    if verbose:
+        logger.setLevel(logging.INFO)
+    if debug:
+        logger.setLevel(logging.DEBUG)
+        logging.getLogger("dashboard.scan_sidecars").setLevel(logging.DEBUG)
+    if quiet:
+        logger.setLevel(logging.ERROR)
+
+    if processes is not None:
+        processes = int(processes)
+    if batch_size is not None:
+        batch_size = int(batch_size)
+
+    if not study_ids:
+        study_ids = [study.id for study in Study.query.order_by(Study.id)]
+
+    for study_id in study_ids:
+        if not dashboard.models.db.session.get(Study, study_id):
+            logger.error(f"Study {study_id} does not exist. Skipping.")
+            continue
+        logger.info(f"Loading JSON sidecars for {study_id}")
+        try:
+            updated = scan_sidecars.load_sidecars(
+                study_id, threads=threads, processes=processes, force=force,
+                batch_size=batch_size)
+        except Exception as e:
+            logger.error(f"Failed to load sidecars for {study_id}. "
+                         f"Reason - {e}")
+            continue
+        logger.info(f"Updated {updated} scans for {study_id}")
+
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,9 @@ that tag).
 To prevent a project's settings file from being added to the database
 add 'DB_IGNORE: True' to the settings file.
 
+The changes for each study (and for the tags) are saved together in a single
+transaction. If any of them fail, none of that study's changes are saved.
+
 Usage:
     parse_config.py [options]
     parse_config.py [options] <study>
@@ -44,6 +47,7 @@ import logging
 from docopt import docopt
 
 import dashboard
+from dashboard.models import db_batch
 import datman.config
 from datman.xnat import get_server
 from datman.exceptions import UndefinedSetting
@@ -77,7 +81,12 @@ def main():
         update_study(study, config)
         return
 
-    update_tags(config, skip_all, accept_all)
+    try:
+        with db_batch():
+            update_tags(config, skip_all, accept_all)
+    except Exception as e:
+        logger.error(f"Failed updating tags. No tag changes were saved. "
+                     f"Reason - {e}")
     update_studies(config, skip_all, accept_all)
 
 
@@ -169,6 +178,27 @@ def update_study(study_id, config, skip_delete=False, delete_all=False):
     if ignore:
         return
 
+    try:
+        with db_batch():
+            update_study_settings(study_id, config, skip_delete, delete_all)
+    except Exception as e:
+        logger.error(f"Failed updating {study_id}. No changes were saved for "
+                     f"this study. Reason - {e}")
+
+
+def update_study_settings(study_id, config, skip_delete=False,
+                          delete_all=False):
+    """Update the study, its REDCap configuration and its sites.
+
+    Args:
+        study_id (str): The ID of the study to update.
+        config (:obj:`datman.config.config`): a Datman config object, set to
+            the study.
+        skip_delete (bool, optional): Don't prompt the user and skip deletion
+            of any records no longer defined in the config files.
+        delete_all (bool, optional): Don't prompt the user and delete any
+            records no longer defined in the config files.
+    """
     study = dashboard.queries.get_studies(study_id, create=True)[0]
 
     update_setting(study, "description", config, "Description")
@@ -427,13 +457,19 @@ def update_studies(config, skip_delete=False, delete_all=False):
                  if study.id not in studies]
 
     if undefined:
-        delete_records(
-            undefined,
-            prompt=("Study {} missing from config files. If deleted any "
-                    "timepoints and their contents will also be deleted."),
-            skip_delete=skip_delete,
-            delete_all=delete_all
-        )
+        try:
+            with db_batch():
+                delete_records(
+                    undefined,
+                    prompt=("Study {} missing from config files. If deleted "
+                            "any timepoints and their contents will also be "
+                            "deleted."),
+                    skip_delete=skip_delete,
+                    delete_all=delete_all
+                )
+        except Exception as e:
+            logger.error(f"Failed deleting studies. No studies were removed. "
+                         f"Reason - {e}")
 
     for study in studies:
         update_study(study, config, skip_delete, delete_all)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""Rebuild the summary of outstanding QC issues shown on each study page.
+
+The dashboard keeps a precomputed table of new sessions, sessions missing
+scans and sessions missing REDCap surveys for every study. It's kept up to
+date as records change, but this script can be used to backfill it or to
+verify that it still agrees with the underlying records.
+
+Usage:
+    rebuild_qc_summary.py [options] [<study>...]
+
+Args:
+    <study>         One or more study IDs to rebuild or check. All studies
+                    are processed if none are given.
+
+Options:
+    --check         Don't modify the summary. Instead compare it against the
+                    underlying records and report any differences. Exits
+                    with a non-zero status if differences are found.
+    --quiet, -q     Only report errors.
+    --verbose, -v   Be chatty.
+    --debug, -d     Be extra chatty.
+"""
+import os
+import sys
+import logging
+
+from docopt import docopt
+
+import dashboard
+from dashboard.models import Study, StudyQcSummary
+
+dashboard.connect_db()
+
+logging.basicConfig(level=logging.WARN,
+                    format="[%(name)s] %(levelname)s: %(message)s")
+logger = logging.getLogger(os.path.basename(__file__))
+
+
+def main():
+    args = docopt(__doc__)
+    study_ids = args["<study>"]
+    check = args["--check"]
+    quiet = args["--quiet"]
+    verbose = args["--verbose"]
+    debug = args["--debug"]
+
+    if verbose:
+        logger.setLevel(logging.INFO)
+    if debug:
+        logger.setLevel(logging.DEBUG)
+    if quiet:
+        logger.setLevel(logging.ERROR)
+
+    studies = get_studies(study_ids)
+
+    if check:
+        if not check_studies(studies):
+            sys.exit(1)
+        return
+
+    for study in studies:
+        logger.info(f"Rebuilding QC summary for {study.id}")
+        try:
+            StudyQcSummary.rebuild(study.id)
+        except Exception as e:
+            logger.error(f"Failed to rebuild {study.id}. Reason - {e}")
+
+
+def get_studies(study_ids):
+    """Get the study records to process.
+
+    Args:
+        study_ids (:obj:`list`): A list of study IDs. May be empty, in which
+            case all studies are returned.
+
+    Returns:
+        list: A list of :obj:`dashboard.models.Study` records.
+    """
+    if not study_ids:
+        return Study.query.order_by(Study.id).all()
+
+    studies = []
+    for study_id in study_ids:
+        study = dashboard.models.db.session.get(Study, study_id)
+        if not study:
+            logger.error(f"Study {study_id} does not exist. Skipping.")
+            continue
+        studies.append(study)
+    return studies
+
+
+def check_studies(studies):
+    """Report any differences between the summary and the live queries.
+
+    Args:
+        studies (:obj:`list`): A list of :obj:`dashboard.models.Study`
+            records to check.
+
+    Returns:
+        bool: True if every study's summary is consistent.
+    """
+    consistent = True
+    for study in studies:
+        logger.debug(f"Checking QC summary for {study.id}")
+        problems = StudyQcSummary.find_inconsistencies(study)
+        if not problems:
+            continue
+        consistent = False
+        for flag, found in problems.items():
+            for session in found["unreported"]:
+                logger.error(f"{study.id} - {session} should be marked "
+                             f"{flag} but isn't.")
+            for session in found["stale"]:
+                logger.error(f"{study.id} - {session} is marked {flag} but "
+                             "shouldn't be.")
+    return consistent
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""Copy GitHub issues into the dashboard's local issue index.
+
+Timepoint pages show the issues stored in the database instead of searching
+GitHub on every view. The index is normally kept current by a scheduled job
+and (optionally) the GitHub webhook, but this script can be used to backfill
+it or to sync from cron when the scheduler isn't running.
+
+Usage:
+    sync_github_issues.py [options]
+
+Options:
+    --full          Re-read every issue, instead of only those updated since
+                    the last sync.
+    --token=<tok>   The GitHub token to use. Defaults to the
+                    GITHUB_ISSUES_TOKEN environment variable.
+    --quiet, -q     Only report errors.
+    --verbose, -v   Be chatty.
+"""
+import os
+import sys
+import logging
+
+from docopt import docopt
+
+import dashboard
+from dashboard.blueprints.timepoints.utils import sync_issues
+
+dashboard.connect_db()
+
+logging.basicConfig(level=logging.WARN,
+                    format="[%(name)s] %(levelname)s: %(message)s")
+logger = logging.getLogger(os.path.basename(__file__))
+
+
+def main():
+    args = docopt(__doc__)
+    full = args["--full"]
+    token = args["--token"]
+    quiet = args["--quiet"]
+    verbose = args["--verbose"]
+
+    if verbose:
+        logger.setLevel(logging.INFO)
+    if quiet:
+        logger.setLevel(logging.ERROR)
+
+    try:
+        count = sync_issues(token=token, full=full)
+    except Exception as e:
+        logger.error(f"Failed to sync GitHub issues. Reason - {e}")
+        sys.exit(1)
+    logger.info(f"Synced {count} issues")
+
+
+if __name__ == "__main__":
+    main()
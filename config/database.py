@@ -2,6 +2,8 @@
 """
 import os
 
+from .utils import read_boolean
+
 # User to connect to database with. Can be None to connect as current user
 user = os.environ.get('POSTGRES_USER')
 
@@ -36,3 +38,9 @@ TZ_OFFSET = os.environ.get('TIMEZONE') or -240
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
 SQLALCHEMY_BINDS = {}
+
+# Whether each process should LISTEN for changes to the cached reference
+# data (studies, sites, scan types, etc.). Only disable this if a single
+# process ever modifies these records (e.g. in unit tests)
+REFERENCE_DATA_LISTEN = read_boolean('DASHBOARD_REFERENCE_LISTEN',
+                                     default=True)
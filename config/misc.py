@@ -24,9 +24,36 @@ GITHUB_OWNER = os.environ.get('GITHUB_ISSUES_OWNER')
 # Whether GITHUB_REPO is a public repository. Set to False if private
 GITHUB_PUBLIC = read_boolean('GITHUB_ISSUES_PUBLIC', default=True)
 
+# The GitHub API to use. Only needs to change for GitHub Enterprise servers
+# (or a local stub server when testing)
+GITHUB_API_URL = os.environ.get('GITHUB_API_URL', 'https://api.github.com')
+
+# A token to read GITHUB_REPO's issues with when syncing the local copy of
+# them. Can be unset for public repositories, at a much lower rate limit
+GITHUB_TOKEN = os.environ.get('GITHUB_ISSUES_TOKEN')
+
+# How many minutes between each sync of the local copy of the issues. Set
+# to 0 to disable the scheduled sync (e.g. if the webhook is used instead).
+# The sync is only scheduled if GITHUB_OWNER and GITHUB_REPO are set
+GITHUB_SYNC_INTERVAL = int(os.environ.get('GITHUB_ISSUES_SYNC_INTERVAL', 15))
+
+# The secret GitHub signs issue webhook deliveries with. The webhook is
+# disabled if this isn't set
+GITHUB_WEBHOOK_SECRET = os.environ.get('GITHUB_ISSUES_WEBHOOK_SECRET')
+
 # The REDCap token to use when retrieving records after a data entry trigger
 REDCAP_TOKEN = os.environ.get('REDCAP_TOKEN')
 
+# The token pipelines must send (as 'Authorization: Bearer <token>') to upload
+# QC metrics. Uploads are disabled if this isn't set
+METRICS_API_TOKEN = os.environ.get('DASHBOARD_METRICS_TOKEN')
+
+# How often (in seconds) each worker reloads its search suggestion index in
+# the background to pick up records added by other processes (e.g. datman).
+# Set to 0 to only load it when the worker starts
+SEARCH_INDEX_MAX_AGE = int(
+    os.environ.get('DASHBOARD_SEARCH_INDEX_MAX_AGE', 600))
+
 # The directory to read nightly run logs from, if any
 RUN_LOG_DIR = os.environ.get('DATMAN_RUN_LOGS', '')
 
@@ -8,6 +8,7 @@ from flask_apscheduler.auth import HTTPBasicAuth
 from dashboard.task_scheduler import ContextThreadExecutor
 from .utils import read_boolean
 from .database import SQLALCHEMY_DATABASE_URI
+from .misc import GITHUB_SYNC_INTERVAL, GITHUB_OWNER, GITHUB_REPO
 
 SCHEDULER_JOBSTORES = {
     'default': SQLAlchemyJobStore(url=SQLALCHEMY_DATABASE_URI)
@@ -35,6 +36,18 @@ if SCHEDULER_ENABLED:
         # internet unless HTTPS is being used
         SCHEDULER_AUTH = HTTPBasicAuth()
 
+    # Recurring jobs. These are saved in the job store, so they must
+    # replace the copy saved the last time the server started
+    SCHEDULER_JOBS = []
+    if GITHUB_SYNC_INTERVAL and GITHUB_OWNER and GITHUB_REPO:
+        SCHEDULER_JOBS.append({
+            'id': 'sync_github_issues',
+            'func': 'dashboard.blueprints.timepoints.utils:sync_issues',
+            'trigger': 'interval',
+            'minutes': GITHUB_SYNC_INTERVAL,
+            'replace_existing': True
+        })
+
 else:
     SCHEDULER_API_ENABLED = False
 
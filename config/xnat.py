@@ -19,3 +19,16 @@ if XNAT_ENABLED and (XNAT_USER or XNAT_PASS) and not (XNAT_USER and XNAT_PASS):
     logger.error("XNAT_USER or XNAT_PASS undefined, xnat integration will "
                  "be disabled.")
     XNAT_ENABLED = False
+
+# How many seconds QC changes to an experiment are held, so repeated changes
+# are pushed to XNAT together
+XNAT_SYNC_WINDOW = float(os.environ.get('DASH_XNAT_SYNC_WINDOW', 5))
+
+# The most series updates each worker may hold for XNAT. Changes made while
+# it's full are not pushed
+XNAT_SYNC_MAX_PENDING = int(os.environ.get('DASH_XNAT_SYNC_MAX_PENDING', 1000))
+
+# How many times to retry a failed push, and how many seconds to wait before
+# the first retry (the wait doubles each time)
+XNAT_SYNC_RETRIES = int(os.environ.get('DASH_XNAT_SYNC_RETRIES', 5))
+XNAT_SYNC_BACKOFF = float(os.environ.get('DASH_XNAT_SYNC_BACKOFF', 10))
@@ -4,6 +4,7 @@ from flask_login import login_user, current_user, login_fresh
 
 from . import auth_bp
 from .oauth import OAuthSignIn
+from ..timepoints.utils import ISSUE_ACCESS_KEY
 from ...models import User
 from ...utils import is_safe_url
 from ...exceptions import InvalidUsage
@@ -55,5 +56,7 @@ def oauth_callback(provider):
     login_user(user, remember=True)
     # Token is needed for access to github issues
     flask_session['active_token'] = access_token
+    # Check the new token's access to private issues again
+    flask_session.pop(ISSUE_ACCESS_KEY, None)
 
     return redirect(dest_page)
@@ -2,37 +2,149 @@ import os
 import html
 import logging
 import re
+import threading
 
 logger = logging.getLogger(__name__)
 
+# The readers for each run log file, shared by every request this process
+# handles so unchanged logs aren't read again.
+_run_logs = {}
+_run_logs_lock = threading.Lock()
+
+
+class RunLog:
+    """A nightly run log that's read incrementally as it grows.
+
+    The file is only read again when its (inode, size, mtime) changes. If
+    it has only grown since it was last read, only the new bytes are read.
+    If it has been replaced or truncated it's read from the start.
+
+    Args:
+        path (str): The full path to the log file.
+        done_regex (str): A regex that matches the line written when the
+            nightly run is complete.
+        error_regex (str): A regex that matches each error reported.
+    """
+
+    def __init__(self, path, done_regex, error_regex):
+        self.path = path
+        self.patterns = (done_regex, error_regex)
+        self._done_regex = re.compile(done_regex)
+        self._error_regex = re.compile(error_regex)
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._key = None
+        self._offset = 0
+        self._partial = b""
+        self.lines = []
+        self.done = False
+        self.errors = 0
+
+    @property
+    def header(self):
+        if not self.done:
+            return "Running..."
+        if self.errors == 1:
+            return "1 error reported"
+        return f"{self.errors} errors reported"
+
+    def refresh(self):
+        """Read anything written to the log since it was last read.
+
+        Returns:
+            bool: False if the log file can't be read, True otherwise.
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            with self._lock:
+                self._reset()
+            return False
+
+        key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            if key == self._key:
+                return True
+            if (self._key is None or stat.st_ino != self._key[0]
+                    or stat.st_size < self._offset):
+                self._reset()
+            try:
+                with open(self.path, "rb") as fh:
+                    fh.seek(self._offset)
+                    data = fh.read()
+            except OSError as e:
+                logger.error(f"Failed to read run log file {self.path}. {e}")
+                self._reset()
+                return False
+            self._offset += len(data)
+            self._add(data)
+            self._key = key
+        return True
+
+    def _add(self, data):
+        # The last line may still be being written, so it's held back until
+        # it's complete
+        *complete, self._partial = (self._partial + data).split(b"\n")
+        for raw in complete:
+            line = raw.decode("utf-8", errors="replace")
+            if self._done_regex.search(line):
+                self.done = True
+            self.errors += len(self._error_regex.findall(line))
+            self.lines.append(html.escape(line))
+
+    def get_lines(self, start=None, limit=None):
+        """Get a page of the log's lines, with any html escaped.
+
+        Args:
+            start (int, optional): The index of the first line to return.
+                If not given, the last lines of the log are returned.
+            limit (int, optional): The maximum number of lines to return.
+                Defaults to None (no limit).
+
+        Returns:
+            dict: The 'lines' found, the index of the first one ('start')
+                and the number of lines in the whole log ('total').
+        """
+        with self._lock:
+            lines = self.lines
+            if self._partial:
+                lines = lines + [html.escape(
+                    self._partial.decode("utf-8", errors="replace"))]
+            total = len(lines)
+
+        if start is None:
+            start = total - limit if limit else 0
+        start = min(max(start, 0), total)
+        end = total if not limit else min(start + limit, total)
+        return {"start": start, "total": total, "lines": lines[start:end]}
+
 
 def get_run_log(log_dir, study, done_regex, error_regex):
+    """Get a study's latest nightly run log, updated to the end of the file.
+
+    Args:
+        log_dir (str): The folder that holds the run logs.
+        study (str): A study ID.
+        done_regex (str): A regex that matches the line written when the
+            nightly run is complete.
+        error_regex (str): A regex that matches each error reported.
+
+    Returns:
+        :obj:`RunLog`: The study's log, or None if the log directory isn't
+            set or the log can't be read.
+    """
     if not log_dir:
-        return {"contents": "", "header": ""}
+        return None
 
     log_file = os.path.join(log_dir, f"{study}_latest.log")
-    output = {}
-    output["contents"] = read_log(log_file)
-    output["header"] = make_header_msg(
-        output["contents"], done_regex, error_regex)
-    return output
-
-
-def read_log(log_file):
-    try:
-        with open(log_file, "r") as contents:
-            result = contents.readlines()
-    except Exception as e:
-        logger.error(f"Failed to read run log file {log_file}. {e}")
-        return ""
-    result = [html.escape(line).replace("\n", "<br>") for line in result]
-    return "<br>".join(result)
-
-
-def make_header_msg(log_contents, done_regex, error_regex):
-    if not re.search(done_regex, log_contents):
-        return "Running..."
-    error_count = len(re.findall(error_regex, log_contents))
-    if error_count == 1:
-        return "1 error reported"
-    return f"{error_count} errors reported"
+    with _run_logs_lock:
+        run_log = _run_logs.get(log_file)
+        if run_log is None or run_log.patterns != (done_regex, error_regex):
+            run_log = RunLog(log_file, done_regex, error_regex)
+            _run_logs[log_file] = run_log
+
+    if not run_log.refresh():
+        return None
+    return run_log
@@ -1,24 +1,35 @@
 import json
 import csv
+import hmac
 import io
 import logging
 
 from flask import session as flask_session
 from flask import (current_app, render_template, flash, url_for, redirect,
-                   request, jsonify, make_response, send_file)
+                   request, jsonify, Response, stream_with_context)
 from flask_login import current_user, login_required
 
-from dashboard import db
+from dashboard import db, csrf, search_index, xnat_sync
 from . import main_bp as main
+from ...exceptions import InvalidUsage, InvalidDataException
 from .utils import get_run_log
-from ...queries import (query_metric_values_byid, query_metric_types,
-                        query_metric_values_byname, find_subjects,
-                        find_sessions, find_scans)
-from ...models import Study, Site, Timepoint, Analysis
+from ...utils import dashboard_admin_required
+from ...queries import (get_metric_values, stream_metric_values,
+                        get_metric_summaries, query_metric_types, search,
+                        METRIC_FIELDS)
+from ...models import (Study, Site, Timepoint, Analysis, MetricValue,
+                       MetricSummary)
 from ...forms import (SelectMetricsForm, StudyOverviewForm, AnalysisForm)
 
 logger = logging.getLogger(__name__)
 
+# The most search bar suggestions a client may request at once
+MAX_SUGGESTIONS = 50
+
+# The number of run log lines sent at a time, unless the client asks for
+# fewer
+RUN_LOG_PAGE_SIZE = 500
+
 
 @main.route('/')
 @main.route('/index')
@@ -53,58 +64,72 @@ def search_data(search_string=None):
         flash('Please enter a search term.')
         return redirect('index')
 
-    subjects = find_subjects(search_string)
-    if len(subjects) == 1:
-        study = subjects[0].accessible_study(current_user)
-        if study:
-            return redirect(
-                url_for('timepoints.timepoint',
-                        study_id=study.id,
-                        timepoint_id=subjects[0].name))
-    subjects = [
-        url_for('timepoints.timepoint',
-                study_id=sub.accessible_study(current_user),
-                timepoint_id=sub.name) for sub in subjects
-        if sub.accessible_study(current_user)
-    ]
-
-    sessions = find_sessions(search_string)
-    if len(sessions) == 1:
-        study = sessions[0].timepoint.accessible_study(current_user)
-        if study:
-            return redirect(
-                url_for('timepoints.timepoint',
-                        study_id=study.id,
-                        timepoint_id=sessions[0].timepoint.name,
-                        _anchor="sess" + str(sessions[0].num)))
-
-    sessions = [
-        url_for('timepoints.timepoint',
-                study_id=sess.timepoint.accessible_study(current_user),
-                timepoint_id=sess.timepoint.name,
-                _anchor="sess" + str(sess.num)) for sess in sessions
-        if sess.timepoint.accessible_study(current_user)
-    ]
-
-    scans = find_scans(search_string)
-    if len(scans) == 1:
-        study = scans[0].session.timepoint.accessible_study(current_user)
-        if study:
-            return redirect(
-                url_for('scans.scan', study_id=study.id, scan_id=scans[0].id))
-
-    scans = [
-        url_for('scans.scan',
-                study_id=scan.session.timepoint.accessible_study(current_user),
-                scan_id=scan.id) for scan in scans
-        if scan.session.timepoint.accessible_study(current_user)
-    ]
+    found = {'subject': [], 'session': [], 'scan': []}
+    for item in search(search_string, user_id=current_user.access_scope_id):
+        url = _search_result_url(item, item.study_id)
+        found[item.kind].append((item.name, url))
+
+    urls = [url for links in found.values() for _, url in links]
+    if len(urls) == 1:
+        return redirect(urls[0])
 
     return render_template('search_results.html',
                            user_search=search_string,
-                           subjects=subjects,
-                           sessions=sessions,
-                           scans=scans)
+                           subjects=found['subject'],
+                           sessions=found['session'],
+                           scans=found['scan'])
+
+
+@main.route('/search/suggest')
+@login_required
+def search_suggest():
+    """Suggest completions for a partially typed search term.
+
+    This is called as the user types, so it only reads the in-memory index
+    that's loaded when the worker starts and never queries the database.
+    """
+    try:
+        limit = min(int(request.args.get('limit', 10)), MAX_SUGGESTIONS)
+    except ValueError:
+        raise InvalidUsage("limit must be an integer", status_code=400)
+
+    if current_user.access_scope_id is None:
+        has_access = None
+    else:
+        has_access = current_user.has_study_access
+
+    matches = search_index.index.complete(request.args.get('q', ''),
+                                          limit=limit,
+                                          has_access=has_access)
+    return jsonify([{
+        'name': entry.name,
+        'kind': entry.kind,
+        'url': _search_result_url(entry, study_id)
+    } for entry, study_id in matches])
+
+
+def _search_result_url(item, study_id):
+    if item.kind == 'scan':
+        return url_for('scans.scan',
+                       study_id=study_id,
+                       scan_id=item.scan_id)
+    if item.kind == 'session':
+        return url_for('timepoints.timepoint',
+                       study_id=study_id,
+                       timepoint_id=item.timepoint,
+                       _anchor="sess" + str(item.num))
+    return url_for('timepoints.timepoint',
+                   study_id=study_id,
+                   timepoint_id=item.timepoint)
+
+
+@main.route('/xnat-sync/status')
+@login_required
+@dashboard_admin_required
+def xnat_sync_status():
+    """Report this worker's XNAT sync queue depth, outcomes and latency.
+    """
+    return jsonify(xnat_sync.worker.stats())
 
 
 @main.route('/study/<string:study_id>', methods=['GET', 'POST'])
@@ -143,20 +168,114 @@ def study(study_id=None, active_tab=None):
     form.readme_txt.data = study.read_me
     form.study_id.data = study_id
 
-    nightly_log = get_run_log(
-        current_app.config['RUN_LOG_DIR'],
-        study_id,
-        current_app.config['RUN_COMPLETE_REGEX'],
-        current_app.config['RUN_ERROR_REGEX'])
+    nightly_log = _get_run_log(study_id)
+
+    timepoint_counts = study.count_timepoints(current_user.access_scope_id)
 
     return render_template('study.html',
                            study=study,
+                           timepoint_counts=timepoint_counts,
                            form=form,
                            active_tab=active_tab,
                            nightly_log=nightly_log,
+                           run_log_page_size=RUN_LOG_PAGE_SIZE,
                            display_metrics=display_metrics)
 
 
+@main.route('/study/<string:study_id>/timepoint-table', methods=['GET'])
+@login_required
+def timepoint_table(study_id):
+    """
+    Serves one page of a study's session list to the DataTables plugin.
+
+    This implements the DataTables server-side processing protocol
+    (https://datatables.net/manual/server-side) so that only the rows being
+    displayed are ever sent to the browser.
+    """
+    if not current_user.has_study_access(study_id):
+        raise InvalidUsage("Not authorised", status_code=403)
+
+    study = db.session.get(Study, study_id)
+    if not study:
+        raise InvalidUsage("Study {} does not exist".format(study_id),
+                           status_code=404)
+
+    # Must match the column order of the table in study_timepoints.html
+    columns = ['name', 'qc_complete', 'is_phantom']
+
+    try:
+        draw = int(request.args.get('draw', 0))
+        start = max(int(request.args.get('start', 0)), 0)
+        length = int(request.args.get('length', -1))
+        sort_column = int(request.args.get('order[0][column]', 0))
+    except ValueError:
+        raise InvalidUsage("Malformed table request")
+    # Negative indexes would otherwise pick columns from the end
+    if not 0 <= sort_column < len(columns):
+        raise InvalidUsage("Malformed table request")
+    sort = columns[sort_column]
+
+    page = study.get_timepoint_page(
+        start=start,
+        length=length if length > 0 else None,
+        search=request.args.get('search[value]'),
+        sort=sort,
+        descending=request.args.get('order[0][dir]') == 'desc',
+        user_id=current_user.access_scope_id)
+
+    for timepoint in page['timepoints']:
+        timepoint['url'] = url_for('timepoints.timepoint',
+                                   study_id=study.id,
+                                   timepoint_id=timepoint['name'])
+
+    return jsonify({
+        'draw': draw,
+        'recordsTotal': page['total'],
+        'recordsFiltered': page['filtered'],
+        'data': page['timepoints']
+    })
+
+
+@main.route('/study/<string:study_id>/run-log', methods=['GET'])
+@login_required
+def run_log(study_id):
+    """
+    Serves lines from a study's latest nightly run log as JSON.
+
+    By default the last lines of the log are sent. Use 'start' to request
+    the lines from a given index on (e.g. to page back through the log or
+    to fetch lines added since the last request) and 'limit' to change how
+    many are sent.
+    """
+    if not current_user.has_study_access(study_id):
+        raise InvalidUsage("Not authorised", status_code=403)
+
+    nightly_log = _get_run_log(study_id)
+    if not nightly_log:
+        raise InvalidUsage("No run log found for {}".format(study_id),
+                           status_code=404)
+
+    try:
+        start = request.args.get('start')
+        start = int(start) if start is not None else None
+        limit = int(request.args.get('limit', RUN_LOG_PAGE_SIZE))
+    except ValueError:
+        raise InvalidUsage("Malformed run log request")
+    limit = min(max(limit, 1), RUN_LOG_PAGE_SIZE)
+
+    page = nightly_log.get_lines(start=start, limit=limit)
+    page['header'] = nightly_log.header
+    return jsonify(page)
+
+
+def _get_run_log(study_id):
+    return get_run_log(
+        current_app.config['RUN_LOG_DIR'],
+        study_id,
+        current_app.config['RUN_COMPLETE_REGEX'],
+        current_app.config['RUN_ERROR_REGEX'])
+
+
 @main.route('/metricData', methods=['GET', 'POST'])
 @login_required
 def metricData():
@@ -176,28 +295,20 @@ def metricData():
     """
     form = SelectMetricsForm()
     data = None
-    csv_data = None
-    csvname = 'dashboard/output.csv'
-    w_file = open(csvname, 'w')
+    download_url = None
 
     if form.query_complete.data == 'True':
-        data = metricDataAsJson()
-        # convert the json object to csv format
-        # Need the data field of the response object (data.data)
-        temp_data = json.loads(data.data)["data"]
-        if temp_data:
-
-            testwrite = csv.writer(w_file)
-
-            csv_data = io.BytesIO()
-            csvwriter = csv.writer(csv_data)
-            csvwriter.writerow(list(temp_data[0].keys()))
-            testwrite.writerow(list(temp_data[0].keys()))
-            for row in temp_data:
-                csvwriter.writerow(list(row.values()))
-                testwrite.writerow(list(row.values()))
-
-    w_file.close()
+        fields, byname = _get_metric_filters()
+        columns = get_metric_values(**_metric_search_terms(fields, byname))
+        if columns['value']:
+            data = [list(columns)]
+            data.extend(list(row) for row in zip(*columns.values()))
+        # Downloads are keyed by the filters alone so any worker can
+        # regenerate the same export
+        download_url = url_for('main.downloadCSV',
+                               byname=byname or None,
+                               **{k: ','.join(str(v) for v in vals)
+                                  for k, vals in fields.items()})
 
     # anything below here is for making the form boxes dynamic
     if any([
@@ -247,14 +358,8 @@ def metricData():
     form.scantype_id.choices = scantype_vals
     form.metrictype_id.choices = metrictype_vals
 
-    reader = csv.reader(open(csvname, 'r'))
-    csvList = [row for row in reader]
-
-    if csv_data:
-        csv_data.seek(0)
-        return render_template('getMetricData.html', form=form, data=csvList)
-    else:
-        return render_template('getMetricData.html', form=form, data="")
+    return render_template('getMetricData.html', form=form, data=data or "",
+                           download_url=download_url)
 
 
 def _checkRequest(request, key):
@@ -268,15 +373,42 @@ def _checkRequest(request, key):
 @main.route('/DownloadCSV')
 @login_required
 def downloadCSV():
+    """
+    Stream the metrics matching the filters in the query string as a csv.
+
+    Accepts the same GET arguments as metricDataAsJson. Rows are written out
+    as they're read from the database so nothing is stored on disk and
+    memory use doesn't grow with the size of the export.
+    """
+    fields, byname = _get_metric_filters()
+    batches = stream_metric_values(**_metric_search_terms(fields, byname))
 
-    output = make_response(send_file('output.csv', as_attachment=True))
+    output = Response(stream_with_context(_generate_metric_csv(batches)),
+                      mimetype='text/csv')
     output.headers["Content-Disposition"] = "attachment; filename=output.csv"
-    output.headers["Content-type"] = "text/csv"
     output.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
     output.headers['Pragma'] = 'no-cache'
     return output
 
 
+class _Echo:
+    # A write-only file that hands back whatever is written to it
+    def write(self, value):
+        return value
+
+
+def _generate_metric_csv(batches):
+    """
+    Convert batches of metric values (as produced by stream_metric_values)
+    to lines of csv, one at a time.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(METRIC_FIELDS)
+    for columns in batches:
+        for row in zip(*columns.values()):
+            yield writer.writerow(row)
+
+
 @main.route('/metricDataAsJson', methods=['Get', 'Post'])
 @login_required
 def metricDataAsJson(output='http'):
@@ -295,20 +427,65 @@ def metricDataAsJson(output='http'):
     this is a global flask object that is automatically created whenever a URL
     is requested. e.g.:
 
-    <url>/metricDataAsJson?studies=15&sessions=1739,1744&metrictypes=84
+    <url>/metricDataAsJson?studies=ANDT&scans=1739,1744&metrictypes=84
     creates a request object
-            request.args = {studies: 15,
-                            sessions: [1739, 1744],
+            request.args = {studies: 'ANDT',
+                            scans: [1739, 1744],
                             metrictypes: 84}
-    If byname is defined (and evaluates True) in the request.args then filters
-    can be defined by name instead of by database id e.g.
-    <url>/metricDataAsJson?byname=True&studies=ANDT&sessions=ANDT_CMH_101_01
+    Studies, sites, sessions and scantypes are always given by name. If
+    byname is defined (and evaluates True) in the request.args then scans
+    and metrictypes can be defined by name instead of by database id too e.g.
+    <url>/metricDataAsJson?byname=True&studies=ANDT&metrictypes=snr
+    Set isphantom to 'True' or 'False' to restrict the result to only
+    phantoms or only human data.
+
+    The result is returned column-wise, i.e. 'data' holds a dictionary of
+    field names each mapped to a list with one entry per metric value.
 
     Function works slightly differently if the request method is POST
     (such as that generated by metricData()). In that case the field names are
     expected to be the primary keys from the database as these are used to
     create the form.
     """
+    fields, byname = _get_metric_filters()
+    columns = get_metric_values(**_metric_search_terms(fields, byname))
+
+    if output == 'http':
+        # spit this out in a format suitable for client side processing
+        return (jsonify({'data': columns}))
+    else:
+        # return a pretty object for human readable
+        return (json.dumps(columns, indent=4, separators=(',', ': ')))
+
+
+@main.route('/metricSummary', methods=['GET'])
+@login_required
+def metricSummary():
+    """
+    Get summary statistics for QC metrics.
+
+    Accepts the same GET filters as metricDataAsJson, except for sessions and
+    scans, and returns one entry per study, site, scan type, metric type and
+    phantom status. Like metricDataAsJson the result is column-wise under
+    'data'. 'quantiles' lists the quantile levels that each entry of the
+    'quantiles' column holds values for.
+    """
+    fields, byname = _get_metric_filters()
+    if 'sessions' in fields or 'scans' in fields:
+        raise InvalidUsage("Metric summaries can't be filtered by session "
+                           "or scan")
+    columns = get_metric_summaries(**_metric_search_terms(fields, byname))
+    return jsonify({'quantiles': MetricSummary.QUANTILES, 'data': columns})
+
+
+def _get_metric_filters():
+    """
+    Read the metric filters from the current request (see metricDataAsJson
+    for the accepted format).
+
+    Returns a tuple of a dict of filter names mapped to lists of values and
+    the 'byname' switch.
+    """
     # Define the mapping from GET field names to POST field names
     # it's going to get replaced either by the requested values (if defined in
     # the request object) or by None if not set as a filter
@@ -318,7 +495,8 @@ def metricDataAsJson(output='http'):
         'sessions': 'session_id',
         'scans': 'scan_id',
         'scantypes': 'scantype_id',
-        'metrictypes': 'metrictype_id'
+        'metrictypes': 'metrictype_id',
+        'isphantom': None
     }
 
     byname = False  # switcher to allow getting values byname instead of id
@@ -334,7 +512,7 @@ def metricDataAsJson(output='http'):
     # extract the values from the request object and populate
     for k, v in fields.items():
         if request.method == 'POST':
-            fields[k] = _checkRequest(request, v)
+            fields[k] = _checkRequest(request, v) if v else None
         else:
             if request.args.get(k):
                 fields[k] = [x.strip() for x in request.args.get(k).split(',')]
@@ -344,52 +522,92 @@ def metricDataAsJson(output='http'):
     # remove None values from the dict
     fields = dict((k, v) for k, v in fields.items() if v)
 
-    # make the database query
-    if byname:
-        data = query_metric_values_byname(**fields)
-    else:
+    return fields, byname
+
+
+def _metric_search_terms(fields, byname):
+    """
+    Convert the filters read by _get_metric_filters to search terms for
+    get_metric_values. Bad input is reported here, before any streamed
+    response has started. Results are limited to the studies and sites the
+    current user can access.
+    """
+    terms = dict(fields, byname=bool(byname),
+                 user_id=current_user.access_scope_id)
+
+    if 'isphantom' in terms:
+        terms['isphantom'] = terms['isphantom'][0].lower() in ('true', '1')
+
+    if not byname:
         # convert from strings to integers
-        for k, vals in fields.items():
-            try:
-                fields[k] = int(vals)
-            except TypeError:
-                fields[k] = [int(v) for v in vals]
-
-        data = query_metric_values_byid(**fields)
-
-    # the database query returned a list of sqlachemy record objects.
-    # convert these into a standard list of dicts so we can jsonify it
-    objects = []
-
-    for metricValue in data:
-        session = [
-            session_link.session for session_link in metricValue.scan.sessions
-            if session_link.is_primary
-        ][0]
-        objects.append({
-            'value': metricValue.value,
-            'metrictype': metricValue.metrictype.name,
-            'metrictype_id': metricValue.metrictype_id,
-            'scan_id': metricValue.scan_id,
-            'scan_name': metricValue.scan.name,
-            'scan_description': metricValue.scan.description,
-            'scantype': metricValue.scan.scantype.name,
-            'scantype_id': metricValue.scan.scantype_id,
-            'session_id': session.id,
-            'session_name': session.name,
-            # 'session_date':     metricValue.scan.session.date,
-            'site_id': session.site_id,
-            'site_name': session.site.name,
-            'study_id': session.study_id,
-            'study_name': session.study.name
-        })
+        try:
+            for k in ['scans', 'metrictypes']:
+                if k in terms:
+                    terms[k] = [int(v) for v in terms[k]]
+        except ValueError:
+            raise InvalidUsage("Scans and metrictypes must be database IDs "
+                               "unless byname is set")
 
-    if output == 'http':
-        # spit this out in a format suitable for client side processing
-        return (jsonify({'data': objects}))
+    return terms
+
+
+@main.route('/metrics', methods=['POST'])
+@csrf.exempt
+def add_metrics():
+    """
+    Add or update QC metric values in bulk.
+
+    Meant for pipelines, so requests are authenticated with the header
+    'Authorization: Bearer <token>', where the token matches the
+    METRICS_API_TOKEN setting, instead of a login.
+
+    The body can be either JSON, a list of objects with the keys 'scan',
+    'metrictype' and 'value', or a csv file (Content-Type: text/csv) with the
+    header 'scan,metrictype,value'. All records are saved in one transaction,
+    so if any are rejected none are saved.
+    """
+    expected = current_app.config.get('METRICS_API_TOKEN')
+    if not expected:
+        raise InvalidUsage("Metric uploads are disabled", status_code=404)
+
+    auth = request.headers.get('Authorization', '')
+    scheme, _, token = auth.partition(' ')
+    if (scheme.lower() != 'bearer'
+            or not hmac.compare_digest(token.strip(), expected)):
+        raise InvalidUsage("Not authorised", status_code=401)
+
+    if request.mimetype == 'text/csv':
+        records = _read_metric_csv(request.get_data(as_text=True))
     else:
-        # return a pretty object for human readable
-        return (json.dumps(objects, indent=4, separators=(',', ': ')))
+        records = _read_metric_json(request.get_json(silent=True))
+
+    try:
+        count = MetricValue.bulk_upsert(records)
+    except InvalidDataException as e:
+        raise InvalidUsage(str(e))
+
+    return jsonify({'updated': count})
+
+
+def _read_metric_json(contents):
+    if not isinstance(contents, list):
+        raise InvalidUsage("Expected a JSON list of metric records")
+    try:
+        return [(item['scan'], item['metrictype'], item['value'])
+                for item in contents]
+    except (KeyError, TypeError):
+        raise InvalidUsage("Each metric record must have a 'scan', "
+                           "'metrictype' and 'value'")
+
+
+def _read_metric_csv(contents):
+    reader = csv.DictReader(io.StringIO(contents))
+    if not reader.fieldnames or not {'scan', 'metrictype', 'value'}.issubset(
+            reader.fieldnames):
+        raise InvalidUsage("csv header must include scan, metrictype and "
+                           "value")
+    return [(row['scan'], row['metrictype'], row['value'])
+            for row in reader]
 
 
 @main.route('/analysis', methods=['GET', 'POST'])
@@ -1,5 +1,12 @@
 /* Functions to implement the QC search form and display */
 
+// Number of records to request from the server at a time
+const pageSize = 500;
+
+// Incremented for each new search so that pages still arriving for an
+// older search can be ignored
+let searchId = 0;
+
 function parseValue(value) {
   /* Convert 'nulls' to empty strings and perform any other formatting needed
      for table values.
@@ -11,46 +18,70 @@ function parseValue(value) {
   return value
 }
 
+function clearRecords() {
+  /* Remove all records from the qc search results table. */
+  $("#qc-search-results-table tbody")[0].innerHTML = "";
+};
+
 function displayRecords(records) {
-  /* Update the qc search results table with the given list of records. */
+  /* Add the given list of records to the qc search results table. */
   let tableBody = $("#qc-search-results-table tbody")[0];
 
   let body = "";
   for (let i = 0; i < records.length; i += 1) {
     body += `
-      <tr>
+      <tr id="qc-record-${records[i]['id']}">
+        <td><input type="checkbox" class="qc-select" value="${records[i]['id']}"></td>
         <td>${records[i]['name']}</td>
-        <td>${parseValue(records[i]['approved'])}</td>
-        <td>${parseValue(records[i]['comment'])}</td>
+        <td class="qc-approved">${parseValue(records[i]['approved'])}</td>
+        <td class="qc-comment">${parseValue(records[i]['comment'])}</td>
       </tr>
     `
   }
 
-  tableBody.innerHTML = body;
-  delLoadingStatus();
+  tableBody.insertAdjacentHTML("beforeend", body);
 };
 
-function makeCsv() {
-  /* Construct a csv from the currently displayed search records */
-  let csv = [];
-  let rows = $("#qc-search-results-table tr");
-  for (let i = 0; i < rows.length; i += 1) {
-    let cols = rows[i].querySelectorAll('td,th');
-    let col = []
-    for (let j = 0; j < cols.length; j += 1) {
-      col.push(cols[j].innerHTML);
-    }
-    csv.push(col.join(","));
+function fetchPage(terms, cursor, id) {
+  /* Request one page of search results, then request the next one (if any)
+     once it has been displayed. */
+  let params = {limit: pageSize};
+  if (cursor) {
+    params.after_name = cursor.after_name;
+    params.after_id = cursor.after_id;
   }
-  return csv.join("\n");
+
+  $.ajax({
+    type: 'POST',
+    url: searchUrl + "?" + $.param(params),
+    data: terms,
+    success: function(response) {
+      if (id !== searchId) {
+        return;
+      }
+      displayRecords(response.records);
+      if (response.next) {
+        fetchPage(terms, response.next, id);
+      } else {
+        delLoadingStatus();
+      }
+    },
+    error: function(response) {
+      if (id === searchId) {
+        failedSearch(response);
+      }
+    }
+  });
 };
 
 function downloadCsv() {
-  /* Download the search results as a csv */
-  let downloadBtn = $("#qc-download")[0];
-  let outFile = new Blob([makeCsv()], {type: "text/csv"});
-  let url = window.URL.createObjectURL(outFile);
-  downloadBtn.href = url;
+  /* Download every record matching the current search terms as a csv.
+     The form is submitted natively (skipping the AJAX submit handler) so
+     the browser streams the file straight to disk. */
+  let form = $("#qc-search-form")[0];
+  form.action = exportUrl;
+  form.submit();
+  form.action = searchUrl;
 };
 
 function addLoadingStatus() {
@@ -77,8 +108,65 @@ function failedSearch(response) {
   delLoadingStatus();
 }
 
+function reviewSelected(approve, comment) {
+  /* Apply one QC review to every selected scan with a single request and
+     show the outcome in the results table. */
+  let scans = $(".qc-select:checked").map(function() {
+    return this.value;
+  }).get();
+  if (scans.length === 0) {
+    return;
+  }
+
+  let reviews = scans.map(function(scan) {
+    return {scan: scan, approve: approve, comment: comment};
+  });
+
+  $.ajax({
+    type: 'POST',
+    url: reviewScansUrl,
+    contentType: 'application/json',
+    dataType: 'json',
+    headers: {'X-CSRFToken': csrfToken},
+    data: JSON.stringify({reviews: reviews}),
+    success: function(response) {
+      let failed = 0;
+      for (let result of response.results) {
+        let row = $("#qc-record-" + result.scan);
+        if (!result.success) {
+          failed += 1;
+          continue;
+        }
+        row.find(".qc-approved").text(String(approve));
+        row.find(".qc-comment").text(parseValue(comment));
+        row.find(".qc-select").prop("checked", false);
+      }
+      if (failed) {
+        alert(failed + " of the selected scans could not be reviewed.");
+      }
+    },
+    error: function() {
+      alert("Failed to review scans, please contact an admin.");
+    }
+  });
+};
+
 $("#qc-download").on("click", downloadCsv);
 
+$("#qc-select-all").on("change", function() {
+  $(".qc-select").prop("checked", this.checked);
+});
+
+$(".qc-batch-btn").on("click", function() {
+  let needsComment = this.dataset.comment === "true";
+  let comment = needsComment ? $("#qc-batch-comment").val().trim() : null;
+  if (needsComment && !comment) {
+    alert("Please enter a comment.");
+    return;
+  }
+  reviewSelected(this.dataset.approve === "true", comment);
+});
+
 $("#qc-search-btn").on("click", function() {
   $("#qc-search-form").submit();
   addLoadingStatus();
@@ -97,13 +185,9 @@ $("#qc-search-form").submit(function(e) {
     }
   });
 
-  $.ajax({
-    type: 'POST',
-    url: searchUrl,
-    data: $(this).serialize(),
-    success: displayRecords,
-    error: failedSearch
-  });
+  searchId += 1;
+  clearRecords();
+  fetchPage($(this).serialize(), null, searchId);
 
 });
 
@@ -1,6 +1,10 @@
 """Provides views related to searching through and downloading QC records.
 """
-from flask import render_template, request, jsonify
+import csv
+import json
+
+from flask import (render_template, request, jsonify, Response,
+                   stream_with_context)
 from flask_login import current_user, login_required
 from sqlalchemy import or_
 
@@ -8,6 +12,10 @@ from . import checklist_bp
 from .forms import QcSearchForm, get_search_form_contents
 from ...models import ExpectedScan, StudyUser, Scantype
 from ...queries import get_scan_qc
+from ...exceptions import InvalidUsage
+
+# The largest page of QC records a client may request at once
+MAX_PAGE_SIZE = 5000
 
 
 @checklist_bp.route("/", methods=["GET"])
@@ -34,6 +42,15 @@ def qc_search():
 @login_required
 def lookup_data():
     """Use AJAX to submit search terms and get a set of QC records.
+
+    The response format depends on the query string:
+
+    * No arguments: A JSON list of every matching record.
+    * 'limit' (and optionally 'after_name' + 'after_id'): A JSON object
+      holding one page of records under 'records' and, if more remain, the
+      cursor to request the following page with under 'next'.
+    * 'format=ndjson': Every matching record streamed from the database
+      as newline delimited JSON.
     """
     form = QcSearchForm() if request.args else QcSearchForm(request.values)
 
@@ -45,11 +62,111 @@ def lookup_data():
     if not current_user.dashboard_admin:
         contents["user_id"] = current_user.id
 
+    if request.args.get("format") == "ndjson":
+        records = get_scan_qc(**contents, stream=True)
+        return Response(
+            stream_with_context(
+                json.dumps(record) + "\n" for record in records),
+            mimetype="application/x-ndjson")
+
+    if "limit" in request.args:
+        return jsonify(get_page(contents))
+
     results = get_scan_qc(**contents)
 
     return jsonify(results)
 
 
+@checklist_bp.route("/export.csv", methods=["POST"])
+@login_required
+def export_csv():
+    """Stream every QC record matching the search terms as a csv file.
+
+    Records are read from a server side cursor and written out as they
+    arrive, so the download begins immediately and memory use doesn't grow
+    with the number of records.
+    """
+    form = QcSearchForm(request.form)
+
+    if not (form.is_submitted() or form.validate()):
+        raise InvalidUsage("Invalid search terms")
+
+    contents = get_search_form_contents(form)
+
+    if not current_user.dashboard_admin:
+        contents["user_id"] = current_user.id
+
+    records = get_scan_qc(**contents, stream=True)
+
+    return Response(
+        stream_with_context(generate_csv(records)),
+        mimetype="text/csv",
+        headers={"Content-Disposition": "attachment; filename=qc.csv"})
+
+
+class _Echo:
+    """A write-only file that hands back whatever is written to it.
+    """
+    def write(self, value):
+        return value
+
+
+def generate_csv(records):
+    """Convert QC records to lines of csv, one at a time.
+
+    Args:
+        records (iterable): An iterable of QC record dictionaries, as
+            returned by get_scan_qc.
+
+    Yields:
+        str: The header line, then one line for each record.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(["scan", "approved", "comment"])
+    for record in records:
+        yield writer.writerow(
+            [record["name"], record["approved"], record["comment"]])
+
+
+def get_page(search_terms):
+    """Get one page of QC records using the cursor in the request arguments.
+
+    Args:
+        search_terms (dict): The search terms to pass to get_scan_qc.
+
+    Raises:
+        InvalidUsage: If the page size or cursor are malformed.
+
+    Returns:
+        dict: A dictionary with the keys 'records' (the list of records
+            in this page) and 'next' (a dictionary with the 'after_name'
+            and 'after_id' to request the next page with, or None if this
+            is the last page).
+    """
+    limit = request.args.get("limit", type=int)
+    if not limit or limit < 1:
+        raise InvalidUsage("Page limit must be a positive integer")
+    limit = min(limit, MAX_PAGE_SIZE)
+
+    after = None
+    if "after_name" in request.args:
+        after_id = request.args.get("after_id", type=int)
+        if after_id is None:
+            raise InvalidUsage("after_name must be accompanied by after_id")
+        after = (request.args["after_name"], after_id)
+
+    records = get_scan_qc(**search_terms, after=after, limit=limit)
+
+    next_page = None
+    if len(records) == limit:
+        next_page = {
+            "after_name": records[-1]["name"],
+            "after_id": records[-1]["id"]
+        }
+
+    return {"records": records, "next": next_page}
+
+
 def get_tags(user):
     """Get a list of scan tags that the user has access to.
 
@@ -1,10 +1,54 @@
 import os
 import json
+import threading
+import time
+
+from flask import send_file
 
 from ...datman_utils import get_study_path
 
+# How many seconds a scan's resolved nifti path is reused for. Finding it
+# means reading the study config and probing the file system.
+NIFTI_PATH_TTL = 300
+
+# How many seconds browsers may reuse a nifti before checking if it changed
+NIFTI_MAX_AGE = 3600
+
+# The most paths to cache before expired ones are cleared out
+_MAX_CACHED_PATHS = 1000
+
+_nifti_paths = {}
+_nifti_paths_lock = threading.Lock()
+
 
 def get_nifti_path(scan):
+    """Get the full path to a scan's nifti file.
+
+    Paths are cached for NIFTI_PATH_TTL seconds.
+    """
+    now = time.monotonic()
+    cached = _nifti_paths.get(scan.id)
+    if cached and cached[1] > now:
+        return cached[0]
+
+    full_path = find_nifti_path(scan)
+    with _nifti_paths_lock:
+        if len(_nifti_paths) >= _MAX_CACHED_PATHS:
+            for scan_id, (_, expires) in list(_nifti_paths.items()):
+                if expires <= now:
+                    del _nifti_paths[scan_id]
+        _nifti_paths[scan.id] = (full_path, now + NIFTI_PATH_TTL)
+    return full_path
+
+
+def forget_nifti_path(scan):
+    """Remove a scan's nifti path from the cache (e.g. if it's gone stale).
+    """
+    with _nifti_paths_lock:
+        _nifti_paths.pop(scan.id, None)
+
+
+def find_nifti_path(scan):
     study = scan.get_study().id
     nii_folder = get_study_path(study, folder='nii')
     fname = "_".join([scan.name, scan.description + ".nii.gz"])
@@ -16,6 +60,43 @@ def get_nifti_path(scan):
     return full_path
 
 
+def send_nifti(full_path, file_name):
+    """Send a nifti file so browsers can cache it and fetch parts of it.
+
+    The response has a strong ETag built from the file's identity (device,
+    inode, size and modification time) and a Last-Modified date, so repeat
+    requests get a '304 Not Modified'. Range requests are answered with only
+    the requested bytes.
+
+    Args:
+        full_path (str): The full path to the nifti file.
+        file_name (str): The file name to give the download.
+
+    Raises:
+        OSError: If the file can't be read.
+    """
+    stat = os.stat(full_path)
+    etag = "{:x}-{:x}-{:x}-{:x}".format(
+        stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    if full_path.endswith(".gz"):
+        mimetype = "application/gzip"
+    else:
+        mimetype = "application/octet-stream"
+
+    response = send_file(full_path,
+                         mimetype=mimetype,
+                         as_attachment=True,
+                         download_name=file_name,
+                         conditional=True,
+                         etag=etag,
+                         last_modified=stat.st_mtime,
+                         max_age=NIFTI_MAX_AGE)
+    # Scans should only be cached by the browser of the user who loaded them
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
+
+
 def update_json(scan, contents):
     scan.json_contents = contents
     scan.save()
@@ -1,7 +1,7 @@
 import os
 import logging
 
-from flask import render_template, flash, url_for, redirect, send_file, abort
+from flask import render_template, flash, url_for, redirect, abort
 from flask_login import current_user, login_required
 
 from . import utils
@@ -138,17 +138,19 @@ def load_scan(study_id, scan_id, file_name):
     This locates the filesystem path for a scan database record and returns
     it in a format that papaya can work with.
 
+    Responses support conditional and range requests (see
+    utils.send_nifti) so reviewers reopening a scan can use their cached
+    copy.
+
     NOTE: The file name with the correct extension must be the last part of
     the URL or papaya will trip over decompression issues.
     """
     scan = get_scan(scan_id, study_id, current_user, fail_url=prev_url())
     full_path = utils.get_nifti_path(scan)
     try:
-        result = send_file(full_path,
-                           as_attachment=True,
-                           attachment_filename=file_name,
-                           mimetype="application/gzip")
-    except IOError:
+        result = utils.send_nifti(full_path, file_name)
+    except OSError:
+        utils.forget_nifti_path(scan)
         logger.error("Couldnt find file {} to load scan view for user "
                      "{}".format(full_path, current_user))
         abort(404)
@@ -43,6 +43,31 @@ function reviewScan(scanData, success_func, error_func) {
 }
 
 
+function reviewScans(reviewData, success_func, error_func) {
+  /* Add QC reviews to several scans with a single request */
+
+  // csrfToken and reviewScansUrl must be defined by Jinja in the html template
+  $.ajaxSetup({
+      beforeSend: function(xhr, settings) {
+          if (!/^(GET|HEAD|OPTIONS|TRACE)$/i.test(settings.type) &&
+              !this.crossDomain) {
+              xhr.setRequestHeader('X-CSRFToken', csrfToken)
+          }
+      }
+  })
+
+  $.ajax({
+    type: 'POST',
+    url: reviewScansUrl,
+    contentType: 'application/json',
+    dataType: 'json',
+    data: JSON.stringify(reviewData),
+    success: success_func,
+    error: error_func,
+  });
+}
+
+
 function qcFailFunc(response) {
   /* Handles a failed QC review update */
 
@@ -230,3 +255,67 @@ $('.qc-update').off().on('click', function() {
 }
 
 );
+
+
+function batchReview(toolbar, approve, comment) {
+  /* Review every scan selected in a session's scan table, then reload the
+     page to show their new status */
+  var scans = $(toolbar).closest('.scan-table').find('.select-scan:checked')
+    .map(function() { return this.value; }).get();
+  if (scans.length === 0) {
+    return;
+  }
+
+  var reviews = scans.map(function(scan) {
+    return {scan: scan, approve: approve, comment: comment};
+  });
+
+  function successFunc(response) {
+    var failed = response['results'].filter(function(result) {
+      return !result['success'];
+    });
+    if (failed.length !== 0) {
+      alert(failed.length + ' of the selected scans could not be reviewed.');
+    }
+    location.reload();
+  }
+
+  function failFunc() {
+    alert('Update failed, please contact an admin.');
+  }
+
+  reviewScans({study: toolbar.dataset.study, reviews: reviews}, successFunc,
+              failFunc);
+}
+
+
+$('.select-all-scans').off().on('change', function() {
+  /* Select (or deselect) every scan in a session's scan table */
+  $(this).closest('.scan-table').find('.select-scan')
+    .prop('checked', this.checked);
+});
+
+
+$('.batch-approve').off().on('click', function() {
+  batchReview($(this).parent()[0], true, null);
+});
+
+
+$('.batch-flag').off().on('click', function() {
+  var toolbar = $(this).parent()[0];
+  $('#scan-comment-form').off().on('submit', function(e) {
+    e.preventDefault();
+    $('#add-review-modal').modal('hide');
+    batchReview(toolbar, true, $('#scan-comment').val());
+  });
+});
+
+
+$('.batch-blacklist').off().on('click', function() {
+  var toolbar = $(this).parent()[0];
+  $('#scan-comment-form').off().on('submit', function(e) {
+    e.preventDefault();
+    $('#add-review-modal').modal('hide');
+    batchReview(toolbar, false, $('#scan-comment').val());
+  });
+});
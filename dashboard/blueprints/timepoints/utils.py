@@ -1,24 +1,125 @@
+import hmac
+import hashlib
 import logging
+from datetime import datetime, timezone
 
 from github import Github
 
+from flask import session as flask_session
 from flask import current_app, flash
-from ...models import Study, db
+from ...exceptions import InvalidDataException
+from ...models import Study, GithubIssue, db
 
 logger = logging.getLogger(__name__)
 
+# The flask session key that remembers whether the signed in user can read
+# a private GITHUB_REPO
+ISSUE_ACCESS_KEY = 'github_issue_access'
+
+
+def sync_issues(token=None, full=False):
+    """Copy any new or updated GitHub issues to the local index.
+
+    This runs as a scheduled job (see GITHUB_SYNC_INTERVAL).
+
+    Args:
+        token (str, optional): The GitHub token to use. Defaults to the
+            GITHUB_TOKEN setting.
+        full (bool, optional): Whether to re-read every issue instead of only
+            those updated since the last sync. Defaults to False.
+
+    Returns:
+        int: The number of issues read from GitHub.
+    """
+    if not token:
+        token = current_app.config.get('GITHUB_TOKEN')
+    since = None if full else GithubIssue.last_updated()
+
+    repo = get_issues_repo(token)
+    options = {'state': 'all', 'sort': 'updated', 'direction': 'asc'}
+    if since:
+        # PyGithub sends this as if it were UTC
+        options['since'] = since.astimezone(timezone.utc)
+    issues = [
+        issue_fields(issue) for issue in repo.get_issues(**options)
+        if issue.pull_request is None
+    ]
+    GithubIssue.save(issues)
+    logger.info("Synced {} GitHub issues.".format(len(issues)))
+    return len(issues)
+
+
+def can_view_issues(token):
+    """Check whether a user may see the local copy of the GitHub issues.
+
+    The index is synced with the service's own token, so for a private
+    repository the user's token is checked for access to it instead. This
+    is only asked of GitHub once per login.
+
+    Args:
+        token (str): The user's OAuth token.
+
+    Returns:
+        bool: True if the user may see the issues.
+    """
+    if current_app.config.get('GITHUB_PUBLIC'):
+        return True
+    if ISSUE_ACCESS_KEY not in flask_session:
+        try:
+            get_issues_repo(token)
+        except Exception as e:
+            logger.debug("User can't access the GitHub issues repo. "
+                         "{}".format(e))
+            flask_session[ISSUE_ACCESS_KEY] = False
+        else:
+            flask_session[ISSUE_ACCESS_KEY] = True
+    return flask_session[ISSUE_ACCESS_KEY]
+
+
+def issue_fields(issue):
+    """Get the fields of a :obj:`github.Issue.Issue` to store locally.
+    """
+    return {field: getattr(issue, field) for field in GithubIssue.FIELDS}
+
+
+def handle_webhook(event, payload):
+    """Update the local issue index from a GitHub webhook delivery.
+
+    Args:
+        event (str): The event type, from the 'X-GitHub-Event' header.
+        payload (dict): The delivery's JSON payload.
+
+    Raises:
+        InvalidDataException: If the payload is malformed or can't be saved.
+    """
+    if event not in ['issues', 'issue_comment']:
+        return
 
-def search_issues(token, timepoint):
-    github_owner = current_app.config['GITHUB_OWNER']
-    github_repo = current_app.config['GITHUB_REPO']
-    search_string = "{} repo:{}/{}".format(
-        timepoint, github_owner, github_repo)
     try:
-        issues = Github(token).search_issues(search_string)
-    except Exception:
-        return None
-    result = sorted(issues, key=lambda x: x.created_at)
-    return result
+        issue = payload['issue']
+        if 'pull_request' in issue:
+            return
+        if payload.get('action') in ['deleted', 'transferred'] and \
+                event == 'issues':
+            GithubIssue.remove([issue['number']])
+            return
+        fields = {field: issue.get(field) for field in GithubIssue.FIELDS}
+        for date in ['created_at', 'updated_at', 'closed_at']:
+            if fields[date]:
+                fields[date] = datetime.fromisoformat(fields[date])
+    except (KeyError, TypeError, ValueError) as e:
+        raise InvalidDataException("Malformed issue event. {}".format(e))
+
+    GithubIssue.save([fields])
+
+
+def verify_webhook(body, signature):
+    """Check a webhook delivery's 'X-Hub-Signature-256' header.
+    """
+    secret = current_app.config['GITHUB_WEBHOOK_SECRET']
+    expected = 'sha256=' + hmac.new(secret.encode('utf-8'), body,
+                                    hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature or '')
 
 
 def handle_issue(token, issue_form, study_id, timepoint):
@@ -32,13 +133,20 @@ def handle_issue(token, issue_form, study_id, timepoint):
         assigned_user = None
 
     try:
-        make_issue(token, title, issue_form.body.data, assign=assigned_user)
+        issue = make_issue(token, title, issue_form.body.data,
+                           assign=assigned_user)
     except Exception as e:
         logger.error("Failed to create a GitHub issue for {}. "
                      "Reason: {}".format(timepoint, e))
         flash("Failed to create issue '{}'".format(title))
-    else:
-        flash("Issue '{}' created!".format(title))
+        return
+
+    flash("Issue '{}' created!".format(title))
+    try:
+        GithubIssue.save([issue_fields(issue)])
+    except InvalidDataException as e:
+        # It'll be picked up by the next sync instead
+        logger.error("Failed to save new issue '{}'. {}".format(title, e))
 
 
 def clean_issue_title(title, timepoint):
@@ -72,7 +180,8 @@ def get_issues_repo(token):
     owner = current_app.config['GITHUB_OWNER']
     repo = current_app.config['GITHUB_REPO']
     try:
-        repo = Github(token).get_user(owner).get_repo(repo)
+        repo = Github(token, base_url=current_app.config['GITHUB_API_URL']) \
+            .get_user(owner).get_repo(repo)
     except Exception as e:
         raise Exception("Can't retrieve github issues repo. {}".format(e))
     return repo
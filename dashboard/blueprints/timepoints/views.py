@@ -2,23 +2,30 @@ import os
 import logging
 
 from flask import session as flask_session
-from flask import (render_template, flash, url_for, redirect,
+from flask import (current_app, render_template, flash, url_for, redirect,
                    send_from_directory, jsonify, request, Response)
 from flask_login import current_user, login_required, fresh_login_required
 
+from dashboard import csrf
 from . import time_bp, ajax_bp
 from . import utils
 from .emails import incidental_finding_email
 from .forms import (EmptySessionForm, IncidentalFindingsForm,
                     TimepointCommentsForm, NewIssueForm, DataDeletionForm,
                     ScanChecklistForm)
+from ...exceptions import InvalidUsage, InvalidDataException
+from ...models import GithubIssue, Scan
 from ...utils import (report_form_errors, get_timepoint, get_session,
-                      get_scan, dashboard_admin_required,
+                      get_scan, get_scans, dashboard_admin_required,
                       study_admin_required, read_bool)
 import dashboard.datman_utils as dm_utils
+import dashboard.qc_manifests as qc_manifests
 
 logger = logging.getLogger(__name__)
 
+# The most scans that may be reviewed in one batch request
+MAX_BATCH_REVIEWS = 500
+
 
 @time_bp.route('/', methods=['GET', 'POST'])
 @fresh_login_required
@@ -28,21 +35,15 @@ def timepoint(study_id, timepoint_id):
     """
     timepoint = get_timepoint(study_id, timepoint_id, current_user)
 
-    try:
-        token = flask_session['active_token']
-    except KeyError:
-        github_issues = None
+    token = flask_session.get('active_token')
+    if token and utils.can_view_issues(token):
+        github_issues = GithubIssue.find(timepoint.name)
     else:
-        try:
-            github_issues = utils.search_issues(token, timepoint.name)
-        except Exception:
-            flash("Github issue access failed. Please contact an admin if "
-                  "this issue persists.")
-            logger.debug("Can't search github issues, user {} received "
-                         "access denied.".format(current_user))
-            github_issues = None
-
-    manifests = dm_utils.get_manifests(timepoint)
+        # Only users signed in through GitHub who can read the repo may see
+        # the issues
+        github_issues = None
+
+    manifests = qc_manifests.get_manifests(timepoint)
     empty_form = EmptySessionForm()
     findings_form = IncidentalFindingsForm()
     comments_form = TimepointCommentsForm()
@@ -71,11 +72,11 @@ def sign_off(study_id, timepoint_id, session_num):
                        study_id=study_id,
                        timepoint_id=timepoint_id)
     session = get_session(timepoint, session_num, dest_URL)
-    session.sign_off(current_user.id)
-    # This is temporary until I add some final touches to sign off process
-    for scan in session.scans:
-        if scan.is_new():
-            scan.add_checklist_entry(current_user.id, sign_off=True)
+    try:
+        session.sign_off_scans(current_user.id)
+    except InvalidDataException as e:
+        logger.error(f"Failed to sign off {session}. Reason - {e}")
+        flash("Failed to sign off session. Please try again.")
     return redirect(dest_URL)
 
 
@@ -337,3 +338,96 @@ def review_scan():
     }
 
     return jsonify(response)
+
+
+@ajax_bp.route("/review/batch", methods=["POST"])
+@login_required
+def review_scans():
+    """Add QC reviews for several scans from one AJAX request.
+
+    The body must be a JSON object with a list of 'reviews', each holding
+    the keys 'scan', 'approve' and 'comment' (as for review_scan). If a
+    'study' is given only scans from that study are accepted. Access to the
+    scans is checked all at once and every accepted review is saved in one
+    transaction.
+
+    The response holds a result for each review, in the same order, under
+    'results'.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not isinstance(body.get("reviews"),
+                                                    list):
+        raise InvalidUsage("Expected a JSON object with a list of 'reviews'")
+
+    reviews = body["reviews"]
+    if len(reviews) > MAX_BATCH_REVIEWS:
+        raise InvalidUsage(f"At most {MAX_BATCH_REVIEWS} scans may be "
+                           "reviewed at once")
+
+    try:
+        scan_ids = [int(item["scan"]) for item in reviews]
+    except (KeyError, TypeError, ValueError):
+        raise InvalidUsage("Each review must have a valid 'scan' ID")
+
+    for item in reviews:
+        if not isinstance(item.get("comment"), (str, type(None))):
+            raise InvalidUsage("Each review's 'comment' must be a string")
+
+    scans = get_scans(set(scan_ids), current_user, study_id=body.get("study"))
+
+    accepted = [
+        (scans[scan_id], item.get("comment"), read_bool(item.get("approve")))
+        for scan_id, item in zip(scan_ids, reviews)
+        if scan_id in scans
+    ]
+    try:
+        entries = iter(Scan.add_checklist_entries(accepted, current_user.id))
+    except InvalidDataException as e:
+        raise InvalidUsage(str(e))
+
+    results = []
+    for scan_id in scan_ids:
+        if scan_id not in scans:
+            results.append({
+                "scan": scan_id,
+                "success": False,
+                "error": "Scan does not exist or is not accessible."
+            })
+            continue
+        entry = next(entries)
+        results.append({
+            "scan": scan_id,
+            "success": True,
+            "user": str(entry.user),
+            "timestamp": entry.timestamp
+        })
+
+    return jsonify(results=results)
+
+
+@ajax_bp.route("/github_webhook", methods=["POST"])
+@csrf.exempt
+def github_webhook():
+    """Receive issue events from GitHub to keep the local issue index current.
+
+    The webhook should send 'Issues' and 'Issue comments' events as JSON,
+    signed with the GITHUB_WEBHOOK_SECRET setting.
+    """
+    if not current_app.config.get("GITHUB_WEBHOOK_SECRET"):
+        raise InvalidUsage("GitHub webhook is disabled", status_code=404)
+
+    if not utils.verify_webhook(request.get_data(),
+                                request.headers.get("X-Hub-Signature-256")):
+        raise InvalidUsage("Invalid signature", status_code=401)
+
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        raise InvalidUsage("Expected a JSON payload")
+
+    try:
+        utils.handle_webhook(request.headers.get("X-GitHub-Event"), payload)
+    except InvalidDataException as e:
+        logger.error("Failed to handle GitHub webhook. {}".format(e))
+        raise InvalidUsage(str(e))
+
+    return jsonify(success=True)
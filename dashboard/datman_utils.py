@@ -210,15 +210,10 @@ def get_manifests(timepoint):
             2: {nifti_3: nifti_3_manifest}
          }
     """
-    study = timepoint.get_study().id
-    config = datman.config.config(study=study)
-    try:
-        qc_dir = config.get_path("qc")
-    except UndefinedSetting:
-        logger.error("No QC path defined for study {}".format(study))
+    qc_path = get_qc_path(timepoint)
+    if not qc_path:
         return {}
 
-    qc_path = os.path.join(qc_dir, str(timepoint))
     found = {}
     for num in timepoint.sessions:
         session = timepoint.sessions[num]
@@ -229,24 +224,105 @@ def get_manifests(timepoint):
         )
 
         for manifest in manifests:
-            contents = read_json(manifest)
+            _, scan_name, contents = read_manifest(manifest)
+            found[num][scan_name] = contents
+
+    return found
+
+
+def get_qc_path(timepoint):
+    """Get the folder that holds a timepoint's QC outputs.
+
+    Args:
+        timepoint (:obj:`dashboard.models.Timepoint`): A timepoint from the
+            database.
+
+    Returns:
+        str: The full path to the timepoint's QC folder, or None if the
+            study has no QC path defined.
+    """
+    study = timepoint.get_study().id
+    config = datman.config.config(study=study)
+    try:
+        qc_dir = config.get_path("qc")
+    except UndefinedSetting:
+        logger.error("No QC path defined for study {}".format(study))
+        return None
+    return os.path.join(qc_dir, str(timepoint))
 
-            _, _, _, description = datman.scanid.parse_filename(manifest)
-            scan_name = os.path.basename(manifest).replace(
-                f"{description}.json",
-                ""
-            ).strip("_")
 
-            # Needed to ensure ordering respected
-            ordered_contents = OrderedDict(
-                sorted(contents.items(), key=lambda x: x[1].get("order", 999))
-            )
+def get_nii_path(study):
+    """Get the folder that holds a study's nifti files and JSON sidecars.
 
-            found[num][scan_name] = ordered_contents
+    Args:
+        study (:obj:`str`): A study ID.
+
+    Returns:
+        str: The full path to the study's nii folder, or None if the study
+            has no nii path defined.
+    """
+    config = datman.config.config(study=study)
+    try:
+        return config.get_path("nii")
+    except UndefinedSetting:
+        logger.error("No nii path defined for study {}".format(study))
+        return None
+
+
+def find_manifests(qc_path):
+    """Find the QC manifest files in a folder with a single listing.
 
+    Args:
+        qc_path (:obj:`str`): The full path to a timepoint's QC folder.
+
+    Returns:
+        dict: The full path to each manifest mapped to its modification
+            time (in nanoseconds).
+    """
+    found = {}
+    try:
+        with os.scandir(qc_path) as entries:
+            for entry in entries:
+                if entry.name.endswith("_manifest.json"):
+                    found[entry.path] = entry.stat().st_mtime_ns
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.error("Failed to read QC folder {}. Reason: {}".format(
+            qc_path, e))
     return found
 
 
+def read_manifest(manifest):
+    """Read a QC manifest file.
+
+    Args:
+        manifest (:obj:`str`): The full path to a manifest file.
+
+    Raises:
+        datman.scanid.ParseException: If the file name isn't a valid
+            datman style name.
+
+    Returns:
+        tuple: The session number, the name of the scan the manifest
+            belongs to and its contents, ordered by each image's 'order'
+            setting.
+    """
+    ident, _, _, description = datman.scanid.parse_filename(manifest)
+    scan_name = os.path.basename(manifest).replace(
+        f"{description}.json",
+        ""
+    ).strip("_")
+
+    contents = read_json(manifest)
+
+    # Needed to ensure ordering respected
+    ordered_contents = OrderedDict(
+        sorted(contents.items(), key=lambda x: x[1].get("order", 999))
+    )
+    return int(ident.session), scan_name, ordered_contents
+
+
 def read_json(in_file):
     """Read a json file.
 
@@ -1 +1,2 @@
 from .models import *  # NOQA
+from .utils import db_batch  # NOQA
@@ -1,17 +1,24 @@
 """Database models + relations
 """
 import os
+import re
 import datetime
 import logging
 from abc import abstractmethod
 from random import randint
+from collections import OrderedDict
+from types import MappingProxyType
 
+import numpy
 from flask import current_app
 from flask_login import UserMixin, AnonymousUserMixin
-from sqlalchemy import and_, or_, exists, func, select
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy import (and_, or_, exists, func, select, delete, insert,
+                        update, tuple_, cast, event, DDL, true)
+from sqlalchemy.dialects.postgresql import (JSONB, ARRAY, DOUBLE_PRECISION,
+                                            insert as pg_insert,
+                                            array as pg_array)
 from sqlalchemy.orm import deferred, backref
-from sqlalchemy.schema import UniqueConstraint, ForeignKeyConstraint
+from sqlalchemy.schema import UniqueConstraint, ForeignKeyConstraint, Index
 from sqlalchemy.orm.exc import FlushError
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.associationproxy import association_proxy
@@ -19,7 +26,7 @@ from psycopg2.tz import FixedOffsetTimezone
 from sqlalchemy.orm.collections import attribute_mapped_collection
 
 from datman import scanid, header_checks
-from dashboard import db, TZ_OFFSET
+from dashboard import db, TZ_OFFSET, search_index, reference_data
 from dashboard.exceptions import InvalidDataException
 from dashboard.models import utils
 from .emails import (account_request_email, account_activation_email,
@@ -35,18 +42,18 @@ class TableMixin:
     def save(self):
         db.session.add(self)
         try:
-            db.session.commit()
+            utils.commit()
         except Exception as e:
-            db.session.rollback()
+            utils.rollback(e)
             raise InvalidDataException("Failed to commit to database. Reason "
                                        "- {}".format(e))
 
     def delete(self):
         db.session.delete(self)
         try:
-            db.session.commit()
+            utils.commit()
         except Exception as e:
-            db.session.rollback()
+            utils.rollback(e)
             raise InvalidDataException("Failed to delete from database. "
                                        "Reason - {}".format(e))
 
@@ -89,6 +96,173 @@ class PermissionMixin:
     def does_qc(self, study, site=None):
         return self._get_permissions(study, site, perm='does_qc')
 
+    @property
+    def access_scope_id(self):
+        """The user ID to pass to user_access_scope() for this user.
+
+        This is None for users that can see everything.
+        """
+        return None
+
+
+class AccessMap:
+    """A user's study and site permissions, compiled for quick lookups.
+
+    Permissions are stored as a bitset for each study and site, so checks
+    don't need to walk through the user's StudyUser records. The map is
+    read-only, build a new one when the user's access changes.
+
+    Args:
+        study_users (:obj:`list`): (study, site, is_admin, primary_contact,
+            kimel_contact, study_RA, does_qc) tuples, one for each of the
+            user's StudyUser records.
+        study_sites (:obj:`list`): (study, site) tuples for every site of
+            every study.
+    """
+
+    ACCESS = 1
+    PERMISSIONS = ['is_admin', 'primary_contact', 'kimel_contact',
+                   'study_RA', 'does_qc']
+    FLAGS = {perm: 2 << num for num, perm in enumerate(PERMISSIONS)}
+
+    # Key for the permissions a user has for every site in a study
+    ALL_SITES = '*'
+
+    def __init__(self, study_users, study_sites):
+        all_sites = {}
+        for study, site in study_sites:
+            all_sites.setdefault(study, []).append(site)
+
+        granted = {}
+        for study, site, *perms in study_users:
+            bits = self.ACCESS
+            for perm, value in zip(self.PERMISSIONS, perms):
+                if value:
+                    bits |= self.FLAGS[perm]
+            key = site or self.ALL_SITES
+            study_perms = granted.setdefault(study, {})
+            study_perms[key] = study_perms.get(key, 0) | bits
+
+        studies = {}
+        for study, study_perms in granted.items():
+            every_site = study_perms.get(self.ALL_SITES, 0)
+            compiled = {self.ALL_SITES: every_site, None: 0}
+            for site in set(all_sites.get(study, [])) | set(study_perms):
+                if site == self.ALL_SITES:
+                    continue
+                compiled[site] = every_site | study_perms.get(site, 0)
+            for bits in study_perms.values():
+                compiled[None] |= bits
+            studies[study] = MappingProxyType(compiled)
+
+        self._studies = MappingProxyType(studies)
+        self.study_ids = tuple(sorted(studies))
+        self.sites = tuple(sorted({
+            site
+            for compiled in studies.values()
+            for site, bits in compiled.items()
+            if site not in (None, self.ALL_SITES) and bits
+        }))
+        self.disabled_sites = MappingProxyType({
+            study: tuple(sorted(
+                site for site in sites
+                if not self.check(study, site)))
+            for study, sites in sorted(all_sites.items())
+            if any(not self.check(study, site) for site in sites)
+        })
+
+    @classmethod
+    def compile(cls, user_id):
+        study_users = db.session.execute(
+            select(StudyUser.study_id, StudyUser.site_id, StudyUser.is_admin,
+                   StudyUser.primary_contact, StudyUser.kimel_contact,
+                   StudyUser.study_RA, StudyUser.does_qc)
+            .where(StudyUser.user_id == user_id)
+        ).all()
+        study_sites = db.session.execute(
+            select(StudySite.study_id, StudySite.site_id)).all()
+        return cls(study_users, study_sites)
+
+    def check(self, study, site=None, perm=None):
+        """Check whether the user has access (or a permission) for a study.
+
+        Args:
+            study (str): The ID for a managed study.
+            site (str, optional): The ID of a site within the study. If not
+                given, any access granted within the study counts.
+            perm (str, optional): The name of a specific user permission to
+                check. e.g. 'is_admin' or 'does_qc'
+
+        Returns:
+            bool: False if the user should be denied, True otherwise
+        """
+        try:
+            study_perms = self._studies[study]
+        except KeyError:
+            return False
+        if site:
+            bits = study_perms.get(site, study_perms[self.ALL_SITES])
+        else:
+            bits = study_perms[None]
+        return bool(bits & (self.FLAGS[perm] if perm else self.ACCESS))
+
+
+def user_access_scope(user_id, timepoint=None, study=None, site=None):
+    """Build a condition restricting a query to the data a user may see.
+
+    The condition is an EXISTS against the user's study_users records, so it
+    can be added to any select over timepoints, sessions or scans (or
+    anything else with a study and site) without duplicating rows.
+
+    Args:
+        user_id (int): The ID of the user to restrict the query for. If
+            None the query is left unrestricted (e.g. for dashboard admins).
+        timepoint (:obj:`sqlalchemy.Column`, optional): The column of the
+            outer query that holds the timepoint name (e.g. Timepoint.name,
+            Session.name or Scan.timepoint). Required unless both study and
+            site are given.
+        study (:obj:`sqlalchemy.Column`, optional): The column of the outer
+            query that holds the study ID, if it has one. Without this, a
+            row is accessible if any study its timepoint belongs to is.
+        site (:obj:`sqlalchemy.Column`, optional): The column of the outer
+            query that holds the site name, if it has one.
+
+    Returns:
+        :obj:`sqlalchemy.sql.expression.ColumnElement`: A condition to pass
+            to the query's where() method.
+    """
+    if user_id is None:
+        return true()
+
+    conditions = [StudyUser.user_id == user_id]
+    if site is None:
+        scope_timepoint = Timepoint.__table__.alias('scope_timepoint')
+        conditions.append(scope_timepoint.c.name == timepoint)
+        site = scope_timepoint.c.site
+    if study is None:
+        scope_study = study_timepoints_table.alias('scope_study')
+        conditions.extend([scope_study.c.timepoint == timepoint,
+                           StudyUser.study_id == scope_study.c.study])
+    else:
+        conditions.append(StudyUser.study_id == study)
+    conditions.append(or_(StudyUser.site_id.is_(None),
+                          StudyUser.site_id == site))
+    return exists().where(*conditions)
+
+
+# The search bar's fuzzy matching relies on trigram indexes
+event.listen(db.metadata, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+
+
+def trigram_index(table, column):
+    """Create a GIN trigram index to speed up similarity and LIKE searches.
+    """
+    return Index('{}_{}_trgm_idx'.format(table, column),
+                 column,
+                 postgresql_using='gin',
+                 postgresql_ops={column: 'gin_trgm_ops'})
+
 
 ###############################################################################
 # Association tables (i.e. basic many to many relationships)
@@ -126,6 +300,11 @@ class User(PermissionMixin, UserMixin, TableMixin, db.Model):
     dashboard_admin = db.Column('dashboard_admin', db.Boolean, default=False)
     is_active = db.Column('account_active', db.Boolean, default=False)
 
+    # Compiled from 'studies' the first time they're checked. Users are
+    # loaded once per request, so this is rebuilt for each request.
+    _access = None
+    _study_list = None
+
     studies = db.relationship(
         'StudyUser',
         back_populates='user',
@@ -216,7 +395,7 @@ class User(PermissionMixin, UserMixin, TableMixin, db.Model):
             request.save()
         except IntegrityError:
             # Account exists or request is already pending
-            db.session.rollback()
+            utils.rollback()
         else:
             utils.schedule_email(account_request_email,
                                  [str(self)])
@@ -267,12 +446,14 @@ class User(PermissionMixin, UserMixin, TableMixin, db.Model):
                 for site in study_ids[study]:
                     db.session.add(StudyUser(study, self.id, site_id=site))
         try:
-            db.session.commit()
+            utils.commit()
         except IntegrityError as e:
-            db.session.rollback()
+            utils.rollback(e)
             raise InvalidDataException("Failed to update user {}'s study "
                                        "access. Reason - {}"
                                        "".format(self.id, e._message()))
+        finally:
+            self.clear_access()
 
     def remove_studies(self, study_ids):
         """Disable study access for this user.
@@ -320,11 +501,31 @@ class User(PermissionMixin, UserMixin, TableMixin, db.Model):
                     db.session.delete(found[0])
 
         try:
-            db.session.commit()
+            utils.commit()
         except Exception as e:
             raise InvalidDataException("Failed to restrict study access for "
                                        "user {}. Reason - {}".format(
                                            self.id, e))
+        finally:
+            self.clear_access()
+
+    @property
+    def access(self):
+        """:obj:`AccessMap`: The user's compiled study permissions.
+        """
+        if self._access is None:
+            self._access = AccessMap.compile(self.id)
+        return self._access
+
+    @property
+    def access_scope_id(self):
+        return None if self.dashboard_admin else self.id
+
+    def clear_access(self):
+        """Discard cached permissions so they're rebuilt on next use.
+        """
+        self._access = None
+        self._study_list = None
 
     def get_studies(self):
         """Get a list of studies that user has even partial access to
@@ -333,14 +534,12 @@ class User(PermissionMixin, UserMixin, TableMixin, db.Model):
             list: A list of Study objects, one for each study where the user
             has at least partial (site based) access.
         """
-        if self.dashboard_admin:
-            studies = Study.query.order_by(Study.id).all()
-        else:
-            studies = sorted(
-                [su[0].study for su in self.studies.values()],
-                key=lambda x: x.id
-            )
-        return studies
+        if self._study_list is None:
+            query = Study.query.order_by(Study.id)
+            if not self.dashboard_admin:
+                query = query.filter(Study.id.in_(self.access.study_ids))
+            self._study_list = query.all()
+        return list(self._study_list)
 
     def get_sites(self):
         """Get a list of sites the user has even partial access to.
@@ -354,16 +553,8 @@ class User(PermissionMixin, UserMixin, TableMixin, db.Model):
         if self.dashboard_admin:
             sites = [item[0]
                      for item in Site.query.with_entities(Site.name).all()]
-        else:
-            sites = set()
-            for study in self.studies:
-                for study_site in self.studies[study]:
-                    if not study_site.site_id:
-                        # All sites are enabled
-                        sites = sites.union(study_site.study.sites)
-                    else:
-                        sites.add(study_site.site_id)
-        return list(sorted(sites))
+            return list(sorted(sites))
+        return list(self.access.sites)
 
     def get_disabled_sites(self):
         """Get a dict of study IDs mapped to sites this user cant access
@@ -373,24 +564,14 @@ class User(PermissionMixin, UserMixin, TableMixin, db.Model):
             that this user does not have access to. Studies where the user
             has full access will be omitted entirely.
         """
-        disabled = StudySite.query \
-            .with_entities(StudySite.study_id, StudySite.site_id) \
-            .filter(~exists().where(
-                and_(StudyUser.user_id == self.id,
-                     StudyUser.study_id == StudySite.study_id,
-                     or_(StudyUser.site_id == StudySite.site_id,
-                         StudyUser.site_id == None)))) \
-            .order_by(StudySite.study_id.asc())
-
-        found = {}
-        for study, site in disabled:
-            found.setdefault(study, []).append(site)
-        return found
+        return {study: list(sites)
+                for study, sites in self.access.disabled_sites.items()}
 
     def _get_permissions(self, study, site=None, perm=None):
         """Check if a user has general access rights or a specific permission
 
-        Checks StudyUser records for this user.
+        Checks StudyUser records for this user, via the compiled
+        :obj:`AccessMap`. A permission granted by any applicable record counts.
             - If only study is set, it will check if the user has any access
             to the study at all
             - If study and perm are set, it will check if the user
@@ -422,21 +603,7 @@ class User(PermissionMixin, UserMixin, TableMixin, db.Model):
         if site and isinstance(site, Site):
             site = site.name
 
-        try:
-            access_rights = self.studies[study]
-        except KeyError:
-            return False
-
-        if site:
-            access_rights = [su for su in access_rights
-                             if su.site_id is None or su.site_id == site]
-            if not access_rights:
-                return False
-
-        if perm:
-            return getattr(access_rights[0], perm)
-
-        return True
+        return self.access.check(study, site, perm)
 
     def __repr__(self):
         return "<User {}: {} {}>".format(self.id, self.first_name,
@@ -491,9 +658,9 @@ class AccountRequest(TableMixin, db.Model):
         try:
             self.user.is_active = True
             db.session.delete(self)
-            db.session.commit()
+            utils.commit()
         except Exception as e:
-            db.session.rollback()
+            utils.rollback(e)
             logger.error("Account activation failed for user {}. Reason: "
                          "{}".format(self.user_id, e))
             raise e
@@ -506,9 +673,9 @@ class AccountRequest(TableMixin, db.Model):
     def reject(self):
         try:
             db.session.delete(self.user)
-            db.session.commit()
+            utils.commit()
         except Exception as e:
-            db.session.rollback()
+            utils.rollback(e)
             logger.error("Account request rejection failed for user {}. "
                          "Reason: {}".format(self.user_id, e))
             raise e
@@ -604,27 +771,36 @@ class Study(TableMixin, db.Model):
         self.timepoints.append(timepoint)
         try:
             db.session.add(self)
-            db.session.commit()
+            StudyQcSummary.refresh(name=timepoint.name)
+            utils.commit()
         except FlushError:
-            db.session.rollback()
+            utils.rollback()
             raise InvalidDataException("Can't add timepoint {}. Already "
                                        "exists.".format(timepoint))
         except Exception as e:
-            db.session.rollback()
+            utils.rollback(e)
             e.message = "Failed to add timepoint {}. Reason: {}".format(
                 timepoint, e)
             raise
+        utils.after_commit(search_index.index.add_timepoint, timepoint.name,
+                           timepoint.site_id, self.id)
 
         if self.email_qc:
-            not_qcd = [t.name for t in self.timepoints.all() if not
-                       t.is_qcd()]
-            _ = [utils.schedule_email(qc_notification_email,
-                                      [str(u), u.email, self.id,
-                                       timepoint.name, not_qcd])
-                 for u in self.get_QCers()]
+            utils.after_commit(self._email_qcers, timepoint.name)
 
         return timepoint
 
+    def _email_qcers(self, timepoint_name):
+        """Tell this study's QCers that a new timepoint needs review.
+        """
+        not_qcd = [t['name'] for t in
+                   self.get_timepoint_summary()['timepoints']
+                   if not t['qc_complete']]
+        for user in self.get_QCers():
+            utils.schedule_email(qc_notification_email,
+                                 [str(user), user.email, self.id,
+                                  timepoint_name, not_qcd])
+
     def add_gold_standard(self, gs_file):
         try:
             new_gs = GoldStandard(self.id, gs_file)
@@ -633,9 +809,9 @@ class Study(TableMixin, db.Model):
                                        "readable: {}".format(gs_file))
         try:
             db.session.add(new_gs)
-            db.session.commit()
+            utils.commit()
         except IntegrityError as e:
-            db.session.rollback()
+            utils.rollback(e)
             str_err = str(e)
             if 'not present in table "expected_scans"' in str_err:
                 raise InvalidDataException(
@@ -743,9 +919,11 @@ class Study(TableMixin, db.Model):
 
         db.session.add(study_site)
         try:
-            db.session.commit()
+            if redcap is not None:
+                StudyQcSummary.refresh(study_id=self.id)
+            utils.commit()
         except Exception as e:
-            db.session.rollback()
+            utils.rollback(e)
             raise InvalidDataException(
                 "Failed to update site {} for study {}. Reason - {}".format(
                     site_id, self.id, e
@@ -805,36 +983,171 @@ class Study(TableMixin, db.Model):
 
         db.session.add(expected)
         try:
-            db.session.commit()
+            utils.commit()
         except Exception as e:
-            db.session.rollback()
+            utils.rollback(e)
             raise InvalidDataException("Failed to update expected scans for "
                                        "{}. Reason - {}".format(self.id, e))
 
     def num_timepoints(self, type=''):
+        counts = self.count_timepoints()
         if type.lower() == 'human':
-            timepoints = [
-                timepoint for timepoint in self.timepoints
-                if not timepoint.is_phantom
-            ]
-        elif type.lower() == 'phantom':
-            timepoints = [
-                timepoint for timepoint in self.timepoints
-                if timepoint.is_phantom
-            ]
-        else:
-            timepoints = self.timepoints
-        return len(timepoints)
+            return counts['human']
+        if type.lower() == 'phantom':
+            return counts['phantom']
+        return counts['human'] + counts['phantom']
 
-    def outstanding_issues(self):
-        # Get a tuple of Session.name, Session.num like from
-        # the other two queries
-        new_sessions_q = select(Session.name, Session.num).where(
-            Session.name.in_(self.get_new_sessions()))
-        new_sessions = db.session.execute(new_sessions_q).all()
+    def count_timepoints(self, user_id=None):
+        """Count the human and phantom timepoints in this study.
+
+        Args:
+            user_id (int, optional): Only count timepoints from sites this
+                user can access. Defaults to None (count everything).
+
+        Returns:
+            dict: A dictionary with the keys 'human' and 'phantom'.
+        """
+        query = select(Timepoint.is_phantom, func.count()) \
+            .join(study_timepoints_table,
+                  and_(study_timepoints_table.c.timepoint == Timepoint.name,
+                       study_timepoints_table.c.study == self.id)) \
+            .where(user_access_scope(user_id,
+                                     study=study_timepoints_table.c.study,
+                                     site=Timepoint.site_id)) \
+            .group_by(Timepoint.is_phantom)
+
+        counts = {'human': 0, 'phantom': 0}
+        for is_phantom, total in db.session.execute(query):
+            counts['phantom' if is_phantom else 'human'] = total
+        return counts
+
+    def get_timepoint_summary(self):
+        """Summarize the QC state of every timepoint in this study.
+
+        This replaces walking self.timepoints and calling Timepoint.is_qcd()
+        on each record, which loads every timepoint and session in the
+        study. Everything here comes from a single grouped query instead.
+
+        Returns:
+            dict: A dictionary with the keys 'human' and 'phantom', holding
+            the number of timepoints of each type, and 'timepoints', holding
+            a list of dictionaries (one per timepoint, ordered by name) with
+            the keys 'name', 'is_phantom' and 'qc_complete'.
+        """
+        query = self._timepoint_status_query().order_by(Timepoint.name)
+
+        summary = {'human': 0, 'phantom': 0, 'timepoints': []}
+        for name, is_phantom, is_qcd in db.session.execute(query):
+            summary['phantom' if is_phantom else 'human'] += 1
+            summary['timepoints'].append({
+                'name': name,
+                'is_phantom': is_phantom,
+                'qc_complete': is_qcd
+            })
+        return summary
+
+    def get_timepoint_page(self, start=0, length=None, search=None,
+                           sort='name', descending=False, user_id=None):
+        """Get one page of this study's timepoints and their QC status.
 
-        missing_redcap = self.get_missing_redcap()
-        missing_scans = self.get_missing_scans()
+        Paging, filtering and sorting all happen in the database so the cost
+        doesn't grow with the size of the study.
+
+        Args:
+            start (int, optional): The offset of the first record to return.
+                Defaults to 0.
+            length (int, optional): The maximum number of records to return.
+                All records are returned if not given.
+            search (str, optional): Only return timepoints whose name
+                contains this string (case insensitive).
+            sort (str, optional): The field to sort by. One of 'name',
+                'qc_complete' or 'is_phantom'. Defaults to 'name'.
+            descending (bool, optional): Whether to reverse the sort order.
+                Defaults to False.
+            user_id (int, optional): Only include timepoints from sites this
+                user can access. Defaults to None (include everything).
+
+        Raises:
+            InvalidDataException: If an unknown sort field is given.
+
+        Returns:
+            dict: A dictionary with the keys 'total' (the number of
+            timepoints in the study), 'filtered' (the number that match the
+            search) and 'timepoints' (a list of dictionaries in the same
+            format as get_timepoint_summary).
+        """
+        status = self._timepoint_status_query().where(
+            user_access_scope(user_id,
+                              study=study_timepoints_table.c.study,
+                              site=Timepoint.site_id))
+        if search:
+            status = status.where(
+                Timepoint.name.icontains(search.strip(), autoescape=True))
+        status = status.subquery()
+
+        try:
+            sort_col = status.c[sort]
+        except KeyError:
+            raise InvalidDataException(
+                "Can't sort timepoints by {}".format(sort))
+        sort_col = sort_col.desc() if descending else sort_col.asc()
+
+        query = select(status, func.count().over()) \
+            .order_by(sort_col, status.c.name) \
+            .offset(start)
+        if length:
+            query = query.limit(length)
+
+        page = {
+            'total': sum(self.count_timepoints(user_id).values()),
+            'filtered': 0,
+            'timepoints': []
+        }
+        for name, is_phantom, is_qcd, filtered in db.session.execute(query):
+            page['filtered'] = filtered
+            page['timepoints'].append({
+                'name': name,
+                'is_phantom': is_phantom,
+                'qc_complete': is_qcd
+            })
+
+        if not page['timepoints'] and start:
+            # Past the last page, so the window count isn't available
+            page['filtered'] = db.session.execute(
+                select(func.count()).select_from(status)).scalar()
+        return page
+
+    def _timepoint_status_query(self):
+        """Build a query for each timepoint's name, phantom and QC status.
+
+        A timepoint is considered QC complete if it's a phantom or if every
+        one of its sessions has been signed off (matching Timepoint.is_qcd).
+        """
+        # Timepoints with no sessions count as complete, like all([])
+        signed_off = func.bool_and(func.coalesce(Session.signed_off, False)) \
+            .filter(Session.name.isnot(None))
+        qc_complete = or_(Timepoint.is_phantom,
+                          func.coalesce(signed_off, True))
+        return select(Timepoint.name,
+                      Timepoint.is_phantom,
+                      qc_complete.label('qc_complete')) \
+            .join(study_timepoints_table,
+                  and_(study_timepoints_table.c.timepoint == Timepoint.name,
+                       study_timepoints_table.c.study == self.id)) \
+            .outerjoin(Session, Session.name == Timepoint.name) \
+            .group_by(Timepoint.name, Timepoint.is_phantom)
+
+    def outstanding_issues(self):
+        # Read from the precomputed summary table, the live queries
+        # (get_new_sessions, etc.) are too slow to run on every page view
+        summary = select(StudyQcSummary.name,
+                         StudyQcSummary.is_new,
+                         StudyQcSummary.missing_scans,
+                         StudyQcSummary.missing_redcap) \
+            .where(StudyQcSummary.study_id == self.id) \
+            .where(or_(StudyQcSummary.is_new,
+                       StudyQcSummary.missing_scans,
+                       StudyQcSummary.missing_redcap))
 
         new_label = '<td class="col-xs-2"><span class="fa-layers fa-fw" ' + \
                     'style="font-size: 28px;"><i class="fas ' + \
@@ -855,12 +1168,15 @@ class Study(TableMixin, db.Model):
         # Using default_row[:] in setdefault() to make sure each row has its
         # own copy of the default row
         default_row = ['<td></td>'] * 4
-        for session in new_sessions:
-            issues.setdefault(session[0], default_row[:])[0] = new_label
-        for session in missing_scans:
-            issues.setdefault(session[0], default_row[:])[2] = scans_label
-        for session in missing_redcap:
-            issues.setdefault(session[0], default_row[:])[3] = redcap_label
+        for name, is_new, missing_scans, missing_redcap in \
+                db.session.execute(summary):
+            row = issues.setdefault(name, default_row[:])
+            if is_new:
+                row[0] = new_label
+            if missing_scans:
+                row[2] = scans_label
+            if missing_redcap:
+                row[3] = redcap_label
 
         return issues
 
@@ -959,14 +1275,14 @@ class Study(TableMixin, db.Model):
             site (str): The name of a site for this study.
             pha (bool, optional): Whether to look up the number expected
                 for phantoms.
+
+        Raises:
+            KeyError: If no scans are expected for the site.
         """
+        expected = reference_data.get().expected_scans[(self.id, site)]
         if not pha:
-            return {
-                item.scantype_id: item.count for item in self.scantypes[site]
-            }
-        return {
-            item.scantype_id: item.pha_count for item in self.scantypes[site]
-        }
+            return {tag: item.count for tag, item in expected.items()}
+        return {tag: item.pha_count for tag, item in expected.items()}
 
     def _get_checklist(self):
         query = db.session.query(ScanChecklist) \
@@ -1105,6 +1421,8 @@ class Timepoint(TableMixin, db.Model):
                            nullable=False,
                            default=False)
 
+    __table_args__ = (trigram_index('timepoints', 'name'),)
+
     site = db.relationship('Site', uselist=False, back_populates='timepoints')
     studies = db.relationship(
         'Study',
@@ -1170,12 +1488,14 @@ class Timepoint(TableMixin, db.Model):
         self.sessions[num] = session
         try:
             db.session.add(self)
-            db.session.commit()
+            StudyQcSummary.refresh(name=self.name, num=num)
+            utils.commit()
         except Exception as e:
-            db.session.rollback()
+            utils.rollback(e)
             e.message = "Failed to add session {} to timepoint {}. Reason: " \
                         "{}".format(num, self.name, e)
             raise
+        utils.after_commit(search_index.index.add_session, self.name, num)
         return session
 
     def get_blacklist_entries(self):
@@ -1256,12 +1576,14 @@ class Timepoint(TableMixin, db.Model):
             return
         session_redcap = SessionRedcap(self.name, session_num)
         db.session.add(session_redcap)
-        db.session.commit()
+        StudyQcSummary.refresh(name=self.name, num=session_num)
+        utils.commit()
 
     def ignore_missing_scans(self, session_num, user_id, comment):
         empty_session = EmptySession(self.name, session_num, user_id, comment)
         db.session.add(empty_session)
-        db.session.commit()
+        StudyQcSummary.refresh(name=self.name, num=session_num)
+        utils.commit()
 
     def delete(self):
         """
@@ -1271,12 +1593,12 @@ class Timepoint(TableMixin, db.Model):
         for num in self.sessions:
             self.sessions[num].delete()
         db.session.delete(self)
-        db.session.commit()
+        utils.commit()
 
     def report_incidental_finding(self, user_id, comment):
         new_finding = IncidentalFinding(user_id, self.name, comment)
         db.session.add(new_finding)
-        db.session.commit()
+        utils.commit()
 
     def update_comment(self, user_id, comment_id, new_text):
         comment = self.get_comment(comment_id)
@@ -1287,12 +1609,12 @@ class Timepoint(TableMixin, db.Model):
     def add_comment(self, user_id, text):
         new_comment = TimepointComment(self.name, user_id, text)
         db.session.add(new_comment)
-        db.session.commit()
+        utils.commit()
 
     def delete_comment(self, comment_id):
         comment = self.get_comment(comment_id)
         db.session.delete(comment)
-        db.session.commit()
+        utils.commit()
 
     def get_comment(self, comment_id):
         match = [
@@ -1345,7 +1667,7 @@ class TimepointComment(db.Model):
         self.comment = new_text
         self.modified = True
         db.session.add(self)
-        db.session.commit()
+        utils.commit()
 
     @property
     def timestamp(self):
@@ -1390,6 +1712,8 @@ class Session(TableMixin, db.Model):
                                     cascade='all, delete')
     task_files = db.relationship('TaskFile', cascade='all, delete')
 
+    __table_args__ = (trigram_index('sessions', 'name'),)
+
     def __init__(self,
                  name,
                  num,
@@ -1417,25 +1741,21 @@ class Session(TableMixin, db.Model):
         self.scans.append(scan)
         try:
             db.session.add(self)
-            db.session.commit()
+            StudyQcSummary.refresh(name=self.name, num=self.num)
+            utils.commit()
         except Exception as e:
-            db.session.rollback()
+            utils.rollback(e)
             raise InvalidDataException("Failed to add scan {}. Reason: "
                                        "{}".format(name, e))
+        utils.after_commit(search_index.index.add_scan, scan.id, scan.name,
+                           self.name, self.num)
         return scan
 
     def delete_scan(self, name):
         match = [scan for scan in self.scans if scan.name == name]
         if not match:
             return
-        try:
-            db.session.delete(match[0])
-            db.session.commit()
-        except Exception as e:
-            db.session.rollback()
-            e.message = "Could not delete scan {}. Reason: {}".format(
-                name, e.message)
-            raise e
+        match[0].delete()
 
     def add_redcap(self, record_num, date, project=None, url=None,
                    instrument=None, config=None, rc_user=None, comment=None,
@@ -1477,15 +1797,16 @@ class Session(TableMixin, db.Model):
             rc_record.event_id = event_id
 
         try:
+            StudyQcSummary.refresh(name=self.name, num=self.num)
             self.save()
         except IntegrityError as e:
             logger.error("Can't update redcap record {}. Reason: {}".format(
                 rc_record.id, e))
-            db.session.rollback()
+            utils.rollback(e)
         except Exception as e:
             logger.error("Unable to save redcap record {} for {} to database. "
                          "Reason: {}".format(rc_record.record, self, e))
-            db.session.rollback()
+            utils.rollback(e)
         return rc_record
 
     def is_qcd(self):
@@ -1504,7 +1825,81 @@ class Session(TableMixin, db.Model):
         self.review_date = datetime.datetime.now(
             FixedOffsetTimezone(offset=TZ_OFFSET))
         db.session.add(self)
-        db.session.commit()
+        StudyQcSummary.refresh(name=self.name, num=self.num)
+        utils.commit()
+
+    def sign_off_scans(self, user_id):
+        """Sign off this session and approve each of its unreviewed scans.
+
+        The session sign off and every checklist entry are written in one
+        transaction, and if XNAT is enabled the whole experiment is updated
+        with a single XNAT connection once they've been committed.
+
+        Args:
+            user_id (int): The ID of the user signing off the session.
+
+        Raises:
+            InvalidDataException: If the changes can't be saved.
+
+        Returns:
+            list: The :obj:`Scan` records that were approved.
+        """
+        new_scans = [scan for scan in self.scans if scan.is_new()]
+        now = datetime.datetime.now(FixedOffsetTimezone(offset=TZ_OFFSET))
+        # Links share the checklist entry of their source scan
+        reviewed = {scan.source_data if scan.is_linked() else scan
+                    for scan in new_scans}
+
+        self.signed_off = True
+        self.reviewer_id = user_id
+        self.review_date = now
+        try:
+            db.session.add(self)
+            if reviewed:
+                checklist = ScanChecklist.__table__
+                query = pg_insert(checklist).values([
+                    {'scan_id': scan.id, 'user_id': user_id,
+                     'review_timestamp': now, 'signed_off': True}
+                    for scan in reviewed
+                ])
+                # Don't overwrite a review that was added in the meantime
+                db.session.execute(query.on_conflict_do_update(
+                    index_elements=['scan_id'],
+                    set_={
+                        'user_id': query.excluded.user_id,
+                        'review_timestamp': query.excluded.review_timestamp,
+                        'signed_off': True
+                    },
+                    where=and_(
+                        checklist.c.signed_off.is_(False),
+                        or_(checklist.c.comment.is_(None),
+                            checklist.c.comment == '')
+                    )))
+                MetricSummary.refresh(
+                    scan_ids={scan.id for scan in reviewed})
+            # Linked scans are reviewed through sources in other sessions
+            sessions = {(self.name, self.num)} | {
+                (scan.timepoint, scan.repeat) for scan in reviewed}
+            for name, num in sessions:
+                StudyQcSummary.refresh(name=name, num=num)
+            utils.commit()
+        except Exception as e:
+            utils.rollback(e)
+            raise InvalidDataException("Failed to sign off session {}. "
+                                       "Reason - {}".format(self, e))
+
+        if utils.get_batch() is not None:
+            # Nothing has been committed (and so expired) yet, so make sure
+            # the checklist entries are re-read
+            for scan in reviewed:
+                if scan.qc_review is not None:
+                    db.session.expire(scan.qc_review)
+                db.session.expire(scan, ['qc_review'])
+
+        if current_app.config.get('XNAT_ENABLED'):
+            utils.after_commit(utils.update_xnat_session_usability, self,
+                               new_scans, current_app.config)
+        return new_scans
 
     def is_new(self):
         return ((self.scans is None and self.missing_scans())
@@ -1535,7 +1930,7 @@ class Session(TableMixin, db.Model):
             # and you end up with orphaned records
             db.session.delete(self.redcap_record.record)
         db.session.delete(self)
-        db.session.commit()
+        utils.commit()
 
     def add_task(self, file_path, name=None):
         for item in self.task_files:
@@ -1548,7 +1943,7 @@ class Session(TableMixin, db.Model):
         except Exception as e:
             logger.error("Unable to add task file {}. Reason: {}".format(
                 file_path, e))
-            db.session.rollback()
+            utils.rollback(e)
             return None
         return new_task
 
@@ -1640,7 +2035,9 @@ class SessionRedcap(db.Model):
                                                      self.record_id)
         db.session.add(target_session)
         try:
-            db.session.commit()
+            StudyQcSummary.refresh(name=target_session.name,
+                                   num=target_session.num)
+            utils.commit()
         except Exception:
             raise InvalidDataException("Failed to share redcap record {} with "
                                        "session {}".format(
@@ -1653,9 +2050,178 @@ class SessionRedcap(db.Model):
             self.name, self.num, self.record_id)
 
 
+class StudyQcSummary(db.Model):
+    """Holds the outstanding QC issues for every session in a study.
+
+    The flags here are a denormalized copy of what Study.get_new_sessions,
+    Study.get_missing_scans and Study.get_missing_redcap report. They're
+    updated by the model methods that can change a session's QC state so
+    the study page can find outstanding issues with a single lookup. Use
+    bin/rebuild_qc_summary.py to backfill or verify the table.
+    """
+    __tablename__ = 'study_qc_summary'
+
+    study_id = db.Column('study', db.String(32), primary_key=True)
+    name = db.Column('name', db.String(64), primary_key=True)
+    num = db.Column('num', db.Integer, primary_key=True)
+    is_new = db.Column('is_new', db.Boolean, nullable=False, default=False)
+    missing_scans = db.Column('missing_scans',
+                              db.Boolean,
+                              nullable=False,
+                              default=False)
+    missing_redcap = db.Column('missing_redcap',
+                               db.Boolean,
+                               nullable=False,
+                               default=False)
+
+    __table_args__ = (
+        ForeignKeyConstraint(['study'], ['studies.id'], ondelete='CASCADE'),
+        ForeignKeyConstraint(['name', 'num'],
+                             ['sessions.name', 'sessions.num'],
+                             ondelete='CASCADE'),
+    )
+
+    @staticmethod
+    def _calculate(study_id=None, name=None, num=None):
+        """Build a query that computes summary rows from the source tables.
+        """
+        has_scans = exists().where(
+            and_(Scan.timepoint == Session.name, Scan.repeat == Session.num))
+        ignored = exists().where(
+            and_(EmptySession.name == Session.name,
+                 EmptySession.num == Session.num))
+        uses_redcap = StudySite.uses_redcap.is_(True)
+
+        query = select(
+            study_timepoints_table.c.study,
+            Session.name,
+            Session.num,
+            Session.signed_off.is_(False),
+            and_(uses_redcap, SessionRedcap.record_id.isnot(None),
+                 ~has_scans, ~ignored),
+            and_(uses_redcap, SessionRedcap.name.is_(None))
+        ).select_from(Session) \
+            .join(Timepoint, Timepoint.name == Session.name) \
+            .join(study_timepoints_table,
+                  study_timepoints_table.c.timepoint == Timepoint.name) \
+            .outerjoin(StudySite,
+                       and_(StudySite.study_id ==
+                            study_timepoints_table.c.study,
+                            StudySite.site_id == Timepoint.site_id)) \
+            .outerjoin(SessionRedcap,
+                       and_(SessionRedcap.name == Session.name,
+                            SessionRedcap.num == Session.num)) \
+            .where(Timepoint.is_phantom == False)
+
+        if study_id:
+            query = query.where(study_timepoints_table.c.study == study_id)
+        if name:
+            query = query.where(Session.name == name)
+        if num is not None:
+            query = query.where(Session.num == num)
+        return query
+
+    @classmethod
+    def refresh(cls, study_id=None, name=None, num=None):
+        """Recalculate summary rows within the current transaction.
+
+        Pending changes are flushed first so the new rows reflect them. The
+        caller is responsible for committing.
+
+        Args:
+            study_id (str, optional): Restrict the update to one study.
+            name (str, optional): Restrict the update to sessions of one
+                timepoint.
+            num (int, optional): Restrict the update to one session number.
+                Only meaningful when 'name' is also given.
+        """
+        db.session.flush()
+
+        remove = delete(cls.__table__)
+        if study_id:
+            remove = remove.where(cls.study_id == study_id)
+        if name:
+            remove = remove.where(cls.name == name)
+        if num is not None:
+            remove = remove.where(cls.num == num)
+        db.session.execute(remove)
+
+        db.session.execute(
+            insert(cls.__table__).from_select(
+                ['study', 'name', 'num', 'is_new', 'missing_scans',
+                 'missing_redcap'],
+                cls._calculate(study_id=study_id, name=name, num=num)
+            )
+        )
+
+    @classmethod
+    def rebuild(cls, study_id=None):
+        """Regenerate the summary for one study (or every study) and commit.
+        """
+        try:
+            cls.refresh(study_id=study_id)
+            utils.commit()
+        except Exception as e:
+            utils.rollback(e)
+            raise InvalidDataException("Failed to rebuild QC summary for {}. "
+                                       "Reason - {}".format(
+                                           study_id or "all studies", e))
+
+    @classmethod
+    def find_inconsistencies(cls, study):
+        """Compare the stored summary for a study to the live queries.
+
+        Args:
+            study (:obj:`Study`): The study to check.
+
+        Returns:
+            dict: A dictionary mapping each out of date flag ('is_new',
+            'missing_scans', 'missing_redcap') to a dictionary with the keys
+            'unreported' (sessions the live queries find but the summary
+            doesn't) and 'stale' (sessions the summary reports that the live
+            queries don't). Empty if the summary is consistent. Sessions are
+            (name, num) tuples, except for 'is_new' which is tracked by
+            name only.
+        """
+        rows = db.session.execute(
+            select(cls.name, cls.num, cls.is_new, cls.missing_scans,
+                   cls.missing_redcap).where(cls.study_id == study.id)
+        ).all()
+
+        expected = {
+            'is_new': {item[0] for item in study.get_new_sessions()},
+            'missing_scans': {tuple(item)
+                              for item in study.get_missing_scans()},
+            'missing_redcap': {tuple(item)
+                               for item in study.get_missing_redcap()}
+        }
+        found = {
+            'is_new': {row.name for row in rows if row.is_new},
+            'missing_scans': {(row.name, row.num) for row in rows
+                              if row.missing_scans},
+            'missing_redcap': {(row.name, row.num) for row in rows
+                               if row.missing_redcap}
+        }
+
+        problems = {}
+        for flag in expected:
+            unreported = expected[flag] - found[flag]
+            stale = found[flag] - expected[flag]
+            if unreported or stale:
+                problems[flag] = {'unreported': sorted(unreported),
+                                  'stale': sorted(stale)}
+        return problems
+
+    def __repr__(self):
+        return "<StudyQcSummary {} - {}, {}>".format(
+            self.study_id, self.name, self.num)
+
+
 class Scan(TableMixin, db.Model):
     __tablename__ = 'scans'
 
+    JSON_BATCH_SIZE = 500
+
     id = db.Column('id', db.Integer, primary_key=True)
     name = db.Column('name', db.String(128), nullable=False)
     bids_name = db.Column('bids_name', db.Text)
@@ -1703,7 +2269,9 @@ class Scan(TableMixin, db.Model):
 
     __table_args__ = (ForeignKeyConstraint(['timepoint', 'session'],
                                            ['sessions.name', 'sessions.num']),
-                      UniqueConstraint(name))
+                      UniqueConstraint(name),
+                      trigram_index('scans', 'name'),
+                      trigram_index('scans', 'bids_name'))
 
     def __init__(self,
                  name,
@@ -1725,12 +2293,30 @@ class Scan(TableMixin, db.Model):
         self.bids_name = name
         try:
             db.session.add(self)
-            db.session.commit()
+            utils.commit()
         except Exception as e:
-            db.session.rollback()
+            utils.rollback(e)
             raise InvalidDataException("Failed to add bids name {} to scan "
                                        "{}. Reason: {}".format(
                                            name, self.id, e))
+        utils.after_commit(search_index.index.add_scan, self.id, name,
+                           self.timepoint, self.repeat)
+
+    def delete(self):
+        # Links to this scan are deleted along with it
+        scans = [self] + list(self.links)
+        db.session.delete(self)
+        try:
+            # This must find the scans' values before the delete is flushed
+            MetricSummary.refresh(scan_ids=[scan.id for scan in scans])
+            for name, num in {(scan.timepoint, scan.repeat)
+                              for scan in scans}:
+                StudyQcSummary.refresh(name=name, num=num)
+            utils.commit()
+        except Exception as e:
+            utils.rollback(e)
+            raise InvalidDataException("Failed to delete scan {}. Reason - "
+                                       "{}".format(self, e))
 
     def get_study(self, study_id=None):
         return self.session.get_study(study_id=study_id)
@@ -1754,9 +2340,70 @@ class Scan(TableMixin, db.Model):
         checklist.update_entry(signing_user, comment, sign_off)
         checklist.save()
         if current_app.config.get('XNAT_ENABLED'):
-            utils.update_xnat_usability(self, current_app.config)
+            utils.after_commit(utils.update_xnat_usability, self,
+                               current_app.config)
         return checklist
 
+    @classmethod
+    def add_checklist_entries(cls, reviews, signing_user):
+        """Add (or update) the QC reviews of many scans at once.
+
+        All of the reviews are saved in one transaction and the QC summaries
+        are refreshed once per session. If XNAT is enabled, each session's
+        experiment gets a single update once the reviews are committed.
+
+        Args:
+            reviews (:obj:`list`): A tuple of (scan, comment, sign_off) for
+                each scan to review. comment and sign_off may be None to
+                leave them unchanged, as for :obj:`add_checklist_entry`.
+            signing_user (int): The ID of the reviewer.
+
+        Raises:
+            InvalidDataException: If the reviews can't be saved. None of them
+                will have been saved.
+
+        Returns:
+            list: The :obj:`ScanChecklist` entry for each review, in the
+                same order.
+        """
+        # Links share the checklist entry of their source scan, and a scan
+        # may be reviewed more than once, so each entry is only created once
+        targets = {}
+        entries = []
+        for scan, comment, sign_off in reviews:
+            target = scan.source_id or scan.id
+            checklist = targets.get(target) or scan.get_checklist_entry()
+            if not checklist:
+                checklist = scan._new_checklist_entry(signing_user)
+            checklist.update_entry(signing_user, comment, sign_off)
+            db.session.add(checklist)
+            targets[target] = checklist
+            entries.append(checklist)
+
+        reviewed = {scan.source_data if scan.is_linked() else scan
+                    for scan, _, _ in reviews}
+        try:
+            db.session.flush()
+            for name, num in {(scan.timepoint, scan.repeat)
+                              for scan in reviewed}:
+                StudyQcSummary.refresh(name=name, num=num)
+            MetricSummary.refresh(scan_ids={scan.id for scan in reviewed})
+            utils.commit()
+        except Exception as e:
+            utils.rollback(e)
+            raise InvalidDataException("Failed to save QC reviews. Reason - "
+                                       "{}".format(e))
+
+        if current_app.config.get('XNAT_ENABLED'):
+            sessions = {}
+            for scan, _, _ in reviews:
+                sessions.setdefault(scan.session, {})[scan.id] = scan
+            for session, scans in sessions.items():
+                utils.after_commit(utils.update_xnat_session_usability,
+                                   session, list(scans.values()),
+                                   current_app.config)
+        return entries
+
     def is_linked(self):
         return self.source_id is not None
 
@@ -1855,9 +2502,9 @@ class Scan(TableMixin, db.Model):
                 scan_version=utils.get_software_version(self.json_contents))
         try:
             db.session.add(new_diffs)
-            db.session.commit()
+            utils.commit()
         except Exception as e:
-            db.session.rollback()
+            utils.rollback(e)
             raise InvalidDataException("Failed to update header diffs for {}. "
                                        "Reason: {}".format(self, e))
         return new_diffs
@@ -1890,13 +2537,64 @@ class Scan(TableMixin, db.Model):
             self.json_created = utils.file_timestamp(json_file)
 
         try:
-            db.session.commit()
+            utils.commit()
         except Exception as e:
-            db.session.rollback()
+            utils.rollback(e)
             raise InvalidDataException("Failed to update scan {} json "
                                        "contents from file {}. Reason: "
                                        "{}".format(self, json_file, e))
 
+    @classmethod
+    def get_json_info(cls, study_id):
+        """Get the JSON sidecar details recorded for every scan in a study.
+
+        Args:
+            study_id (str): A study ID.
+
+        Returns:
+            dict: Each scan's name mapped to a tuple of its ID, json_path
+                and json_created.
+        """
+        query = select(cls.name, cls.id, cls.json_path, cls.json_created) \
+            .join(study_timepoints_table,
+                  and_(study_timepoints_table.c.timepoint == cls.timepoint,
+                       study_timepoints_table.c.study == study_id))
+        return {name: (scan_id, path, created)
+                for name, scan_id, path, created in db.session.execute(query)}
+
+    @classmethod
+    def bulk_add_json(cls, records, batch_size=None):
+        """Update the JSON sidecar contents of many scans at once.
+
+        Scans are updated by primary key in batches, with a commit after
+        each batch.
+
+        Args:
+            records (list): A list of dictionaries, each with the keys 'id',
+                'json_path', 'json_contents' and 'json_created'.
+            batch_size (int, optional): The number of scans to update per
+                transaction. Defaults to JSON_BATCH_SIZE.
+
+        Raises:
+            InvalidDataException: If a batch can't be committed. Earlier
+                batches will already have been saved.
+
+        Returns:
+            int: The number of scans updated.
+        """
+        batch_size = batch_size or cls.JSON_BATCH_SIZE
+        for start in range(0, len(records), batch_size):
+            batch = records[start:start + batch_size]
+            try:
+                db.session.execute(update(cls), batch)
+                utils.commit()
+            except Exception as e:
+                utils.rollback(e)
+                raise InvalidDataException(
+                    "Failed to update scan json contents. Reason - "
+                    "{}".format(e))
+        return len(records)
+
     def add_error(self, error_message):
         if isinstance(error_message, list):
             error_message = "\n".join(error_message)
@@ -1904,7 +2602,7 @@ class Scan(TableMixin, db.Model):
         try:
             self.save()
         except Exception as e:
-            db.session.rollback()
+            utils.rollback(e)
             raise InvalidDataException("Failed to add conversion error "
                                        "message for {}. Reason: {}".format(
                                            self, e))
@@ -1963,6 +2661,32 @@ class ScanChecklist(TableMixin, db.Model):
     def timestamp(self):
         return self._timestamp.strftime('%I:%M %p, %Y-%m-%d')
 
+    def save(self):
+        db.session.add(self)
+        try:
+            scan = db.session.get(Scan, self.scan_id)
+            StudyQcSummary.refresh(name=scan.timepoint, num=scan.repeat)
+            MetricSummary.refresh(scan_ids=[self.scan_id])
+        except Exception as e:
+            utils.rollback(e)
+            raise InvalidDataException("Failed to update QC summary for "
+                                       "scan {}. Reason - {}".format(
+                                           self.scan_id, e))
+        super().save()
+
+    def delete(self):
+        scan = self.scan
+        db.session.delete(self)
+        try:
+            StudyQcSummary.refresh(name=scan.timepoint, num=scan.repeat)
+            MetricSummary.refresh(scan_ids=[scan.id])
+            utils.commit()
+        except Exception as e:
+            utils.rollback(e)
+            raise InvalidDataException("Failed to delete QC review for scan "
+                                       "{}. Reason - {}".format(
+                                           self.scan_id, e))
+
     def update_entry(self, user_id, comment=None, status=None):
         if status is not None:
             self.approved = status
@@ -2208,11 +2932,10 @@ class RedcapConfig(TableMixin, db.Model):
             found = db.session.get(RedcapConfig, config_id)
             cfg = [found] if found else []
         elif project and url and instrument:
-            cfg = RedcapConfig.query \
-                .filter(RedcapConfig.project == project) \
-                .filter(RedcapConfig.url == url) \
-                .filter(RedcapConfig.instrument == instrument) \
-                .all()
+            config_ids = reference_data.get().find_redcap_configs(
+                project, url, instrument)
+            cfg = [db.session.get(RedcapConfig, item) for item in config_ids]
+            cfg = [item for item in cfg if item]
         else:
             cfg = []
 
@@ -2263,6 +2986,8 @@ class Metrictype(db.Model):
     scantype = db.relationship('Scantype', back_populates='metrictypes')
     metric_values = db.relationship('MetricValue')
 
+    __table_args__ = (UniqueConstraint(name, scantype_id),)
+
     def __repr__(self):
         return ('<MetricType {}>'.format(self.name))
 
@@ -2616,10 +3341,24 @@ class MetricValue(db.Model):
                               db.ForeignKey('metrictypes.id'),
                               nullable=False)
     _value = db.Column('value', db.Text)
+    # A typed copy of _value for numeric metrics. Null for values that
+    # aren't numeric and for rows that haven't been backfilled yet
+    numbers = db.Column('numbers', ARRAY(DOUBLE_PRECISION))
 
     scan = db.relationship('Scan', back_populates="metric_values")
     metrictype = db.relationship('Metrictype', back_populates="metric_values")
 
+    __table_args__ = (UniqueConstraint(scan_id, metrictype_id),)
+
+    # The number of rows to send to the database per INSERT in bulk_upsert
+    UPSERT_BATCH_SIZE = 5000
+
+    # Matches the stored strings that Postgres can cast to double precision[]
+    # once split on '::'. Used by backfill()
+    _NUMBER_PATTERN = (r'\s*[-+]?([0-9]+\.?[0-9]*|\.[0-9]+)'
+                       r'([eE][-+]?[0-9]+)?\s*')
+    NUMERIC_PATTERN = '^{0}(::{0})*$'.format(_NUMBER_PATTERN)
+
     @property
     def value(self):
         """Returns the value field from the database.
@@ -2628,23 +3367,16 @@ class MetricValue(db.Model):
         otherwise it will attempt to cast to Float.
         Failing that the value is returned as a string.
         """
-        if self._value is None:
-            return
-        value = self._value.split('::')
-        try:
-            value = [float(v) for v in value]
-        except ValueError:
-            return ''.join(value)
-        if len(value) == 1:
-            return value[0]
-        else:
-            return value
+        if self.numbers is not None:
+            return self._from_numbers(self.numbers)
+        return self.decode(self._value)
 
     @value.setter
     def value(self, value, delimiter=None):
         """Stores the value in the database as a string.
         If the delimiter is specified any characters matching delimiter are
-        replaced with '::' for storage.
+        replaced with '::' for storage. Numeric values are also stored in
+        the typed 'numbers' column.
         Keyword arguments:
         [delimiter] -- optional character string that is replaced by '::' for
             database storage.
@@ -2655,7 +3387,613 @@ class MetricValue(db.Model):
             except AttributeError:
                 pass
         self._value = str(value)
+        self.numbers = self.encode(self._value)
+
+    @staticmethod
+    def decode(raw):
+        """Convert one stored value string to its python value.
+
+        See MetricValue.value for the conversion rules.
+        """
+        if raw is None:
+            return
+        value = raw.split('::')
+        try:
+            value = [float(v) for v in value]
+        except ValueError:
+            return ''.join(value)
+        if len(value) == 1:
+            return value[0]
+        else:
+            return value
+
+    @classmethod
+    def encode(cls, raw):
+        """Convert one stored value string to the contents of 'numbers'.
+
+        Returns:
+            list(float): The numbers held by the string, or None if it
+                isn't numeric.
+        """
+        value = cls.decode(raw)
+        if isinstance(value, float):
+            return [value]
+        if isinstance(value, list):
+            return value
+        return None
+
+    @staticmethod
+    def _from_numbers(numbers):
+        if len(numbers) == 1:
+            return numbers[0]
+        return list(numbers)
+
+    @classmethod
+    def decode_all(cls, raw_values, numbers=None):
+        """Convert a column of stored values to their python values.
+
+        Typed values are used wherever they're available, so only rows
+        that haven't been backfilled (or aren't numeric) need their text
+        parsed. Most metrics are single numbers, so any remaining text is
+        first converted in one pass and values are only decoded one at a
+        time if that fails.
+
+        Args:
+            raw_values (list(str)): Values as stored in the 'value' column.
+            numbers (list, optional): The matching entries from the
+                'numbers' column.
+
+        Returns:
+            list: The decoded values, in the same order.
+        """
+        if numbers is None:
+            numbers = [None] * len(raw_values)
+
+        if None not in numbers:
+            return [cls._from_numbers(item) for item in numbers]
+
+        if not any(item is not None for item in numbers):
+            try:
+                return list(map(float, raw_values))
+            except (TypeError, ValueError):
+                pass
+
+        return [
+            cls.decode(raw) if item is None else cls._from_numbers(item)
+            for raw, item in zip(raw_values, numbers)
+        ]
+
+    @staticmethod
+    def to_array(numbers):
+        """Convert a column of typed values to a NumPy array.
+
+        Args:
+            numbers (list): Entries from the 'numbers' column.
+
+        Raises:
+            InvalidDataException: If any entry isn't numeric (or hasn't
+                been backfilled) or if the entries differ in length.
+
+        Returns:
+            numpy.ndarray: A 1D array if every entry holds a single number,
+                otherwise a 2D array with one row per entry.
+        """
+        if any(item is None for item in numbers):
+            raise InvalidDataException(
+                "Can't convert non-numeric metric values to an array")
+        try:
+            array = numpy.array(numbers, dtype=numpy.float64)
+        except ValueError:
+            raise InvalidDataException(
+                "Can't convert metric values of different lengths to an "
+                "array")
+        if array.ndim == 2 and array.shape[1] == 1:
+            return array[:, 0]
+        return array
+
+    @classmethod
+    def bulk_upsert(cls, records):
+        """Add or update many metric values in a single transaction.
+
+        Scans are looked up by name and metric types by name for each scan's
+        tag. Any metric types that don't exist yet are created. If a scan
+        already has a value for a metric it will be replaced. If a record
+        is repeated the last one given is used.
+
+        Args:
+            records (iterable): An iterable of (scan name, metric type name,
+                value) tuples. Values may be numbers, strings or lists of
+                numbers.
+
+        Raises:
+            InvalidDataException: If any scan doesn't exist, a record is
+                malformed, or the values can't be saved. Nothing is saved
+                if this is raised.
+
+        Returns:
+            int: The number of metric values added or updated.
+        """
+        values = {}
+        for record in records:
+            try:
+                scan_name, metric_name, value = record
+            except (TypeError, ValueError):
+                raise InvalidDataException(
+                    "Malformed metric record {}".format(record))
+            if not scan_name or not metric_name:
+                raise InvalidDataException(
+                    "Metric record {} is missing a scan or metric type "
+                    "name".format(record))
+            if isinstance(value, (list, tuple)):
+                value = '::'.join(str(item) for item in value)
+            values[(scan_name, metric_name)] = str(value)
+
+        if not values:
+            return 0
+
+        scan_names = {scan_name for scan_name, _ in values}
+        scans = {}
+        for scan_id, name, tag in db.session.execute(
+                select(Scan.id, Scan.name, Scan.tag)
+                .where(Scan.name.in_(scan_names))):
+            scans.setdefault(name, []).append((scan_id, tag))
+
+        missing = scan_names - set(scans)
+        if missing:
+            raise InvalidDataException(
+                "Can't add metrics for scans that don't exist: {}".format(
+                    ", ".join(sorted(missing))))
+
+        needed = {(metric_name, tag)
+                  for (scan_name, metric_name) in values
+                  for _, tag in scans[scan_name]}
+
+        try:
+            db.session.execute(
+                pg_insert(Metrictype.__table__)
+                .values([{'name': name, 'scantype': tag}
+                         for name, tag in needed])
+                .on_conflict_do_nothing(
+                    index_elements=['name', 'scantype']))
+            metrictypes = {
+                (name, tag): metric_id
+                for metric_id, name, tag in db.session.execute(
+                    select(Metrictype.id, Metrictype.name,
+                           Metrictype.scantype_id)
+                    .where(Metrictype.name.in_({n for n, _ in needed})))
+            }
+
+            rows = [
+                {
+                    'scan_id': scan_id,
+                    'metric_type': metrictypes[(metric_name, tag)],
+                    'value': value,
+                    'numbers': cls.encode(value)
+                }
+                for (scan_name, metric_name), value in values.items()
+                for scan_id, tag in scans[scan_name]
+            ]
+
+            for start in range(0, len(rows), cls.UPSERT_BATCH_SIZE):
+                query = pg_insert(cls.__table__) \
+                    .values(rows[start:start + cls.UPSERT_BATCH_SIZE])
+                db.session.execute(query.on_conflict_do_update(
+                    index_elements=['scan_id', 'metric_type'],
+                    set_={
+                        'value': query.excluded.value,
+                        'numbers': query.excluded.numbers
+                    }))
+            MetricSummary.refresh(
+                scan_ids={row['scan_id'] for row in rows},
+                metrictype_ids={row['metric_type'] for row in rows})
+            utils.commit()
+        except Exception as e:
+            utils.rollback(e)
+            raise InvalidDataException(
+                "Failed to add metric values. Reason - {}".format(e))
+
+        return len(rows)
+
+    @classmethod
+    def backfill(cls, batch_size=1000):
+        """Fill in the typed 'numbers' column for existing numeric values.
+
+        Rows are converted inside the database in batches of primary keys,
+        committing after each, so the table is never locked for long.
+
+        Args:
+            batch_size (int, optional): The number of rows to process per
+                transaction. Defaults to 1000.
+
+        Raises:
+            InvalidDataException: If a batch can't be committed.
+
+        Returns:
+            int: The number of rows updated.
+        """
+        updated = 0
+        last_id = 0
+        while True:
+            ids = db.session.execute(
+                select(cls.id)
+                .where(cls.id > last_id)
+                .where(cls.numbers.is_(None))
+                .where(cls._value.isnot(None))
+                .order_by(cls.id)
+                .limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                return updated
+
+            result = db.session.execute(
+                update(cls)
+                .where(cls.id.in_(ids))
+                .where(cls._value.regexp_match(cls.NUMERIC_PATTERN))
+                .values(numbers=func.string_to_array(cls._value, '::')
+                        .cast(ARRAY(DOUBLE_PRECISION)))
+                .execution_options(synchronize_session=False)
+            )
+            try:
+                utils.commit()
+            except Exception as e:
+                utils.rollback(e)
+                raise InvalidDataException(
+                    "Failed to backfill metric values. Reason - {}".format(e))
+            updated += result.rowcount
+            last_id = ids[-1]
+            logger.debug("Backfilled metric values up to ID {}".format(
+                last_id))
 
     def __repr__(self):
         return ('<Scan {}: Metric {}: Value {}>'.format(
             self.scan.name, self.metrictype.name, self.value))
+
+
+class MetricSummary(db.Model):
+    """Holds summary statistics for each QC metric in a study.
+
+    There is one row per study, site, scan type, metric type and phantom
+    status, computed from the single number metric values of scans that
+    haven't failed QC. Rows are refreshed whenever metric values are written
+    in bulk or a scan's QC review changes, so graphs can be drawn from these
+    instead of every raw value. Use bin/backfill_metric_values.py to rebuild
+    the table after converting old values.
+    """
+    __tablename__ = 'metric_summary'
+
+    # The quantiles stored for each metric, in order
+    QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+    study_id = db.Column('study', db.String(32), primary_key=True)
+    site_id = db.Column('site', db.String(32), primary_key=True)
+    scantype_id = db.Column('scantype', db.String(64), primary_key=True)
+    metrictype_id = db.Column('metrictype', db.Integer, primary_key=True)
+    is_phantom = db.Column('is_phantom', db.Boolean, primary_key=True)
+    count = db.Column('count', db.Integer, nullable=False)
+    mean = db.Column('mean', DOUBLE_PRECISION)
+    std = db.Column('std', DOUBLE_PRECISION)
+    minimum = db.Column('min', DOUBLE_PRECISION)
+    maximum = db.Column('max', DOUBLE_PRECISION)
+    quantiles = db.Column('quantiles', ARRAY(DOUBLE_PRECISION))
+
+    __table_args__ = (
+        ForeignKeyConstraint(['study'], ['studies.id'], ondelete='CASCADE'),
+        ForeignKeyConstraint(['site'], ['sites.name'], ondelete='CASCADE'),
+        ForeignKeyConstraint(['scantype'], ['scantypes.tag'],
+                             ondelete='CASCADE'),
+        ForeignKeyConstraint(['metrictype'], ['metrictypes.id'],
+                             ondelete='CASCADE'),
+    )
+
+    @classmethod
+    def _calculate(cls, groups=None):
+        """Build a query that computes summary rows from the metric values.
+
+        Args:
+            groups (optional): A query for (study, site, scantype,
+                metrictype) rows to restrict the calculation to.
+        """
+        number = MetricValue.numbers[1]
+        query = select(
+            study_timepoints_table.c.study,
+            Timepoint.site_id,
+            Scan.tag,
+            MetricValue.metrictype_id,
+            Timepoint.is_phantom,
+            func.count(number),
+            func.avg(number),
+            func.stddev_samp(number),
+            func.min(number),
+            func.max(number),
+            func.percentile_cont(
+                cast(pg_array(cls.QUANTILES), ARRAY(DOUBLE_PRECISION))
+            ).within_group(number)
+        ).select_from(MetricValue) \
+            .join(Scan, Scan.id == MetricValue.scan_id) \
+            .join(Timepoint, Timepoint.name == Scan.timepoint) \
+            .join(study_timepoints_table,
+                  study_timepoints_table.c.timepoint == Timepoint.name) \
+            .outerjoin(ScanChecklist, ScanChecklist.scan_id == Scan.id) \
+            .where(func.cardinality(MetricValue.numbers) == 1) \
+            .where(ScanChecklist.approved.isnot(False)) \
+            .group_by(study_timepoints_table.c.study, Timepoint.site_id,
+                      Scan.tag, MetricValue.metrictype_id,
+                      Timepoint.is_phantom)
+
+        if groups is not None:
+            query = query.where(
+                tuple_(study_timepoints_table.c.study, Timepoint.site_id,
+                       Scan.tag, MetricValue.metrictype_id).in_(groups))
+        return query
+
+    @staticmethod
+    def _find_groups(scan_ids=None, metrictype_ids=None):
+        """Build a query for the summary rows affected by changed values.
+        """
+        query = select(
+            study_timepoints_table.c.study,
+            Timepoint.site_id,
+            Scan.tag,
+            MetricValue.metrictype_id
+        ).select_from(MetricValue) \
+            .join(Scan, Scan.id == MetricValue.scan_id) \
+            .join(Timepoint, Timepoint.name == Scan.timepoint) \
+            .join(study_timepoints_table,
+                  study_timepoints_table.c.timepoint == Timepoint.name) \
+            .distinct()
+        if scan_ids is not None:
+            query = query.where(MetricValue.scan_id.in_(scan_ids))
+        if metrictype_ids is not None:
+            query = query.where(MetricValue.metrictype_id.in_(metrictype_ids))
+        return query
+
+    @classmethod
+    def refresh(cls, scan_ids=None, metrictype_ids=None):
+        """Recalculate summary rows within the current transaction.
+
+        Only the rows for the study, site, scan type and metric type
+        combinations that the given scans and metric types belong to are
+        recalculated. Everything is recalculated if neither is given.
+        Pending changes are flushed first so the new rows reflect them.
+        Values being deleted are only accounted for if their delete hasn't
+        been flushed yet. The caller is responsible for committing.
+
+        Args:
+            scan_ids (list(int), optional): Scans whose values have changed.
+            metrictype_ids (list(int), optional): Metric types whose values
+                have changed.
+        """
+        groups = None
+        restrict = scan_ids is not None or metrictype_ids is not None
+        if restrict and db.session.deleted:
+            # Values deleted along with their scan can't be found once the
+            # delete is flushed, so find the rows they belonged to first
+            with db.session.no_autoflush:
+                groups = {tuple(row) for row in db.session.execute(
+                    cls._find_groups(scan_ids, metrictype_ids))}
+        db.session.flush()
+
+        remove = delete(cls.__table__)
+        if restrict:
+            groups = list((groups or set()) | {
+                tuple(row) for row in db.session.execute(
+                    cls._find_groups(scan_ids, metrictype_ids))})
+            if not groups:
+                return
+            remove = remove.where(
+                tuple_(cls.study_id, cls.site_id, cls.scantype_id,
+                       cls.metrictype_id).in_(groups))
+        db.session.execute(remove)
+
+        db.session.execute(
+            insert(cls.__table__).from_select(
+                ['study', 'site', 'scantype', 'metrictype', 'is_phantom',
+                 'count', 'mean', 'std', 'min', 'max', 'quantiles'],
+                cls._calculate(groups)
+            )
+        )
+
+    @classmethod
+    def rebuild(cls):
+        """Regenerate every summary row and commit.
+        """
+        try:
+            cls.refresh()
+            utils.commit()
+        except Exception as e:
+            utils.rollback(e)
+            raise InvalidDataException("Failed to rebuild metric summary. "
+                                       "Reason - {}".format(e))
+
+    def __repr__(self):
+        return "<MetricSummary {} {} {} {}>".format(
+            self.study_id, self.site_id, self.scantype_id,
+            self.metrictype_id)
+
+
+class QcManifest(db.Model):
+    """Holds the contents of the QC manifest file for each scan.
+
+    Manifests list the images generated for a scan's QC page. Finding and
+    parsing them on every timepoint page view is slow on network file
+    systems, so their ordered contents are indexed here along with each
+    file's modification time. Use bin/index_qc_manifests.py to (re)index
+    them.
+    """
+    __tablename__ = 'qc_manifests'
+
+    name = db.Column('name', db.String(64), primary_key=True)
+    num = db.Column('num', db.Integer, primary_key=True)
+    scan = db.Column('scan', db.String(128), primary_key=True)
+    path = db.Column('path', db.Text, nullable=False)
+    # Nanoseconds since the epoch, so it compares exactly with os.stat
+    mtime = db.Column('mtime', db.BigInteger, nullable=False)
+    # A list of [image, settings] pairs. JSONB doesn't preserve key order.
+    images = db.Column('images', JSONB, nullable=False)
+
+    __table_args__ = (
+        ForeignKeyConstraint(['name', 'num'],
+                             ['sessions.name', 'sessions.num'],
+                             ondelete='CASCADE'),
+    )
+
+    def __init__(self, name, num, scan):
+        self.name = name
+        self.num = num
+        self.scan = scan
+
+    @property
+    def contents(self):
+        return OrderedDict(
+            (image, settings) for image, settings in self.images
+        )
+
+    @contents.setter
+    def contents(self, contents):
+        self.images = [[image, settings] for image, settings
+                       in contents.items()]
+
+    @classmethod
+    def find(cls, timepoint):
+        """Get the indexed manifests for every session of a timepoint.
+        """
+        return cls.query.filter(cls.name == timepoint) \
+            .order_by(cls.num, cls.scan) \
+            .all()
+
+    @staticmethod
+    def save(updated=None, removed=None):
+        """Add (or update) and delete manifest records and commit.
+
+        Args:
+            updated (list, optional): :obj:`QcManifest` records to add or
+                update.
+            removed (list, optional): :obj:`QcManifest` records to delete.
+
+        Raises:
+            InvalidDataException: If the changes can't be committed.
+        """
+        try:
+            for record in updated or []:
+                db.session.add(record)
+            for record in removed or []:
+                db.session.delete(record)
+            utils.commit()
+        except Exception as e:
+            utils.rollback(e)
+            raise InvalidDataException(
+                "Failed to update QC manifests. Reason - {}".format(e))
+
+    def __repr__(self):
+        return "<QcManifest {}>".format(self.scan)
+
+
+class GithubIssue(db.Model):
+    """A local copy of a GitHub issue, filed under each timepoint it names.
+
+    Timepoint pages show the issues that mention the timepoint. These are
+    kept here (rather than searched for on each page view) and updated by
+    the sync job, the GitHub webhook and by issues created through the
+    dashboard. An issue that mentions more than one timepoint has one row
+    for each.
+    """
+    __tablename__ = 'github_issues'
+
+    timepoint = db.Column('timepoint', db.String(64), primary_key=True)
+    number = db.Column('number', db.Integer, primary_key=True)
+    title = db.Column('title', db.Text, nullable=False)
+    body = db.Column('body', db.Text)
+    state = db.Column('state', db.String(16), nullable=False)
+    comments = db.Column('comments', db.Integer, nullable=False, default=0)
+    html_url = db.Column('html_url', db.Text, nullable=False)
+    created_at = db.Column('created_at', db.DateTime(timezone=True),
+                           nullable=False)
+    updated_at = db.Column('updated_at', db.DateTime(timezone=True),
+                           nullable=False)
+    closed_at = db.Column('closed_at', db.DateTime(timezone=True))
+
+    __table_args__ = (Index('github_issues_number_idx', number), )
+
+    # The issue fields copied into each record
+    FIELDS = ['number', 'title', 'body', 'state', 'comments', 'html_url',
+              'created_at', 'updated_at', 'closed_at']
+
+    @classmethod
+    def find(cls, timepoint):
+        """Get the issues that mention a timepoint, oldest first.
+        """
+        return cls.query.filter(cls.timepoint == timepoint) \
+            .order_by(cls.created_at) \
+            .all()
+
+    @classmethod
+    def last_updated(cls):
+        """Get the most recent update time of any stored issue.
+        """
+        return db.session.execute(select(func.max(cls.updated_at))).scalar()
+
+    @staticmethod
+    def find_timepoints(text):
+        """Find the names of the timepoints mentioned in some text.
+
+        Args:
+            text (str): The text to search (e.g. an issue's title).
+
+        Returns:
+            set: The name of each timepoint, session or scan ID found, with
+                any session or scan parts removed.
+        """
+        found = set()
+        for word in set(re.findall(r'[\w-]+', text or '')):
+            try:
+                ident = scanid.parse(word)
+            except scanid.ParseException:
+                continue
+            found.add(ident.get_full_subjectid_with_timepoint())
+        return found
+
+    @classmethod
+    def save(cls, issues):
+        """Add or replace issues and commit.
+
+        Args:
+            issues (list): A dictionary for each issue, holding the keys in
+                GithubIssue.FIELDS. Issues that don't mention a timepoint in
+                their title or body are removed, if they were stored.
+
+        Raises:
+            InvalidDataException: If the issues can't be saved.
+        """
+        rows = []
+        for issue in issues:
+            names = cls.find_timepoints(issue['title']) | \
+                cls.find_timepoints(issue['body'])
+            rows.extend(
+                dict({field: issue[field] for field in cls.FIELDS},
+                     timepoint=name)
+                for name in sorted(names)
+            )
+
+        try:
+            cls.remove([issue['number'] for issue in issues], commit=False)
+            if rows:
+                db.session.execute(insert(cls.__table__), rows)
+            utils.commit()
+        except Exception as e:
+            utils.rollback(e)
+            raise InvalidDataException(
+                "Failed to save GitHub issues. Reason - {}".format(e))
+
+    @classmethod
+    def remove(cls, numbers, commit=True):
+        """Delete the stored copies of the given issue numbers.
+        """
+        if not numbers:
+            return
+        db.session.execute(delete(cls.__table__)
+                           .where(cls.__table__.c.number.in_(numbers)))
+        if commit:
+            utils.commit()
+
+    def __repr__(self):
+        return "<GithubIssue #{} {}>".format(self.number, self.timepoint)
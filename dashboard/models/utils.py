@@ -6,19 +6,21 @@ import operator
 import json
 import time
 import logging
-from urllib.parse import quote, unquote
+from contextlib import contextmanager
 from uuid import uuid4
 from datetime import datetime
 
-import xnat
 from sqlalchemy.orm.collections import MappedCollection, collection
 import flask_apscheduler
 
-from dashboard import scheduler
-from dashboard.emails import async_exec
+from dashboard import db, scheduler, xnat_sync
+from dashboard.exceptions import InvalidDataException
 
 logger = logging.getLogger(__name__)
 
+# The key that holds the open db_batch() (if any) in the session's info dict
+BATCH_KEY = 'dashboard_batch'
+
 
 class DictListCollection(MappedCollection):
     """Allows a relationship to be organized into a dictionary of lists
@@ -42,6 +44,117 @@ class DictListCollection(MappedCollection):
         return iter(all_records)
 
 
+class Batch:
+    """The state of an open :func:`db_batch` block.
+
+    Attributes:
+        errors (list): A message for each change that failed and was rolled
+            back inside the block.
+        callbacks (list): Functions (and their arguments) to run once the
+            batch has been committed.
+    """
+
+    def __init__(self):
+        self.errors = []
+        self.callbacks = []
+
+
+def get_batch():
+    """Get the :func:`db_batch` open in the current session, if any.
+    """
+    return db.session.info.get(BATCH_KEY)
+
+
+@contextmanager
+def db_batch():
+    """Group the changes made by model methods into one transaction.
+
+    Model methods normally commit as soon as they've made their changes.
+    Inside this block they only flush, and everything is committed once when
+    the block exits. A batch opened inside another joins the outer one.
+
+    The batch is all or nothing. If any change fails, nothing in the block is
+    committed. Failures that were caught inside the block (e.g. by a loop
+    that logs them and moves on) are collected and reported together when
+    it exits.
+
+    Work that must only happen once the changes are saved (like pushing QC
+    to XNAT or updating the search index) is deferred until after the
+    commit.
+
+    Raises:
+        InvalidDataException: If any change made inside the block failed or
+            the batch couldn't be committed.
+
+    Yields:
+        :obj:`Batch`: The open batch.
+    """
+    batch = get_batch()
+    if batch is not None:
+        yield batch
+        return
+
+    batch = Batch()
+    db.session.info[BATCH_KEY] = batch
+    try:
+        yield batch
+        if batch.errors:
+            raise InvalidDataException(
+                "{} change(s) failed, nothing was saved. Reasons - {}".format(
+                    len(batch.errors), "; ".join(batch.errors)))
+        try:
+            db.session.commit()
+        except Exception as e:
+            raise InvalidDataException("Failed to commit changes. Reason - "
+                                       "{}".format(e))
+    except BaseException:
+        db.session.rollback()
+        raise
+    finally:
+        db.session.info.pop(BATCH_KEY, None)
+
+    for func, args, kwargs in batch.callbacks:
+        try:
+            func(*args, **kwargs)
+        except Exception as e:
+            logger.error("Failed to run {} after commit. Reason - {}".format(
+                func.__name__, e))
+
+
+def commit():
+    """Commit the session, or only flush it inside a :func:`db_batch`.
+    """
+    if get_batch() is None:
+        db.session.commit()
+    else:
+        db.session.flush()
+
+
+def rollback(reason=None):
+    """Roll back the session.
+
+    Inside a :func:`db_batch` this discards every change made in the block so
+    far, so the failure is recorded and the batch won't be committed.
+
+    Args:
+        reason (optional): The error that caused the rollback.
+    """
+    db.session.rollback()
+    batch = get_batch()
+    if batch is not None:
+        batch.errors.append(str(reason or "Changes were rolled back"))
+
+
+def after_commit(func, *args, **kwargs):
+    """Run a function now, or once the open :func:`db_batch` is committed.
+    """
+    batch = get_batch()
+    if batch is None:
+        func(*args, **kwargs)
+    else:
+        batch.callbacks.append((func, args, kwargs))
+
+
 def read_json(json_file):
     with open(json_file, "r") as fp:
         contents = json.load(fp)
@@ -94,35 +207,56 @@ def update_xnat_usability(scan, app_config):
         app_config (:obj:`dict`): Configuration of the current app instance,
             as retrieved from current_app.config
     """
-    study = scan.get_study()
-    site_settings = study.sites[scan.session.site.name]
+    update_xnat_session_usability(scan.session, [scan], app_config)
+
+
+def update_xnat_session_usability(session, scans, app_config):
+    """Update XNAT usability data for several series of one session.
+
+    The updates are queued for the XNAT sync worker, which pushes them in
+    the background.
+
+    Args:
+        session (:obj:`dashboard.models.Session`): The session (i.e. XNAT
+            experiment) the series belong to.
+        scans (:obj:`list`): The :obj:`dashboard.models.Scan` records to push
+            QC data for.
+        app_config (:obj:`dict`): Configuration of the current app instance,
+            as retrieved from current_app.config
+    """
+    if not scans:
+        return
+
+    study = session.get_study()
+    site_settings = study.sites[session.site.name]
 
     if not site_settings.xnat_url:
         logger.info(f"{study.id} - No xnat url. Skipping QC push to XNAT.")
         return
 
     exp_name = getattr(
-        scan.session, site_settings.xnat_convention.lower() + "_name"
+        session, site_settings.xnat_convention.lower() + "_name"
     )
 
     user, password = get_xnat_credentials(site_settings, app_config)
 
-    if scan.flagged():
-        quality = 'questionable'
-    elif scan.blacklisted():
-        quality = 'unusable'
-    else:
-        quality = 'usable'
-
-    async_xnat_update(
+    updates = []
+    for scan in scans:
+        if scan.flagged():
+            quality = 'questionable'
+        elif scan.blacklisted():
+            quality = 'unusable'
+        else:
+            quality = 'usable'
+        updates.append((scan.series, scan.get_comment(), quality))
+
+    xnat_sync.get_worker(app_config).submit(
         site_settings.xnat_url,
         user,
         password,
         site_settings.xnat_archive,
         exp_name,
-        scan.series,
-        scan.qc_review.comment,
-        quality
+        updates
     )
 
 
@@ -163,44 +297,3 @@ def get_xnat_credentials(site_settings, app_config):
         raise e
 
     return user, password
-
-
-@async_exec
-def async_xnat_update(xnat_url, user, password, xnat_archive, exp_name,
-                      series_num, comment, quality):
-    """Push usability data into XNAT.
-
-    This will update XNAT in a separate thread to reduce waiting time for the
-    user. Because it will run in another thread, database objects cannot be
-    passed in as arguments.
-
-    Args:
-        xnat_url (str): The full URL to use for the XNAT server.
-        user (str): The user to log in as.
-        password (str): The password to log in with.
-        xnat_archvie (str): The name of the XNAT archive that contains the
-            experiment.
-        exp_name (str): The name of the experiment on XNAT.
-        series_num (int): The series number of the file to update.
-        comment (str): The user's QC comment.
-        quality (str): The quality label to apply based on whether data
-            has been flagged, blacklisted or approved.
-    """
-    with xnat.connect(xnat_url, user=user, password=password) as xcon:
-        project = xcon.projects[xnat_archive]
-        xnat_exp = project.experiments[exp_name]
-        matched = [item for item in xnat_exp.scans[:]
-                   if item.id == str(series_num)]
-
-        if not matched or len(matched) > 1:
-            logger.error(f"Couldn't locate {exp_name} on XNAT server. "
-                         "Usability will not be updated.")
-            return
-
-        xnat_scan = matched[0]
-        xnat_scan.quality = quality
-        if comment:
-            # XNAT max comment length is 255 chars
-            safe_comment = comment if len(quote(comment)) < 255 \
-                else unquote(quote(comment)[0:243]) + " [...]"
-            xnat_scan.note = safe_comment
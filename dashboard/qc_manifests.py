@@ -0,0 +1,133 @@
+"""Keeps the qc_manifests table in sync with the QC manifest files on disk.
+
+A timepoint's manifests are read from the database. Its QC folder is only
+listed to find manifests that have been added, removed or modified since
+they were indexed, and only those files are read and parsed again.
+
+Manifests that can't be indexed (because their names can't be parsed or
+their session isn't in the database) are remembered by each process, so
+they're only read again once they change or their session is added.
+"""
+import logging
+
+from datman.scanid import ParseException
+
+import dashboard.datman_utils as dm_utils
+from dashboard.exceptions import InvalidDataException
+from dashboard.models import QcManifest
+
+logger = logging.getLogger(__name__)
+
+# Manifests that couldn't be indexed, mapped to their modification time and
+# the session number they belong to (None if the name couldn't be parsed)
+_ignored = {}
+
+
+def get_manifests(timepoint):
+    """Get the QC manifest contents for every session of a timepoint.
+
+    Any manifests that are out of date in the database are re-indexed first.
+
+    Args:
+        timepoint (:obj:`dashboard.models.Timepoint`): A timepoint from the
+            database.
+
+    Returns:
+        dict: A dictionary mapping session numbers to a dictionary of scan
+            names and their manifest contents, in the same format as
+            :obj:`dashboard.datman_utils.get_manifests`.
+    """
+    qc_path = dm_utils.get_qc_path(timepoint)
+    if not qc_path:
+        return {}
+
+    found = {num: {} for num in timepoint.sessions}
+    for record in update_index(timepoint, qc_path):
+        if record.num in found:
+            found[record.num][record.scan] = record.contents
+    return found
+
+
+def update_index(timepoint, qc_path=None, force=False):
+    """Re-index any of a timepoint's manifests that have changed on disk.
+
+    Args:
+        timepoint (:obj:`dashboard.models.Timepoint`): A timepoint from the
+            database.
+        qc_path (:obj:`str`, optional): The timepoint's QC folder. Will be
+            looked up if not given.
+        force (bool, optional): Whether to re-read every manifest, even
+            those that haven't been modified. Defaults to False.
+
+    Returns:
+        list: The up to date :obj:`dashboard.models.QcManifest` records for
+            the timepoint.
+    """
+    if not qc_path:
+        qc_path = dm_utils.get_qc_path(timepoint)
+        if not qc_path:
+            return []
+
+    records = {(record.num, record.scan): record
+               for record in QcManifest.find(timepoint.name)}
+    indexed = {record.path: record for record in records.values()}
+
+    current = set()
+    updated = []
+    for path, mtime in sorted(dm_utils.find_manifests(qc_path).items()):
+        record = indexed.get(path)
+        if record and record.mtime == mtime and not force:
+            current.add((record.num, record.scan))
+            continue
+
+        if not force and _is_ignored(path, mtime, timepoint):
+            continue
+
+        try:
+            num, scan, contents = dm_utils.read_manifest(path)
+        except ParseException:
+            logger.error("Ignoring QC manifest with invalid name "
+                         "{}".format(path))
+            _ignored[path] = (mtime, None)
+            continue
+
+        if num not in timepoint.sessions:
+            _ignored[path] = (mtime, num)
+            continue
+        _ignored.pop(path, None)
+
+        record = records.get((num, scan))
+        if not record:
+            record = QcManifest(timepoint.name, num, scan)
+            records[(num, scan)] = record
+        record.path = path
+        record.mtime = mtime
+        record.contents = contents
+        current.add((num, scan))
+        updated.append(record)
+
+    removed = [records.pop(key) for key in list(records)
+               if key not in current]
+
+    if updated or removed:
+        logger.debug("Re-indexing {} and removing {} QC manifests for "
+                     "{}".format(len(updated), len(removed), timepoint))
+        try:
+            QcManifest.save(updated=updated, removed=removed)
+        except InvalidDataException as e:
+            logger.error("Failed to update QC manifest index for {}. {}"
+                         "".format(timepoint, e))
+
+    return sorted(records.values(), key=lambda item: (item.num, item.scan))
+
+
+def _is_ignored(path, mtime, timepoint):
+    """Check if a manifest couldn't be indexed and hasn't changed since.
+    """
+    try:
+        ignored_mtime, num = _ignored[path]
+    except KeyError:
+        return False
+    if ignored_mtime != mtime:
+        return False
+    return num is None or num not in timepoint.sessions
@@ -1,19 +1,33 @@
 """Reusable database queries.
 """
 import logging
+from collections import namedtuple
 
-from sqlalchemy import not_, and_, or_, func
+from sqlalchemy import (not_, and_, or_, func, tuple_, select, union_all,
+                        literal, null, cast, Integer, Float, Text)
 
-from dashboard import db
+from dashboard import db, search_index, reference_data
 from .models import (Timepoint, Session, Scan, Study, Site, Metrictype,
-                     MetricValue, Scantype, StudySite, AltStudyCode, User,
+                     MetricValue, Scantype, User,
                      study_timepoints_table, RedcapConfig, ScanChecklist,
-                     StudyUser)
+                     MetricSummary, user_access_scope)
+from .models import utils as model_utils
 from dashboard.exceptions import InvalidDataException
 import datman.scanid as scanid
 
 logger = logging.getLogger(__name__)
 
+# The number of rows to fetch from the server side cursor at a time when
+# streaming query results
+STREAM_BATCH_SIZE = 1000
+
+# The maximum number of fuzzy matches the search bar will return
+SEARCH_LIMIT = 100
+
+# similarity() returns a real, so exact matches get the highest possible
+# score of the same type
+_EXACT_RANK = cast(literal(1.0), Float)
+
 
 def get_studies(name=None, tag=None, site=None, create=False):
     """Find a study or studies based on search terms.
@@ -46,44 +60,202 @@ def get_studies(name=None, tag=None, site=None, create=False):
             study = Study(name)
             try:
                 db.session.add(study)
-                db.session.commit()
+                model_utils.commit()
             except Exception as e:
-                db.session.rollback()
+                model_utils.rollback(e)
                 raise e
             found = [study]
         return found
 
-    query = query.filter(Study.id == StudySite.study_id)
+    study_ids = reference_data.get().find_studies(tag=tag, site=site)
+    if not study_ids:
+        return []
+    return query.filter(Study.id.in_(study_ids)).order_by(Study.id).all()
 
-    if tag:
-        conditions = [StudySite.code == tag]
-        if AltStudyCode.query.count():
-            conditions.append(
-                and_(
-                    Study.id == AltStudyCode.study_id,
-                    StudySite.site_id == AltStudyCode.site_id,
-                    AltStudyCode.code == tag
-                )
-            )
-        query = query.filter(or_(*conditions))
 
-    if site:
-        query = query.filter(
-            and_(Study.id == StudySite.study_id,
-                 StudySite.site_id == site)
-        )
+SearchResult = namedtuple(
+    'SearchResult',
+    ['kind', 'name', 'timepoint', 'num', 'scan_id', 'study_id', 'rank'])
 
-    return query.all()
 
+def search(search_str, user_id=None, limit=SEARCH_LIMIT):
+    """Find subjects, sessions and scans matching the search bar's input.
+
+    Exact matches on a subject ID, session ID, scan name or BIDS scan name
+    are returned on their own without running the fuzzy search. Otherwise
+    every name containing the search string is returned, best match first.
+    A '%' in the search string acts as a wildcard.
+
+    Args:
+        search_str (str): The user's search term.
+        user_id (int, optional): The ID of a valid user. If this is given
+            only records from the studies and sites the user has access to
+            will be returned. Defaults to None.
+        limit (int, optional): The maximum number of fuzzy matches to return.
+            Defaults to SEARCH_LIMIT.
+
+    Returns:
+        list: A list of :obj:`SearchResult` tuples. 'kind' is one of
+            'subject', 'session' or 'scan', 'num' is set for sessions and
+            scans and 'scan_id' only for scans. 'study_id' is a study the
+            record belongs to (and the user can access, if user_id is set).
+    """
+    search_str = search_str.strip()
+    if not search_str:
+        return []
+
+    results = _exact_search(search_str, user_id)
+    if results:
+        return results
+    return _fuzzy_search(search_str, user_id, limit)
+
+
+def _exact_search(search_str, user_id):
+    names = {search_str, search_str.upper()}
+
+    session = None
+    try:
+        ident = scanid.parse(search_str.upper())
+    except scanid.ParseException:
+        try:
+            ident, tag, series, _ = scanid.parse_filename(search_str.upper())
+        except scanid.ParseException:
+            pass
+        else:
+            names.add("_".join([
+                ident.get_full_subjectid_with_timepoint_session(), tag, series
+            ]))
+    else:
+        if ident.session:
+            session = (ident.get_full_subjectid_with_timepoint(),
+                       int(ident.session))
+        else:
+            names.add(ident.get_full_subjectid_with_timepoint())
+
+    queries = [
+        _subject_search(Timepoint.name.in_(names), _EXACT_RANK, user_id),
+        _scan_search(or_(Scan.name.in_(names), Scan.bids_name == search_str),
+                     _EXACT_RANK, user_id)
+    ]
+    if session:
+        queries.append(_session_search(
+            and_(Session.name == session[0], Session.num == session[1]),
+            _EXACT_RANK, user_id))
+
+    found = union_all(*queries).subquery()
+    query = select(found).order_by(found.c.kind, found.c.name)
+    return [SearchResult(*row) for row in db.session.execute(query)]
+
+
+def _fuzzy_search(search_str, user_id, limit):
+    # ILIKE (rather than upper(name) LIKE) lets postgres use the trigram
+    # indexes
+    pattern = '%' + search_str + '%'
+    queries = [
+        _subject_search(
+            Timepoint.name.ilike(pattern),
+            func.similarity(Timepoint.name, search_str),
+            user_id),
+        _session_search(
+            Session.name.ilike(pattern),
+            func.similarity(Session.name, search_str),
+            user_id),
+        _scan_search(
+            or_(Scan.name.ilike(pattern), Scan.bids_name.ilike(pattern)),
+            func.greatest(
+                func.similarity(Scan.name, search_str),
+                func.similarity(func.coalesce(Scan.bids_name, ''),
+                                search_str)),
+            user_id)
+    ]
 
-def find_subjects(search_str):
+    found = union_all(*queries).subquery()
+    query = select(found)\
+        .order_by(found.c.rank.desc(), found.c.name)\
+        .limit(limit)
+    return [SearchResult(*row) for row in db.session.execute(query)]
+
+
+def _subject_search(condition, rank, user_id):
+    query = select(
+        literal('subject').label('kind'),
+        Timepoint.name.label('name'),
+        Timepoint.name.label('timepoint'),
+        cast(null(), Integer).label('num'),
+        cast(null(), Integer).label('scan_id'),
+        func.min(study_timepoints_table.c.study).label('study_id'),
+        rank.label('rank')
+    ).where(condition)
+    return _restrict_search(query, Timepoint.name, user_id)\
+        .group_by(Timepoint.name)
+
+
+def _session_search(condition, rank, user_id):
+    query = select(
+        literal('session').label('kind'),
+        func.concat(Session.name, '_',
+                    func.lpad(cast(Session.num, Text), 2, '0')).label('name'),
+        Session.name.label('timepoint'),
+        Session.num.label('num'),
+        cast(null(), Integer).label('scan_id'),
+        func.min(study_timepoints_table.c.study).label('study_id'),
+        rank.label('rank')
+    ).where(condition)\
+        .join(Timepoint, Timepoint.name == Session.name)
+    return _restrict_search(query, Session.name, user_id)\
+        .group_by(Session.name, Session.num)
+
+
+def _scan_search(condition, rank, user_id):
+    query = select(
+        literal('scan').label('kind'),
+        Scan.name.label('name'),
+        Scan.timepoint.label('timepoint'),
+        Scan.repeat.label('num'),
+        Scan.id.label('scan_id'),
+        func.min(study_timepoints_table.c.study).label('study_id'),
+        rank.label('rank')
+    ).where(condition)\
+        .join(Timepoint, Timepoint.name == Scan.timepoint)
+    return _restrict_search(query, Scan.timepoint, user_id)\
+        .group_by(Scan.id)
+
+
+def _restrict_search(query, timepoint, user_id):
+    """Pair search results with their studies, dropping inaccessible ones.
+
+    Records belonging to more than one study are collapsed into a single row
+    by the caller's GROUP BY, keeping the first study (alphabetically) that
+    the user can access.
     """
-    Used by the dashboard's search bar
+    return query\
+        .join(study_timepoints_table,
+              study_timepoints_table.c.timepoint == timepoint)\
+        .where(user_access_scope(user_id,
+                                 study=study_timepoints_table.c.study,
+                                 site=Timepoint.site_id))
+
+
+def load_search_index():
+    """Reload this worker's search suggestion index from the database.
+
+    Returns:
+        :obj:`dashboard.search_index.PrefixIndex`: The loaded index.
     """
-    search_str = search_str.strip().upper()
-    query = Timepoint.query.filter(
-        func.upper(Timepoint.name).contains(search_str))
-    return query.all()
+    index = search_index.index
+    timepoints = db.session.execute(
+        select(Timepoint.name, Timepoint.site_id,
+               study_timepoints_table.c.study)
+        .join(study_timepoints_table,
+              study_timepoints_table.c.timepoint == Timepoint.name)
+    ).all()
+    sessions = db.session.execute(select(Session.name, Session.num)).all()
+    scans = db.session.execute(
+        select(Scan.id, Scan.name, Scan.bids_name, Scan.timepoint,
+               Scan.repeat)
+    ).all()
+    index.load(timepoints, sessions, scans)
+    return index
 
 
 def get_session(name, num):
@@ -145,38 +317,6 @@ def get_study_timepoints(study, site=None, phantoms=False):
     return [s.name for s in timepoints]
 
 
-def find_sessions(search_str):
-    """
-    Used by the dashboard's search bar and so must work around fuzzy user
-    input.
-    """
-    search_str = search_str.strip().upper()
-    try:
-        ident = scanid.parse(search_str)
-    except scanid.ParseException:
-        # Not a proper ID, try fuzzy search for name match
-        query = Session.query.filter(
-            func.upper(Session.name).contains(search_str))
-    else:
-        if ident.session:
-            query = Session.query.filter(
-                and_((
-                     func.upper(Session.name) ==
-                     ident.get_full_subjectid_with_timepoint()),
-                     Session.num == ident.session)
-            )
-
-            if not query.count():
-                ident.session = None
-
-        if not ident.session:
-            query = Session.query.filter(
-                func.upper(Session.name) ==
-                ident.get_full_subjectid_with_timepoint())
-
-    return query.all()
-
-
 def get_scan(scan_name, timepoint=None, session=None, bids=False):
     """
     Used by datman. Return a list of matching scans or an empty list
@@ -193,56 +333,6 @@ def get_scan(scan_name, timepoint=None, session=None, bids=False):
     return query.all()
 
 
-def find_scans(search_str):
-    """
-    Used by the dashboard's search bar and so must work around fuzzy user
-    input.
-    """
-    search_str = search_str.strip().upper()
-    try:
-        ident, tag, series, _ = scanid.parse_filename(search_str)
-    except scanid.ParseException:
-        try:
-            ident = scanid.parse(search_str)
-        except scanid.ParseException:
-            # Doesnt match a file name or a subject ID so fuzzy search
-            # for...
-            # matching scan name
-            query = Scan.query.filter(
-                func.upper(Scan.name).contains(search_str))
-            if query.count() == 0:
-                # or matching subid
-                query = Scan.query.filter(
-                    func.upper(Scan.timepoint).contains(search_str))
-            if query.count() == 0:
-                # or matching tags
-                query = Scan.query.filter(
-                    func.upper(Scan.tag).contains(search_str))
-            if query.count() == 0:
-                # or matching series description
-                query = Scan.query.filter(
-                    func.upper(Scan.description).contains(search_str))
-        else:
-            if ident.session:
-                query = Scan.query.filter(
-                    and_((func.upper(Scan.timepoint) ==
-                          ident.get_full_subjectid_with_timepoint()),
-                         Scan.repeat == int(ident.session)))
-                if not query.count():
-                    ident.session = None
-
-            if not ident.session:
-                query = Scan.query.filter(
-                    func.upper(Scan.timepoint) ==
-                    ident.get_full_subjectid_with_timepoint())
-    else:
-        name = "_".join(
-            [ident.get_full_subjectid_with_timepoint_session(), tag, series])
-        query = Scan.query.filter(func.upper(Scan.name).contains(name))
-
-    return query.all()
-
-
 def get_user(username):
     query = User.query.filter(
         func.lower(User._username).contains(func.lower(username)))
@@ -263,9 +353,11 @@ def get_scantypes(tag_id=None, create=False):
     if not tag_id:
         return Scantype.query.all()
 
-    found = db.session.get(Scantype, tag_id)
-    if found:
-        return [found]
+    # Only go to the database for tags that may be missing from the cache
+    if create or tag_id in reference_data.get().scantypes:
+        found = db.session.get(Scantype, tag_id)
+        if found:
+            return [found]
 
     if not create:
         return []
@@ -274,9 +366,9 @@ def get_scantypes(tag_id=None, create=False):
 
     try:
         db.session.add(new_tag)
-        db.session.commit()
+        model_utils.commit()
     except Exception as e:
-        db.session.rollback()
+        model_utils.rollback(e)
         raise e
 
     return [new_tag]
@@ -295,7 +387,8 @@ def get_redcap_config(project, instrument, url, create=False):
 
 def get_scan_qc(approved=True, blacklisted=True, flagged=True,
                 study=None, site=None, tag=None, include_phantoms=False,
-                include_new=False, comment=None, user_id=None, sort=False):
+                include_new=False, comment=None, user_id=None, sort=False,
+                after=None, limit=None, stream=False):
     """Get a set of QC records matching the given search terms.
 
     Args:
@@ -325,12 +418,22 @@ def get_scan_qc(approved=True, blacklisted=True, flagged=True,
             restrictive.
         sort (bool, optional): Whether to sort the results. Sorting is done
             by scan name. Defaults to False.
+        after (tuple(str, int), optional): The (name, id) of the last record
+            from the previous page of results. If given, only records that
+            sort after it will be returned. Defaults to None.
+        limit (int, optional): The maximum number of records to return. If
+            this or 'after' is given the results will always be sorted by
+            scan name and ID so that pages are stable. Defaults to None.
+        stream (bool, optional): Whether to return a generator that fetches
+            records from a server side cursor in batches instead of loading
+            them all into memory. Defaults to False.
 
     Returns:
-        list(dict): A list of tuples of the format
-            {name: str, approved: bool, comment: str}, where 'status' is a
-            boolean value that represents whether the scan was approved or
-            flagged/blacklisted.
+        list(dict): A list of dictionaries of the format
+            {id: int, name: str, approved: bool, comment: str}, where
+            'approved' is a boolean value that represents whether the scan
+            was approved or flagged/blacklisted. If 'stream' is set a
+            generator of the same dictionaries is returned instead.
     """
 
     def get_list(input_var):
@@ -342,8 +445,8 @@ def get_scan_qc(approved=True, blacklisted=True, flagged=True,
         # Must join Timepoint table for these flags
         query = query.join(Timepoint, Scan.timepoint == Timepoint.name)
 
-    if study or user_id:
-        # Must join study_timepoints_table for these flags
+    if study:
+        # Must join study_timepoints_table for this flag
         query = query.join(
             study_timepoints_table,
             study_timepoints_table.c.timepoint == Scan.timepoint)
@@ -403,139 +506,275 @@ def get_scan_qc(approved=True, blacklisted=True, flagged=True,
             )
 
     if user_id:
-        query = query\
-            .join(
-                StudyUser,
-                study_timepoints_table.c.study == StudyUser.study_id)\
-            .filter(
-                and_(
-                    ScanChecklist.user_id == StudyUser.user_id,
-                    StudyUser.user_id == user_id,
-                    or_(
-                        StudyUser.site_id == None,
-                        StudyUser.site_id == Timepoint.site_id
-                    )
-                )
-            )
+        query = query.filter(
+            ScanChecklist.user_id == user_id,
+            user_access_scope(
+                user_id,
+                timepoint=Scan.timepoint,
+                study=study_timepoints_table.c.study if study else None,
+                site=Timepoint.site_id))
+
+    if after:
+        query = query.filter(tuple_(Scan.name, Scan.id) > tuple_(*after))
 
-    if sort:
-        query = query.order_by(Scan.name)
+    if sort or after or limit:
+        query = query.order_by(Scan.name, Scan.id)
+
+    if limit:
+        query = query.limit(limit)
 
     # Restrict output values to only needed columns
-    query = query.with_entities(Scan.name, ScanChecklist.approved,
+    query = query.with_entities(Scan.id, Scan.name, ScanChecklist.approved,
                                 ScanChecklist.comment)
-    output = [
-        {'name': item[0], 'approved': item[1], 'comment': item[2]}
-        for item in query.all()
-    ]
 
-    return output
+    if stream:
+        return _stream_scan_qc(query)
 
+    return [_scan_qc_record(item) for item in query.all()]
 
-def query_metric_values_byid(**kwargs):
-    """Queries the database for metrics matching the specifications.
-        Arguments are lists of strings containing identifying names
 
-        Example:
-        rows = query_metric_value(Studies=['ANDT','SPINS'],
-                                  ScanTypes=['T1'],
-                                  MetricTypes=['SNR'])
+def _stream_scan_qc(query):
+    for item in query.yield_per(STREAM_BATCH_SIZE):
+        yield _scan_qc_record(item)
 
-    """
-    # convert the argument keys to lowercase
-    kwargs = {k.lower(): v for k, v in kwargs.items()}
 
-    filters = {
-        'studies': 'Study.id',
-        'sites': 'Site.id',
-        'sessions': 'Session.id',
-        'scans': 'Scan.id',
-        'scantypes': 'ScanType.id',
-        'metrictypes': 'MetricType.id'
+def _scan_qc_record(row):
+    return {
+        'id': row[0],
+        'name': row[1],
+        'approved': row[2],
+        'comment': row[3]
     }
 
-    arg_keys = set(kwargs.keys())
 
-    bad_keys = arg_keys - set(filters.keys())
-    good_keys = arg_keys & set(filters.keys())
+# The fields returned by get_metric_values, in the order they're selected
+METRIC_FIELDS = [
+    'value', 'metrictype', 'metrictype_id', 'scan_id', 'scan_name',
+    'scan_description', 'scantype', 'session_name', 'session_num',
+    'site_name', 'study_name'
+]
 
-    if bad_keys:
-        logger.warning(
-            'Ignoring invalid filter keys provided:{}'.format(bad_keys))
-
-    q = db.session.query(MetricValue)
-    q = q.join(MetricType, MetricValue.metrictype)
-    q = q.join(Scan, MetricValue.scan)
-    q = q.join(ScanType, Scan.scantype)
-    q = q.join(Session_Scan, Scan.sessions)
-    q = q.join(Session, Session_Scan.session)
-    q = q.join(Site, Session.site)
-    q = q.join(Study, Session.study)
-    q = q.filter(Scan.bl_comment == None)  # noqa: E711
 
-    for key in good_keys:
-        if kwargs[key]:
-            q = q.filter(eval(filters[key]).in_(kwargs[key]))
-    q = q.order_by(Session.name)
-    logger.debug('Query string: {}'.format(str(q)))
+def get_metric_values(studies=None, sites=None, sessions=None, scans=None,
+                      scantypes=None, metrictypes=None, isphantom=None,
+                      byname=False, include_blacklisted=False,
+                      as_array=False, user_id=None):
+    """Get the QC metric values matching the given search terms.
 
-    result = q.all()
+    Everything needed is selected in a single joined query and the results
+    are returned column-wise, which is much cheaper to build and serialize
+    than one dictionary per value.
 
-    return (result)
+    Args:
+        studies (list(str), optional): Study IDs to restrict the search to.
+        sites (list(str), optional): Site names to restrict the search to.
+        sessions (list(str), optional): Session (timepoint) names to
+            restrict the search to.
+        scans (list, optional): Scan IDs (or names, if byname is set) to
+            restrict the search to.
+        scantypes (list(str), optional): Scan tags to restrict the search
+            to.
+        metrictypes (list, optional): Metric type IDs (or names, if byname
+            is set) to restrict the search to.
+        isphantom (bool, optional): If given, restrict the search to only
+            phantoms (True) or only human data (False).
+        byname (bool, optional): Whether scans and metric types are
+            given by name instead of by ID. Defaults to False.
+        include_blacklisted (bool, optional): Whether to include values
+            from scans that failed QC review. Defaults to False.
+        as_array (bool, optional): Whether to return the 'value' column as
+            a NumPy array built straight from the typed 'numbers' column.
+            Only possible when every value found is numeric, has been
+            backfilled, and all values are the same length. Defaults to
+            False.
+        user_id (int, optional): The ID of a valid user. If this is given
+            only values from the studies and sites the user has access to
+            will be returned. Defaults to None.
 
+    Raises:
+        InvalidDataException: If as_array is set and the values found can't
+            be converted to an array.
 
-def query_metric_values_byname(**kwargs):
-    """Queries the database for metrics matching the specifications.
-        Arguments are lists of strings containing identifying names
+    Returns:
+        dict: A dictionary mapping each field name in METRIC_FIELDS to a
+            list of values. Every list has one entry per metric value
+            found, so row i is made of the i-th entry of each list.
+    """
+    query = _metric_values_query(
+        studies=studies, sites=sites, sessions=sessions, scans=scans,
+        scantypes=scantypes, metrictypes=metrictypes, isphantom=isphantom,
+        byname=byname, include_blacklisted=include_blacklisted,
+        user_id=user_id)
+    return _metric_columns(db.session.execute(query).all(), as_array)
 
-        Example:
-        rows = query_metric_value(Studies=['ANDT','SPINS'],
-                                  ScanTypes=['T1'],
-                                  MetricTypes=['SNR'])
 
-    """
-    # convert the argument keys to lowercase
-    kwargs = {k.lower(): v for k, v in kwargs.items()}
+def stream_metric_values(batch_size=STREAM_BATCH_SIZE, **kwargs):
+    """Get QC metric values from a server side cursor in batches.
 
-    filters = {
-        'studies': 'Study.nickname',
-        'sites': 'Site.name',
-        'sessions': 'Session.name',
-        'scans': 'Scan.name',
-        'scantypes': 'ScanType.name',
-        'metrictypes': 'MetricType.name',
-        'isphantom': 'Session.is_phantom'
-    }
+    Accepts the same search terms as get_metric_values.
 
-    arg_keys = set(kwargs.keys())
+    Args:
+        batch_size (int, optional): The number of values to fetch at once.
+        **kwargs: Search terms to pass to get_metric_values.
 
-    bad_keys = arg_keys - set(filters.keys())
-    good_keys = arg_keys & set(filters.keys())
+    Yields:
+        dict: A dictionary of columns, in the format returned by
+            get_metric_values, for each batch of values.
+    """
+    query = _metric_values_query(**kwargs) \
+        .execution_options(yield_per=batch_size)
+    for batch in db.session.execute(query).partitions():
+        yield _metric_columns(batch)
+
+
+def _metric_values_query(studies=None, sites=None, sessions=None, scans=None,
+                         scantypes=None, metrictypes=None, isphantom=None,
+                         byname=False, include_blacklisted=False,
+                         user_id=None):
+    query = select(
+        MetricValue.numbers,
+        MetricValue._value,
+        Metrictype.name,
+        Metrictype.id,
+        Scan.id,
+        Scan.name,
+        Scan.description,
+        Scan.tag,
+        Scan.timepoint,
+        Scan.repeat,
+        Timepoint.site_id,
+        study_timepoints_table.c.study
+    ).join(Metrictype, MetricValue.metrictype_id == Metrictype.id) \
+        .join(Scan, MetricValue.scan_id == Scan.id) \
+        .join(Timepoint, Scan.timepoint == Timepoint.name) \
+        .join(study_timepoints_table,
+              study_timepoints_table.c.timepoint == Timepoint.name)
+
+    if not include_blacklisted:
+        query = query \
+            .outerjoin(ScanChecklist, ScanChecklist.scan_id == Scan.id) \
+            .where(ScanChecklist.approved.isnot(False))
+
+    filters = [
+        (studies, study_timepoints_table.c.study),
+        (sites, Timepoint.site_id),
+        (sessions, Scan.timepoint),
+        (scans, Scan.name if byname else Scan.id),
+        (scantypes, Scan.tag),
+        (metrictypes, Metrictype.name if byname else Metrictype.id)
+    ]
+    for values, column in filters:
+        if values:
+            if not isinstance(values, (list, tuple, set)):
+                values = [values]
+            query = query.where(column.in_(values))
+
+    if isphantom is not None:
+        query = query.where(Timepoint.is_phantom == isphantom)
+
+    query = query.where(user_access_scope(
+        user_id,
+        study=study_timepoints_table.c.study,
+        site=Timepoint.site_id))
+
+    # A timepoint shared by several studies joins to one row per study, so
+    # only the first study found is kept for each value
+    order = [Scan.timepoint, Scan.repeat, Scan.id, MetricValue.id]
+    return query.distinct(*order) \
+        .order_by(*order, study_timepoints_table.c.study)
+
+
+def _metric_columns(rows, as_array=False):
+    # The first two columns selected are the typed and text values, which
+    # are combined into the single 'value' field
+    if rows:
+        columns = [list(column) for column in zip(*rows)]
+    else:
+        columns = [[] for _ in range(len(METRIC_FIELDS) + 1)]
+    numbers, raw = columns.pop(0), columns.pop(0)
+    if as_array:
+        values = MetricValue.to_array(numbers)
+    else:
+        values = MetricValue.decode_all(raw, numbers)
+    return dict(zip(METRIC_FIELDS, [values] + columns))
 
-    if bad_keys:
-        logger.warning(
-            'Ignoring invalid filter keys provided:{}'.format(bad_keys))
-
-    q = db.session.query(MetricValue)
-    q = q.join(MetricType, MetricValue.metrictype)
-    q = q.join(Scan, MetricValue.scan)
-    q = q.join(ScanType, Scan.scantype)
-    q = q.join(Session_Scan, Scan.sessions)
-    q = q.join(Session, Session_Scan.session)
-    q = q.join(Site, Session.site)
-    q = q.join(Study, Session.study)
-    q = q.filter(Scan.bl_comment == None)  # noqa: E711
 
-    for key in good_keys:
-        q = q.filter(eval(filters[key]).in_(kwargs[key]))
+# The fields returned by get_metric_summaries, in the order they're selected
+METRIC_SUMMARY_FIELDS = [
+    'study_name', 'site_name', 'scantype', 'metrictype', 'metrictype_id',
+    'is_phantom', 'count', 'mean', 'std', 'min', 'max', 'quantiles'
+]
 
-    q = q.order_by(Session.name)
 
-    logger.debug('Query string: {}'.format(str(q)))
+def get_metric_summaries(studies=None, sites=None, scantypes=None,
+                         metrictypes=None, isphantom=None, byname=False,
+                         user_id=None):
+    """Get the precomputed summary statistics for QC metrics.
 
-    result = q.all()
+    Args:
+        studies (list(str), optional): Study IDs to restrict the search to.
+        sites (list(str), optional): Site names to restrict the search to.
+        scantypes (list(str), optional): Scan tags to restrict the search
+            to.
+        metrictypes (list, optional): Metric type IDs (or names, if byname
+            is set) to restrict the search to.
+        isphantom (bool, optional): If given, restrict the search to only
+            phantoms (True) or only human data (False).
+        byname (bool, optional): Whether metric types are given by name
+            instead of by ID. Defaults to False.
+        user_id (int, optional): The ID of a valid user. If this is given
+            only summaries for the studies and sites the user has access to
+            will be returned. Defaults to None.
 
-    return (result)
+    Returns:
+        dict: A dictionary mapping each field name in METRIC_SUMMARY_FIELDS
+            to a list of values, one entry per summary. The 'quantiles'
+            entries are lists matching MetricSummary.QUANTILES.
+    """
+    query = select(
+        MetricSummary.study_id,
+        MetricSummary.site_id,
+        MetricSummary.scantype_id,
+        Metrictype.name,
+        MetricSummary.metrictype_id,
+        MetricSummary.is_phantom,
+        MetricSummary.count,
+        MetricSummary.mean,
+        MetricSummary.std,
+        MetricSummary.minimum,
+        MetricSummary.maximum,
+        MetricSummary.quantiles
+    ).join(Metrictype, Metrictype.id == MetricSummary.metrictype_id)
+
+    filters = [
+        (studies, MetricSummary.study_id),
+        (sites, MetricSummary.site_id),
+        (scantypes, MetricSummary.scantype_id),
+        (metrictypes, Metrictype.name if byname else Metrictype.id)
+    ]
+    for values, column in filters:
+        if values:
+            if not isinstance(values, (list, tuple, set)):
+                values = [values]
+            query = query.where(column.in_(values))
+
+    if isphantom is not None:
+        query = query.where(MetricSummary.is_phantom == isphantom)
+
+    query = query.where(user_access_scope(user_id,
+                                          study=MetricSummary.study_id,
+                                          site=MetricSummary.site_id))
+
+    query = query.order_by(MetricSummary.study_id, MetricSummary.site_id,
+                           MetricSummary.scantype_id, Metrictype.name,
+                           MetricSummary.is_phantom)
+
+    rows = db.session.execute(query).all()
+    if rows:
+        columns = [list(column) for column in zip(*rows)]
+    else:
+        columns = [[] for _ in METRIC_SUMMARY_FIELDS]
+    return dict(zip(METRIC_SUMMARY_FIELDS, columns))
 
 
 def query_metric_types(**kwargs):
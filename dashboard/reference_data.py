@@ -0,0 +1,246 @@
+"""An in-process cache of the small tables describing how studies are set up.
+
+Studies, sites, study sites, alternate study codes, scan types, expected
+scans and REDCap configurations rarely change but are looked up constantly
+(e.g. on every REDCap data entry trigger). Each process keeps an immutable
+snapshot of them, loaded on first use.
+
+Whenever a session commits changes to any of these records it sends a
+postgres NOTIFY. Every process LISTENs on a background connection and drops
+its snapshot when notified, so changes made by bin/parse_config.py or the
+admin views are seen everywhere. Changes made with raw SQL or bulk
+update()/delete() statements bypass the session and won't be noticed until
+the process restarts.
+"""
+import os
+import logging
+import select
+import threading
+import time
+from collections import namedtuple
+from itertools import chain
+from types import MappingProxyType
+
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session as OrmSession
+
+from dashboard import db
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'dashboard_reference_data'
+
+# How long (in seconds) the listener waits on the connection before checking
+# again, and how long it waits before reconnecting after an error.
+LISTEN_TIMEOUT = 60
+RETRY_DELAY = 10
+
+_snapshot = None
+_generation = 0
+_lock = threading.Lock()
+_listener_pid = None
+
+
+def _cached_models():
+    from dashboard.models import (Study, Site, StudySite, AltStudyCode,
+                                  Scantype, ExpectedScan, RedcapConfig)
+    return (Study, Site, StudySite, AltStudyCode, Scantype, ExpectedScan,
+            RedcapConfig)
+
+
+class ReferenceData:
+    """A read-only snapshot of the reference tables.
+
+    Each record is stored as a named tuple with one field per column
+    attribute of the model (minus any leading underscores), not as a
+    database model instance.
+    """
+
+    def __init__(self, session):
+        (Study, Site, StudySite, AltStudyCode, Scantype, ExpectedScan,
+         RedcapConfig) = _cached_models()
+
+        self.studies = self._index(session, Study, 'id')
+        self.sites = self._index(session, Site, 'name')
+        self.study_sites = self._index(session, StudySite, 'study_id',
+                                       'site_id')
+        self.scantypes = self._index(session, Scantype, 'tag')
+        self.redcap_configs = self._index(session, RedcapConfig, 'id')
+
+        codes = {}
+        for row in self.study_sites.values():
+            if row.code:
+                codes.setdefault(row.code, set()).add(
+                    (row.study_id, row.site_id))
+        for row in self._load(session, AltStudyCode):
+            codes.setdefault(row.code, set()).add((row.study_id, row.site_id))
+        self._codes = MappingProxyType(
+            {code: frozenset(pairs) for code, pairs in codes.items()})
+
+        expected = {}
+        for row in self._load(session, ExpectedScan):
+            expected.setdefault((row.study_id, row.site_id), {})[
+                row.scantype_id] = row
+        self.expected_scans = MappingProxyType({
+            key: MappingProxyType(scans) for key, scans in expected.items()
+        })
+
+        redcap = {}
+        for row in self.redcap_configs.values():
+            redcap.setdefault((row.project, row.url, row.instrument),
+                              []).append(row.id)
+        self._redcap = MappingProxyType(
+            {key: tuple(ids) for key, ids in redcap.items()})
+
+    def find_studies(self, tag=None, site=None):
+        """Find the IDs of studies that use a study code and/or site.
+
+        Args:
+            tag (str, optional): A study code (or alternate code), as found
+                in the first part of datman style subject IDs.
+            site (str, optional): A site name.
+
+        Returns:
+            list: A sorted list of matching study IDs.
+        """
+        if tag:
+            pairs = self._codes.get(tag, frozenset())
+        else:
+            pairs = self.study_sites.keys()
+        return sorted({study for study, study_site in pairs
+                       if not site or study_site == site})
+
+    def find_redcap_configs(self, project, url, instrument):
+        """Get the IDs of REDCap configurations for a project's instrument.
+        """
+        try:
+            project = int(project)
+        except (TypeError, ValueError):
+            return ()
+        return self._redcap.get((project, url, instrument), ())
+
+    def _index(self, session, model, *keys):
+        rows = {}
+        for row in self._load(session, model):
+            key = tuple(getattr(row, name) for name in keys)
+            rows[key if len(key) > 1 else key[0]] = row
+        return MappingProxyType(rows)
+
+    def _load(self, session, model):
+        keys = [attr.key for attr in inspect(model).column_attrs
+                if not attr.deferred]
+        record = namedtuple(model.__name__, [key.lstrip('_') for key in keys])
+        columns = [getattr(model, key) for key in keys]
+        return [record(*row) for row in session.execute(db.select(*columns))]
+
+
+def get():
+    """Get this process's snapshot of the reference tables.
+
+    Returns:
+        :obj:`ReferenceData`: The current snapshot. Load it again with
+            get() rather than holding on to it, it's replaced when the
+            records change.
+    """
+    global _snapshot
+    snapshot = _snapshot
+    if snapshot is not None:
+        return snapshot
+
+    if current_app.config.get('REFERENCE_DATA_LISTEN', True):
+        _start_listener()
+
+    generation = _generation
+    snapshot = ReferenceData(db.session)
+    with _lock:
+        # Don't keep it if the records changed while it was loading
+        if generation == _generation:
+            _snapshot = snapshot
+    return snapshot
+
+
+def invalidate():
+    """Drop the current snapshot so it's reloaded the next time it's used.
+    """
+    global _snapshot, _generation
+    with _lock:
+        _generation += 1
+        _snapshot = None
+
+
+def _start_listener():
+    global _listener_pid
+    # Workers are often forked from a parent process, which doesn't pass
+    # its threads on. So each process (rather than the module) needs one.
+    with _lock:
+        if _listener_pid == os.getpid():
+            return
+        _listener_pid = os.getpid()
+    thread = threading.Thread(target=_listen,
+                              args=(db.engine,),
+                              name='reference-data-listener',
+                              daemon=True)
+    thread.start()
+
+
+def _listen(engine):
+    while True:
+        connection = None
+        try:
+            pool_connection = engine.raw_connection()
+            connection = pool_connection.driver_connection
+            # Keep this connection out of the pool, it's only for listening
+            pool_connection.detach()
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute('LISTEN {}'.format(CHANNEL))
+            # Anything could have changed while we weren't listening
+            invalidate()
+
+            while True:
+                ready, _, _ = select.select([connection], [], [],
+                                            LISTEN_TIMEOUT)
+                if not ready:
+                    continue
+                connection.poll()
+                if connection.notifies:
+                    connection.notifies.clear()
+                    invalidate()
+        except Exception as e:
+            logger.error("Reference data listener failed, retrying in {}s. "
+                         "Reason - {}".format(RETRY_DELAY, e))
+            invalidate()
+            time.sleep(RETRY_DELAY)
+        finally:
+            if connection is not None:
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+
+
+@event.listens_for(OrmSession, 'after_flush')
+def _notify_changes(session, flush_context):
+    if session.info.get('reference_data_changed'):
+        return
+    models = _cached_models()
+    changed = chain(session.new, session.dirty, session.deleted)
+    if not any(isinstance(record, models) for record in changed):
+        return
+    # NOTIFY is transactional, so other processes hear about it on commit
+    session.connection().exec_driver_sql("NOTIFY {}".format(CHANNEL))
+    session.info['reference_data_changed'] = True
+
+
+@event.listens_for(OrmSession, 'after_commit')
+def _changes_committed(session):
+    if session.info.pop('reference_data_changed', False):
+        invalidate()
+
+
+@event.listens_for(OrmSession, 'after_rollback')
+def _changes_discarded(session):
+    # The snapshot may have been loaded from the flushed changes
+    if session.info.pop('reference_data_changed', False):
+        invalidate()
@@ -0,0 +1,187 @@
+"""Bulk loads the JSON sidecars of a study's scans into the database.
+
+:obj:`dashboard.models.Scan.add_json` reads, stats and commits one sidecar at
+a time. Here a study's nii folder is listed and read with a pool of threads
+(the work is almost all waiting on the file system), the files are parsed in
+a pool of processes and the scans are then updated in batches. Sidecars that
+haven't changed since they were loaded are skipped without being read.
+"""
+import os
+import json
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime, timezone
+
+from datman.scanid import parse_filename, ParseException
+
+import dashboard.datman_utils as dm_utils
+from dashboard.models import Scan
+
+logger = logging.getLogger(__name__)
+
+READ_THREADS = 8
+PARSE_CHUNK_SIZE = 32
+
+Sidecar = namedtuple("Sidecar", "scan_name path ctime")
+
+
+def load_sidecars(study_id, threads=READ_THREADS, processes=None,
+                  force=False, batch_size=None):
+    """Load the JSON sidecars of every scan in a study.
+
+    Args:
+        study_id (str): A study ID.
+        threads (int, optional): The number of threads used to list and
+            read files. Defaults to READ_THREADS.
+        processes (int, optional): The number of processes used to parse
+            the files. Defaults to the number of CPUs. If 0, files are
+            parsed in this process.
+        force (bool, optional): Whether to load every sidecar, even those
+            that haven't changed since they were last loaded. Defaults to
+            False.
+        batch_size (int, optional): The number of scans to update per
+            transaction. Defaults to
+            :obj:`dashboard.models.Scan.JSON_BATCH_SIZE`.
+
+    Raises:
+        InvalidDataException: If the scans can't be updated.
+
+    Returns:
+        int: The number of scans updated.
+    """
+    nii_path = dm_utils.get_nii_path(study_id)
+    if not nii_path:
+        return 0
+
+    scans = Scan.get_json_info(study_id)
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        sidecars = [
+            sidecar for sidecar in find_sidecars(nii_path, pool)
+            if sidecar.scan_name in scans
+            and (force or is_modified(sidecar, scans[sidecar.scan_name]))
+        ]
+        logger.debug("{} of {}'s sidecars need to be loaded".format(
+            len(sidecars), study_id))
+        raw = list(pool.map(_read_file, [item.path for item in sidecars]))
+
+    records = []
+    for sidecar, contents in zip(sidecars, parse_all(raw, processes)):
+        if contents is None:
+            logger.error("Ignoring unreadable JSON sidecar {}".format(
+                sidecar.path))
+            continue
+        records.append({
+            "id": scans[sidecar.scan_name][0],
+            "json_path": sidecar.path,
+            "json_contents": contents,
+            "json_created": datetime.fromtimestamp(sidecar.ctime,
+                                                   timezone.utc)
+        })
+
+    return Scan.bulk_add_json(records, batch_size=batch_size)
+
+
+def find_sidecars(nii_path, pool):
+    """Find the JSON sidecars in each of a study's timepoint folders.
+
+    Args:
+        nii_path (str): The full path to a study's nii folder.
+        pool (:obj:`concurrent.futures.Executor`): The pool to list each
+            timepoint folder with.
+
+    Returns:
+        list: A :obj:`Sidecar` for each file whose name is a valid scan
+            name. If more than one sidecar is found for a scan, only the
+            last (by path) is returned.
+    """
+    try:
+        with os.scandir(nii_path) as entries:
+            folders = [entry.path for entry in entries if entry.is_dir()]
+    except FileNotFoundError:
+        return []
+
+    found = {}
+    for listing in pool.map(_list_folder, sorted(folders)):
+        for path, ctime in listing:
+            try:
+                _, _, _, description = parse_filename(path)
+            except ParseException:
+                logger.debug("Ignoring JSON file with invalid name "
+                             "{}".format(path))
+                continue
+            scan_name = os.path.basename(path).replace(
+                f"{description}.json", "").strip("_")
+            found[scan_name] = Sidecar(scan_name, path, ctime)
+    return list(found.values())
+
+
+def is_modified(sidecar, recorded):
+    """Check whether a sidecar differs from the one loaded for its scan.
+
+    Args:
+        sidecar (:obj:`Sidecar`): A sidecar found on disk.
+        recorded (tuple): The scan's ID, json_path and json_created, as
+            given by :obj:`dashboard.models.Scan.get_json_info`.
+
+    Returns:
+        bool: True if the sidecar has a different path or has changed since
+            it was loaded.
+    """
+    _, json_path, json_created = recorded
+    if json_path != sidecar.path or json_created is None:
+        return True
+    # add_json only records timestamps to the second
+    return int(json_created.timestamp()) != int(sidecar.ctime)
+
+
+def parse_all(raw, processes=None):
+    """Parse the contents of many JSON files.
+
+    Args:
+        raw (list): The bytes read from each file. May contain None for
+            files that couldn't be read.
+        processes (int, optional): The number of processes to parse with.
+            Defaults to the number of CPUs. If 0, files are parsed in this
+            process.
+
+    Returns:
+        list: The parsed contents of each file, in the same order, or None
+            for any that couldn't be read or parsed.
+    """
+    if not raw:
+        return []
+    if processes == 0:
+        return [_parse(item) for item in raw]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(_parse, raw, chunksize=PARSE_CHUNK_SIZE))
+
+
+def _list_folder(folder):
+    found = []
+    try:
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.name.endswith(".json"):
+                    found.append((entry.path, entry.stat().st_ctime))
+    except OSError as e:
+        logger.error("Failed to list {}. Reason - {}".format(folder, e))
+    return found
+
+
+def _read_file(path):
+    try:
+        with open(path, "rb") as fh:
+            return fh.read()
+    except OSError as e:
+        logger.error("Failed to read {}. Reason - {}".format(path, e))
+        return None
+
+
+def _parse(raw):
+    if raw is None:
+        return None
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return None
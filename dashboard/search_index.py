@@ -0,0 +1,217 @@
+"""An in-memory prefix index to suggest completions for the search bar.
+
+Each worker keeps its own copy of the index. It's loaded from the database
+by :func:`start` when the worker starts and then updated by the models as
+timepoints, sessions and scans are added. Records added by other processes
+(e.g. datman) are picked up when a background thread reloads it, so serving
+a suggestion never has to wait on the database.
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+Entry = namedtuple('Entry',
+                   ['key', 'name', 'kind', 'timepoint', 'num', 'scan_id'])
+
+
+def session_name(timepoint, num):
+    return '{}_{:02d}'.format(timepoint, num)
+
+
+class PrefixIndex:
+    """A sorted array of upper cased names that can be searched by prefix.
+    """
+
+    def __init__(self):
+        self.built = None
+        self._entries = []
+        self._studies = {}
+        self._lock = threading.Lock()
+
+    def load(self, timepoints, sessions, scans):
+        """Replace the contents of the index.
+
+        Args:
+            timepoints (:obj:`list`): (name, site, study) tuples for every
+                timepoint. A timepoint belonging to more than one study
+                should appear once per study.
+            sessions (:obj:`list`): (timepoint, num) tuples for every session.
+            scans (:obj:`list`): (id, name, bids_name, timepoint, num) tuples
+                for every scan.
+        """
+        studies = {}
+        entries = []
+        for name, site, study in timepoints:
+            studies.setdefault(name, (site, []))[1].append(study)
+            entries.append(self._make_entry(name, 'subject', name))
+        for timepoint, num in sessions:
+            entries.append(self._make_entry(
+                session_name(timepoint, num), 'session', timepoint, num))
+        for scan_id, name, bids_name, timepoint, num in scans:
+            entries.append(
+                self._make_entry(name, 'scan', timepoint, num, scan_id))
+            if bids_name:
+                entries.append(self._make_entry(
+                    bids_name, 'scan', timepoint, num, scan_id))
+
+        for _, study_ids in studies.values():
+            study_ids.sort()
+        entries = sorted(set(entries))
+
+        with self._lock:
+            self._entries = entries
+            self._studies = studies
+            self.built = time.monotonic()
+        logger.info("Search index loaded with {} entries.".format(
+            len(entries)))
+
+    def add_timepoint(self, name, site, study):
+        if self.built is None:
+            return
+        with self._lock:
+            _, study_ids = self._studies.setdefault(name, (site, []))
+            if study not in study_ids:
+                study_ids.append(study)
+                study_ids.sort()
+        self._add(self._make_entry(name, 'subject', name))
+
+    def add_session(self, timepoint, num):
+        if self.built is None:
+            return
+        self._add(self._make_entry(
+            session_name(timepoint, num), 'session', timepoint, num))
+
+    def add_scan(self, scan_id, name, timepoint, num):
+        if self.built is None:
+            return
+        self._add(self._make_entry(name, 'scan', timepoint, num, scan_id))
+
+    def complete(self, prefix, limit=10, has_access=None):
+        """Find the names that start with the given prefix.
+
+        Args:
+            prefix (str): The start of a subject, session or scan name. This
+                is not case sensitive.
+            limit (int, optional): The maximum number of matches to return.
+                Defaults to 10.
+            has_access (callable, optional): A function that accepts a study
+                and site ID and returns True if the match should be included
+                (e.g. a user's has_study_access method). Defaults to None
+                (include everything).
+
+        Returns:
+            list: (:obj:`Entry`, study ID) tuples, in alphabetical order.
+        """
+        key = prefix.strip().upper()
+        if not key:
+            return []
+
+        entries = self._entries
+        pos = bisect_left(entries, (key,))
+        found = []
+        while pos < len(entries) and len(found) < limit:
+            entry = entries[pos]
+            pos += 1
+            if not entry.key.startswith(key):
+                break
+            study = self._find_study(entry.timepoint, has_access)
+            if study:
+                found.append((entry, study))
+        return found
+
+    def _find_study(self, timepoint, has_access):
+        try:
+            site, study_ids = self._studies[timepoint]
+        except KeyError:
+            return None
+        for study in study_ids:
+            if has_access is None or has_access(study, site):
+                return study
+        return None
+
+    def _add(self, entry):
+        with self._lock:
+            entries = self._entries
+            pos = bisect_left(entries, entry)
+            if pos < len(entries) and entries[pos] == entry:
+                return
+            insort(entries, entry)
+
+    def _make_entry(self, name, kind, timepoint, num=None, scan_id=None):
+        return Entry(name.upper(), name, kind, timepoint, num, scan_id)
+
+
+def start(app):
+    """Load this process's index and keep reloading it in the background.
+
+    This should be called once as each web server worker starts, before it
+    handles any requests. The index is reloaded every SEARCH_INDEX_MAX_AGE
+    seconds (never, if it's 0). A process forked after this keeps the loaded
+    index but starts its own reload thread, since threads don't survive a
+    fork.
+
+    Args:
+        app (:obj:`flask.Flask`): The app whose database should be indexed.
+    """
+    global _app
+    if _app is None:
+        os.register_at_fork(after_in_child=_start_reloading)
+    _app = app
+    _load(app)
+    _start_reloading()
+
+
+def stop(timeout=None):
+    """Stop this process's reload thread, if it has one.
+
+    Args:
+        timeout (float, optional): The most seconds to wait for the thread
+            to finish. Defaults to None (wait until it's done).
+    """
+    global _reloader_pid
+    if _reloader_pid != os.getpid():
+        return
+    _reloader_pid = None
+    _stopping.set()
+    _reloader.join(timeout)
+
+
+def _start_reloading():
+    global _reloader, _reloader_pid, _stopping
+    max_age = _app.config.get('SEARCH_INDEX_MAX_AGE')
+    if not max_age or _reloader_pid == os.getpid():
+        return
+    _reloader_pid = os.getpid()
+    _stopping = threading.Event()
+    _reloader = threading.Thread(target=_reload,
+                                 args=(_app, max_age, _stopping),
+                                 name='search-index-reloader',
+                                 daemon=True)
+    _reloader.start()
+
+
+def _reload(app, max_age, stopping):
+    while not stopping.wait(max_age):
+        _load(app)
+
+
+def _load(app):
+    # Imported here because the queries module needs this one
+    from dashboard.queries import load_search_index
+    with app.app_context():
+        try:
+            load_search_index()
+        except Exception as e:
+            logger.error("Failed to load search index. Reason - {}".format(e))
+
+
+index = PrefixIndex()
+_app = None
+_reloader = None
+_reloader_pid = None
+_stopping = None
@@ -40,6 +40,21 @@ function getQueryParams(element){
   }
 }
 
+//metricDataAsJson returns one list per field, convert to one object per value.
+function toRecords(columns){
+  var fields = Object.keys(columns);
+  var n = fields.length ? columns[fields[0]].length : 0;
+  var records = [];
+  for (var i = 0; i < n; i++){
+    var record = {};
+    fields.forEach(function(field){
+      record[field] = columns[field][i];
+    });
+    records.push(record);
+  }
+  return records;
+};
+
 //In callback function, this[0] is mean, this[1] is stdev, this[2] is number of stdevs to set threshold at
 function notOutlier(element){
   return ((element.value <= this[0] + this[1] * this[2]) && (element.value >= this[0] - this[1] * this[2]));
@@ -57,7 +72,7 @@ function noOutliersPlot(){
       function ( data ) {
         base_element.find('#loading_chart').hide()
         var sum = 0;
-        var dat = data['data'];
+        var dat = toRecords(data['data']);
         var n = dat.length;
 
         dat.forEach(function(entry){
@@ -91,7 +106,8 @@ function updatePlot(){
     //Parse JSON as list of Javascript objects
     $.getJSON( base_url, params,
       function ( data ) {
-        if (data['data'].length == 0){
+        var dat = toRecords(data['data']);
+        if (dat.length == 0){
           base_element.find('#loading_chart').hide()
           document.getElementById('chart').innerHTML = "No data for these settings. Try a different metric type or scan type."
           return;
@@ -99,7 +115,7 @@ function updatePlot(){
         base_element.find('#loading_chart').hide()
         base_element.find('#remove_outliers').show()
         //Draw plot with new data
-        initPlot(base_element.find('#chart')[0], data['data']);
+        initPlot(base_element.find('#chart')[0], dat);
       });
   }
 }
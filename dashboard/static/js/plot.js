@@ -54,7 +54,7 @@ site_scantype_set.forEach(function(site_scantype){
     //add metric value (and subject/session names) to list if it matches combination.
     if (entry_site_scantype == site_scantype) {
       valueList.push(entry.value);
-      subjectList.push(entry.session_id);
+      subjectList.push(entry.session_name);
       sessionNameList.push(entry.session_name);
     }
   } );
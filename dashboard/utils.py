@@ -9,8 +9,10 @@ from urllib.parse import urlparse, urljoin
 from flask_login import current_user
 from flask import flash, url_for, request, redirect
 from werkzeug.routing import RequestRedirect
+from sqlalchemy import and_, select
 
-from .models import Timepoint, Scan, db
+from .models import (Timepoint, Scan, db, study_timepoints_table,
+                     user_access_scope)
 
 logger = logging.getLogger(__name__)
 
@@ -39,15 +41,15 @@ def report_form_errors(form):
 
 
 def get_timepoint(study_id, timepoint_id, current_user):
-    timepoint = db.session.get(Timepoint, timepoint_id)
+    query = select(Timepoint).where(Timepoint.name == timepoint_id)
+    timepoint = db.session.execute(
+        _in_accessible_study(query, study_id, current_user)).scalar()
 
     if timepoint is None:
-        flash("Timepoint {} does not exist".format(timepoint_id))
-        raise RequestRedirect(url_for("main.index"))
-
-    if (not current_user.has_study_access(study_id, timepoint.site_id) or
-            not timepoint.belongs_to(study_id)):
-        flash("Not authorised to view {}".format(timepoint_id))
+        if db.session.get(Timepoint, timepoint_id) is None:
+            flash("Timepoint {} does not exist".format(timepoint_id))
+        else:
+            flash("Not authorised to view {}".format(timepoint_id))
         raise RequestRedirect(url_for("main.index"))
 
     return timepoint
@@ -67,23 +69,67 @@ def get_scan(scan_id, study_id, current_user, fail_url=None):
     if not fail_url:
         fail_url = url_for('main.index')
 
-    scan = db.session.get(Scan, scan_id)
+    query = select(Scan)\
+        .join(Timepoint, Timepoint.name == Scan.timepoint)\
+        .where(Scan.id == scan_id)
+    scan = db.session.execute(
+        _in_accessible_study(query, study_id, current_user)).scalar()
 
     if scan is None:
-        logger.error("User {} attempted to retrieve scan with ID {}. "
-                     "Retrieval failed.".format(current_user, scan_id))
-        flash("Scan does not exist.")
-        raise RequestRedirect(fail_url)
-
-    timepoint = scan.session.timepoint
-    if (not current_user.has_study_access(study_id, timepoint.site_id) or
-            not timepoint.belongs_to(study_id)):
-        flash("Not authorized to view {}".format(scan.name))
+        scan = db.session.get(Scan, scan_id)
+        if scan is None:
+            logger.error("User {} attempted to retrieve scan with ID {}. "
+                         "Retrieval failed.".format(current_user, scan_id))
+            flash("Scan does not exist.")
+        else:
+            flash("Not authorized to view {}".format(scan.name))
         raise RequestRedirect(fail_url)
 
     return scan
 
 
+def get_scans(scan_ids, current_user, study_id=None):
+    """Get the scans, out of those requested, that a user may access.
+
+    Access is checked for every scan in a single query.
+
+    Args:
+        scan_ids (:obj:`list`): The IDs of the scans to retrieve.
+        current_user (:obj:`dashboard.models.User`): The user requesting
+            the scans.
+        study_id (str, optional): Only return scans from this study.
+            Defaults to None (scans from any study the user can access).
+
+    Returns:
+        dict: The IDs of the scans found mapped to their
+            :obj:`dashboard.models.Scan` records. IDs that don't exist or
+            can't be accessed are left out.
+    """
+    query = select(Scan)\
+        .join(Timepoint, Timepoint.name == Scan.timepoint)\
+        .where(Scan.id.in_(scan_ids))
+    if study_id:
+        query = _in_accessible_study(query, study_id, current_user)
+    else:
+        query = query.where(user_access_scope(current_user.access_scope_id,
+                                              timepoint=Timepoint.name,
+                                              site=Timepoint.site_id))
+    return {scan.id: scan
+            for scan in db.session.execute(query).unique().scalars()}
+
+
+def _in_accessible_study(query, study_id, current_user):
+    """Restrict a query that includes Timepoint to the user's given study.
+    """
+    return query\
+        .join(study_timepoints_table,
+              and_(study_timepoints_table.c.timepoint == Timepoint.name,
+                   study_timepoints_table.c.study == study_id))\
+        .where(user_access_scope(current_user.access_scope_id,
+                                 study=study_timepoints_table.c.study,
+                                 site=Timepoint.site_id))
+
+
 def dashboard_admin_required(f):
     """
     Verifies a user is a dashboard admin before granting access
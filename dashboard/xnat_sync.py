@@ -0,0 +1,384 @@
+"""A background worker that pushes QC usability data to XNAT.
+
+Each worker process has one sync thread, started the first time an update is
+queued. Updates are held for a short window so that repeated changes to the
+same series (e.g. a scan approved and then flagged) are only sent once, and
+so that all of an experiment's updates share a single scan lookup. Logged in
+XNAT sessions are kept open and reused for each server. Pushes that fail are
+retried with exponential backoff.
+
+The thread has no application context, so nothing queued here may be (or
+hold) a database record.
+"""
+import atexit
+import logging
+import threading
+import time
+from urllib.parse import quote, unquote
+
+import xnat
+
+logger = logging.getLogger(__name__)
+
+
+class _Experiment:
+    """The updates waiting to be pushed for one XNAT experiment.
+
+    Attributes:
+        server (tuple): The URL, user and password to connect with.
+        archive (str): The XNAT project that holds the experiment.
+        name (str): The experiment's name on XNAT.
+        updates (dict): Series numbers (as strings) mapped to a
+            (comment, quality, queued) tuple, where 'queued' is the
+            monotonic time the series was first queued.
+        due (float): The monotonic time the updates should be pushed.
+        attempts (int): The number of failed attempts to push the updates.
+    """
+
+    def __init__(self, server, archive, name, due):
+        self.server = server
+        self.archive = archive
+        self.name = name
+        self.updates = {}
+        self.due = due
+        self.attempts = 0
+
+
+class XnatSyncWorker:
+    """Push usability updates to XNAT from a background thread.
+
+    Args:
+        window (float, optional): The number of seconds to wait for more
+            updates to an experiment before pushing them. Defaults to 5.
+        max_pending (int, optional): The most series updates that may wait
+            to be pushed. Updates queued while it's full are dropped.
+            Defaults to 1000.
+        retries (int, optional): The number of times to retry a failed push.
+            Defaults to 5.
+        backoff (float, optional): The number of seconds to wait before the
+            first retry. The wait doubles for each retry after. Defaults
+            to 10.
+        idle_timeout (float, optional): The number of seconds an XNAT
+            session may go unused before it's closed. Defaults to 300.
+        connect (callable, optional): The function to open an XNAT session
+            with. It's given the server URL, user and password. Defaults to
+            a model-less :func:`xnat.connect`.
+    """
+
+    def __init__(self, window=5, max_pending=1000, retries=5, backoff=10,
+                 idle_timeout=300, connect=None):
+        self.window = window
+        self.max_pending = max_pending
+        self.retries = retries
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self._connect = connect or _connect
+        self._pending = {}
+        self._queued = 0
+        self._connections = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._counts = {'pushed': 0, 'coalesced': 0, 'retried': 0,
+                        'failed': 0, 'dropped': 0, 'missing': 0}
+        self._latency = {'last': None, 'max': None, 'total': 0.0}
+
+    def submit(self, xnat_url, user, password, xnat_archive, exp_name,
+               updates):
+        """Queue usability updates for the series of one experiment.
+
+        Args:
+            xnat_url (str): The full URL to use for the XNAT server.
+            user (str): The user to log in as.
+            password (str): The password to log in with.
+            xnat_archive (str): The name of the XNAT archive that contains
+                the experiment.
+            exp_name (str): The name of the experiment on XNAT.
+            updates (:obj:`list`): A tuple for each series to update, holding
+                its series number, the user's QC comment and the quality
+                label to apply.
+
+        Returns:
+            bool: True if the updates were queued, False if the queue was
+                full and they were dropped.
+        """
+        key = (xnat_url, xnat_archive, exp_name)
+        now = time.monotonic()
+        with self._cond:
+            experiment = self._pending.get(key)
+            new_series = {str(series) for series, _, _ in updates}
+            if experiment is not None:
+                new_series -= experiment.updates.keys()
+            if self._queued + len(new_series) > self.max_pending:
+                self._counts['dropped'] += len(updates)
+                logger.error(f"XNAT sync queue is full. Usability for "
+                             f"{len(updates)} series of {exp_name} will not "
+                             "be updated.")
+                return False
+
+            if experiment is None:
+                experiment = _Experiment((xnat_url, user, password),
+                                         xnat_archive, exp_name,
+                                         now + self.window)
+                self._pending[key] = experiment
+            experiment.server = (xnat_url, user, password)
+
+            for series, comment, quality in updates:
+                series = str(series)
+                queued = now
+                if series in experiment.updates:
+                    self._counts['coalesced'] += 1
+                    queued = experiment.updates[series][2]
+                experiment.updates[series] = (comment, quality, queued)
+            self._queued += len(new_series)
+
+            self._start()
+            self._cond.notify()
+        return True
+
+    def stop(self, timeout=None):
+        """Push everything still queued, then stop the sync thread.
+
+        Failed pushes aren't retried once the worker is stopping.
+
+        Args:
+            timeout (float, optional): The most seconds to wait for the
+                thread to finish. Defaults to None (wait until it's done).
+        """
+        with self._cond:
+            thread = self._thread
+            self._stopping = True
+            self._cond.notify()
+        if thread is not None:
+            thread.join(timeout)
+        with self._cond:
+            self._stopping = False
+
+    def stats(self):
+        """Report the state of the queue and the outcome of past pushes.
+
+        Returns:
+            dict: The number of series updates ('queued') and experiments
+                ('experiments') waiting to be pushed, the open XNAT
+                sessions ('connections'), counts of series updates pushed,
+                coalesced, dropped, failed or not found on XNAT, the number
+                of retried pushes and the seconds between when a series was
+                queued and when it was pushed ('latency': last, max and mean).
+        """
+        with self._cond:
+            pushed = self._counts['pushed']
+            mean = self._latency['total'] / pushed if pushed else None
+            return dict(
+                queued=self._queued,
+                experiments=len(self._pending),
+                connections=len(self._connections),
+                latency={'last': self._latency['last'],
+                         'max': self._latency['max'],
+                         'mean': mean},
+                **self._counts
+            )
+
+    def _start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="xnat-sync",
+                                        daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            due = self._wait()
+            if due is None:
+                break
+            for experiment in due:
+                self._push(experiment)
+            self._close_idle()
+        self._close_all()
+
+    def _wait(self):
+        """Wait for experiments that are due, removing them from the queue.
+
+        Returns None when the worker is stopping and nothing is left.
+        """
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self._stopping:
+                    due = list(self._pending.values())
+                    if not due:
+                        return None
+                else:
+                    due = [exp for exp in self._pending.values()
+                           if exp.due <= now]
+                if due:
+                    break
+                if self._pending:
+                    wait = min(exp.due for exp in self._pending.values()) \
+                        - now
+                else:
+                    wait = self.idle_timeout if self._connections else None
+                if not self._cond.wait(wait) and not self._pending:
+                    return []
+
+            for experiment in due:
+                del self._pending[self._key(experiment)]
+                self._queued -= len(experiment.updates)
+            return due
+
+    def _push(self, experiment):
+        try:
+            xcon = self._get_connection(experiment.server)
+            self._send(xcon, experiment)
+        except Exception as e:
+            self._close(experiment.server)
+            self._retry(experiment, e)
+
+    def _send(self, xcon, experiment):
+        """Apply an experiment's updates using one lookup of its scans.
+
+        Each update is removed from the experiment once it has been sent, so
+        a retry only repeats the ones that didn't go through.
+        """
+        listing = xcon.get_json(
+            f"/data/projects/{experiment.archive}/experiments/"
+            f"{experiment.name}/scans",
+            query={'format': 'json'})
+
+        xnat_scans = {}
+        for item in listing['ResultSet']['Result']:
+            xnat_scans.setdefault(item['ID'], []).append(item)
+
+        for series, (comment, quality, queued) in list(
+                experiment.updates.items()):
+            matched = xnat_scans.get(series, [])
+            if len(matched) != 1:
+                logger.error(f"Couldn't locate series {series} of "
+                             f"{experiment.name} on XNAT server. Usability "
+                             "will not be updated.")
+                del experiment.updates[series]
+                with self._cond:
+                    self._counts['missing'] += 1
+                continue
+
+            xsi_type = matched[0]['xsiType']
+            query = {'xsiType': xsi_type, f'{xsi_type}/quality': quality}
+            if comment:
+                query[f'{xsi_type}/note'] = _safe_comment(comment)
+            xcon.put(matched[0]['URI'], query=query)
+
+            del experiment.updates[series]
+            self._record_push(time.monotonic() - queued)
+
+    def _retry(self, experiment, error):
+        experiment.attempts += 1
+        with self._cond:
+            if self._stopping or experiment.attempts > self.retries:
+                self._counts['failed'] += len(experiment.updates)
+                logger.error(f"Failed to update usability of "
+                             f"{len(experiment.updates)} series of "
+                             f"{experiment.name} on XNAT after "
+                             f"{experiment.attempts} attempt(s). Reason - "
+                             f"{error}")
+                return
+
+            self._counts['retried'] += 1
+            delay = self.backoff * 2 ** (experiment.attempts - 1)
+            logger.warning(f"Failed to update usability of "
+                           f"{experiment.name} on XNAT, retrying in "
+                           f"{delay}s. Reason - {error}")
+
+            key = self._key(experiment)
+            newer = self._pending.get(key)
+            if newer is None:
+                experiment.due = time.monotonic() + delay
+                self._pending[key] = experiment
+                self._queued += len(experiment.updates)
+                return
+
+            # Updates queued since this push started replace the old ones
+            for series, update in experiment.updates.items():
+                if series not in newer.updates:
+                    newer.updates[series] = update
+                    self._queued += 1
+            newer.attempts = max(newer.attempts, experiment.attempts)
+
+    def _record_push(self, latency):
+        with self._cond:
+            self._counts['pushed'] += 1
+            self._latency['last'] = latency
+            self._latency['total'] += latency
+            if self._latency['max'] is None or latency > self._latency['max']:
+                self._latency['max'] = latency
+
+    def _get_connection(self, server):
+        key = server[:2]
+        now = time.monotonic()
+        if key in self._connections:
+            xcon, password, _ = self._connections[key]
+            if password == server[2]:
+                self._connections[key] = (xcon, password, now)
+                return xcon
+            self._close(server)
+        xcon = self._connect(*server)
+        with self._cond:
+            self._connections[key] = (xcon, server[2], now)
+        return xcon
+
+    def _close_idle(self):
+        now = time.monotonic()
+        for key, (_, password, last_used) in list(self._connections.items()):
+            if now - last_used > self.idle_timeout:
+                self._close(key + (password,))
+
+    def _close_all(self):
+        for key, (_, password, _) in list(self._connections.items()):
+            self._close(key + (password,))
+
+    def _close(self, server):
+        with self._cond:
+            found = self._connections.pop(server[:2], None)
+        if found is None:
+            return
+        try:
+            found[0].disconnect()
+        except Exception as e:
+            logger.debug(f"Failed to log out of {server[0]}. Reason - {e}")
+
+    def _key(self, experiment):
+        return (experiment.server[0], experiment.archive, experiment.name)
+
+
+def _connect(xnat_url, user, password):
+    # The data model isn't needed for usability updates and parsing it
+    # takes several requests
+    return xnat.connect(xnat_url, user=user, password=password,
+                        no_parse_model=True)
+
+
+def _safe_comment(comment):
+    # XNAT max comment length is 255 chars
+    if len(quote(comment)) < 255:
+        return comment
+    return unquote(quote(comment)[0:243]) + " [...]"
+
+
+def get_worker(app_config):
+    """Get this process's sync worker, with the app's current settings.
+
+    Args:
+        app_config (:obj:`dict`): Configuration of the current app instance,
+            as retrieved from current_app.config
+
+    Returns:
+        :obj:`XnatSyncWorker`: The worker to queue XNAT updates with.
+    """
+    worker.window = app_config.get('XNAT_SYNC_WINDOW', worker.window)
+    worker.max_pending = app_config.get('XNAT_SYNC_MAX_PENDING',
+                                        worker.max_pending)
+    worker.retries = app_config.get('XNAT_SYNC_RETRIES', worker.retries)
+    worker.backoff = app_config.get('XNAT_SYNC_BACKOFF', worker.backoff)
+    return worker
+
+
+worker = XnatSyncWorker()
+atexit.register(worker.stop, 30)
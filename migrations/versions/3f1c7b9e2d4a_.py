@@ -0,0 +1,64 @@
+"""Add a per-session summary of outstanding QC issues for each study.
+
+Revision ID: 3f1c7b9e2d4a
+Revises: b265c18f529c
+Create Date: 2026-10-18 09:12:31.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import text
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c7b9e2d4a'
+down_revision = 'b265c18f529c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'study_qc_summary',
+        sa.Column('study', sa.String(length=32), nullable=False),
+        sa.Column('name', sa.String(length=64), nullable=False),
+        sa.Column('num', sa.Integer(), nullable=False),
+        sa.Column('is_new', sa.Boolean(), nullable=False),
+        sa.Column('missing_scans', sa.Boolean(), nullable=False),
+        sa.Column('missing_redcap', sa.Boolean(), nullable=False),
+        sa.ForeignKeyConstraint(['study'], ['studies.id'],
+                                ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['name', 'num'],
+                                ['sessions.name', 'sessions.num'],
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('study', 'name', 'num')
+    )
+
+    # Backfill from the existing records. This mirrors
+    # StudyQcSummary._calculate in the models
+    conn = op.get_bind()
+    conn.execute(text(
+        "INSERT INTO study_qc_summary"
+        "    (study, name, num, is_new, missing_scans, missing_redcap)"
+        "  SELECT st.study, s.name, s.num, s.signed_off IS false,"
+        "      (ss.uses_redcap IS true"
+        "       AND sr.record_id IS NOT NULL"
+        "       AND NOT EXISTS (SELECT 1 FROM scans AS sc"
+        "                       WHERE sc.timepoint = s.name"
+        "                         AND sc.session = s.num)"
+        "       AND NOT EXISTS (SELECT 1 FROM empty_sessions AS e"
+        "                       WHERE e.name = s.name AND e.num = s.num)),"
+        "      (ss.uses_redcap IS true AND sr.name IS NULL)"
+        "  FROM sessions AS s"
+        "  JOIN timepoints AS t ON t.name = s.name"
+        "  JOIN study_timepoints AS st ON st.timepoint = t.name"
+        "  LEFT JOIN study_sites AS ss"
+        "      ON ss.study = st.study AND ss.site = t.site"
+        "  LEFT JOIN session_redcap AS sr"
+        "      ON sr.name = s.name AND sr.num = s.num"
+        "  WHERE t.is_phantom = false"
+    ))
+
+
+def downgrade():
+    op.drop_table('study_qc_summary')
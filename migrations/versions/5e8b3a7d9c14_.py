@@ -0,0 +1,74 @@
+"""Add precomputed summary statistics for QC metrics.
+
+Revision ID: 5e8b3a7d9c14
+Revises: c41f0d9e7b25
+Create Date: 2026-10-18 13:41:19.270634
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8b3a7d9c14'
+down_revision = 'c41f0d9e7b25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'metric_summary',
+        sa.Column('study', sa.String(length=32), nullable=False),
+        sa.Column('site', sa.String(length=32), nullable=False),
+        sa.Column('scantype', sa.String(length=64), nullable=False),
+        sa.Column('metrictype', sa.Integer(), nullable=False),
+        sa.Column('is_phantom', sa.Boolean(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column('mean', postgresql.DOUBLE_PRECISION(), nullable=True),
+        sa.Column('std', postgresql.DOUBLE_PRECISION(), nullable=True),
+        sa.Column('min', postgresql.DOUBLE_PRECISION(), nullable=True),
+        sa.Column('max', postgresql.DOUBLE_PRECISION(), nullable=True),
+        sa.Column('quantiles',
+                  postgresql.ARRAY(postgresql.DOUBLE_PRECISION()),
+                  nullable=True),
+        sa.ForeignKeyConstraint(['study'], ['studies.id'],
+                                ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['site'], ['sites.name'],
+                                ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['scantype'], ['scantypes.tag'],
+                                ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['metrictype'], ['metrictypes.id'],
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('study', 'site', 'scantype', 'metrictype',
+                                'is_phantom')
+    )
+
+    # Summarize any values that have already been backfilled. This mirrors
+    # MetricSummary._calculate in the models
+    conn = op.get_bind()
+    conn.execute(text(
+        "INSERT INTO metric_summary"
+        "  SELECT st.study, t.site, s.tag, sm.metric_type, t.is_phantom,"
+        "      count(sm.numbers[1]), avg(sm.numbers[1]),"
+        "      stddev_samp(sm.numbers[1]), min(sm.numbers[1]),"
+        "      max(sm.numbers[1]),"
+        "      percentile_cont("
+        "          CAST(ARRAY[0.05, 0.25, 0.5, 0.75, 0.95]"
+        "               AS DOUBLE PRECISION[])"
+        "      ) WITHIN GROUP (ORDER BY sm.numbers[1])"
+        "  FROM scan_metrics sm"
+        "      JOIN scans s ON s.id = sm.scan_id"
+        "      JOIN timepoints t ON t.name = s.timepoint"
+        "      JOIN study_timepoints st ON st.timepoint = t.name"
+        "      LEFT OUTER JOIN scan_checklist sc ON sc.scan_id = s.id"
+        "  WHERE cardinality(sm.numbers) = 1"
+        "      AND sc.signed_off IS NOT false"
+        "  GROUP BY st.study, t.site, s.tag, sm.metric_type, t.is_phantom"
+    ))
+
+
+def downgrade():
+    op.drop_table('metric_summary')
@@ -0,0 +1,34 @@
+"""Add a typed copy of numeric QC metric values.
+
+Existing rows are left null here so the migration doesn't hold a lock on
+scan_metrics while every row is rewritten. Run bin/backfill_metric_values.py
+afterwards to fill them in.
+
+Revision ID: 8d2e6a41c7f0
+Revises: 3f1c7b9e2d4a
+Create Date: 2026-10-18 11:02:47.913265
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2e6a41c7f0'
+down_revision = '3f1c7b9e2d4a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'scan_metrics',
+        sa.Column('numbers',
+                  postgresql.ARRAY(postgresql.DOUBLE_PRECISION()),
+                  nullable=True)
+    )
+
+
+def downgrade():
+    op.drop_column('scan_metrics', 'numbers')
@@ -0,0 +1,40 @@
+"""Add a local copy of the GitHub issues for each timepoint.
+
+Revision ID: 9c3d5f18b7e2
+Revises: e1b47c0d2a93
+Create Date: 2026-10-18 15:48:12.306719
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c3d5f18b7e2'
+down_revision = 'e1b47c0d2a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'github_issues',
+        sa.Column('timepoint', sa.String(length=64), nullable=False),
+        sa.Column('number', sa.Integer(), nullable=False),
+        sa.Column('title', sa.Text(), nullable=False),
+        sa.Column('body', sa.Text(), nullable=True),
+        sa.Column('state', sa.String(length=16), nullable=False),
+        sa.Column('comments', sa.Integer(), nullable=False),
+        sa.Column('html_url', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('closed_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('timepoint', 'number')
+    )
+    op.create_index('github_issues_number_idx', 'github_issues', ['number'],
+                    unique=False)
+
+
+def downgrade():
+    op.drop_index('github_issues_number_idx', table_name='github_issues')
+    op.drop_table('github_issues')
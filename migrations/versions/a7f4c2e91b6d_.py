@@ -0,0 +1,39 @@
+"""Add trigram indexes for the search bar.
+
+Revision ID: a7f4c2e91b6d
+Revises: 5e8b3a7d9c14
+Create Date: 2026-10-18 14:21:05.118342
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7f4c2e91b6d'
+down_revision = '5e8b3a7d9c14'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('timepoints', 'name'),
+    ('sessions', 'name'),
+    ('scans', 'name'),
+    ('scans', 'bids_name'),
+]
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table, column in INDEXES:
+        op.create_index('{}_{}_trgm_idx'.format(table, column),
+                        table,
+                        [column],
+                        unique=False,
+                        postgresql_using='gin',
+                        postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade():
+    for table, column in INDEXES:
+        op.drop_index('{}_{}_trgm_idx'.format(table, column),
+                      table_name=table)
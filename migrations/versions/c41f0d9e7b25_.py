@@ -0,0 +1,75 @@
+"""Make metric types and metric values unique so they can be upserted.
+
+Duplicate metric types (same name and scan type) are merged into the
+oldest one, then duplicate values for a scan and metric are removed
+keeping only the most recent.
+
+Revision ID: c41f0d9e7b25
+Revises: 8d2e6a41c7f0
+Create Date: 2026-10-18 12:26:05.558190
+
+"""
+from alembic import op
+from sqlalchemy import text
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41f0d9e7b25'
+down_revision = '8d2e6a41c7f0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    conn = op.get_bind()
+    conn.execute(text(
+        "UPDATE scan_metrics AS sm"
+        "  SET metric_type = keep.id"
+        "  FROM metrictypes AS mt, ("
+        "      SELECT min(id) AS id, name, scantype"
+        "      FROM metrictypes"
+        "      GROUP BY name, scantype"
+        "  ) AS keep"
+        "  WHERE sm.metric_type = mt.id"
+        "    AND mt.name = keep.name"
+        "    AND mt.scantype = keep.scantype"
+        "    AND mt.id != keep.id"
+    ))
+    conn.execute(text(
+        "DELETE FROM metrictypes AS mt"
+        "  USING metrictypes AS older"
+        "  WHERE mt.name = older.name"
+        "    AND mt.scantype = older.scantype"
+        "    AND mt.id > older.id"
+    ))
+    conn.execute(text(
+        "DELETE FROM scan_metrics AS sm"
+        "  USING scan_metrics AS newer"
+        "  WHERE sm.scan_id = newer.scan_id"
+        "    AND sm.metric_type = newer.metric_type"
+        "    AND sm.id < newer.id"
+    ))
+
+    op.create_unique_constraint(
+        'metrictypes_name_scantype_key',
+        'metrictypes',
+        ['name', 'scantype']
+    )
+    op.create_unique_constraint(
+        'scan_metrics_scan_id_metric_type_key',
+        'scan_metrics',
+        ['scan_id', 'metric_type']
+    )
+
+
+def downgrade():
+    op.drop_constraint(
+        'scan_metrics_scan_id_metric_type_key',
+        'scan_metrics',
+        type_='unique'
+    )
+    op.drop_constraint(
+        'metrictypes_name_scantype_key',
+        'metrictypes',
+        type_='unique'
+    )
@@ -0,0 +1,38 @@
+"""Add an index of QC manifest contents.
+
+Revision ID: e1b47c0d2a93
+Revises: a7f4c2e91b6d
+Create Date: 2026-10-18 15:02:47.551208
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1b47c0d2a93'
+down_revision = 'a7f4c2e91b6d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'qc_manifests',
+        sa.Column('name', sa.String(length=64), nullable=False),
+        sa.Column('num', sa.Integer(), nullable=False),
+        sa.Column('scan', sa.String(length=128), nullable=False),
+        sa.Column('path', sa.Text(), nullable=False),
+        sa.Column('mtime', sa.BigInteger(), nullable=False),
+        sa.Column('images', postgresql.JSONB(astext_type=sa.Text()),
+                  nullable=False),
+        sa.ForeignKeyConstraint(['name', 'num'],
+                                ['sessions.name', 'sessions.num'],
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('name', 'num', 'scan')
+    )
+
+
+def downgrade():
+    op.drop_table('qc_manifests')
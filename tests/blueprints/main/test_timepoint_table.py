@@ -0,0 +1,39 @@
+import pytest
+from mock import Mock, patch
+
+import dashboard.blueprints.main.views as views
+from dashboard.exceptions import InvalidUsage
+from tests.utils import add_studies
+
+
+class TestTimepointTable:
+
+    def test_sorts_by_requested_column(self, dash_app, study):
+        response = self.get(dash_app, {"order[0][column]": "2"})
+        assert response.get_json()["recordsTotal"] == 0
+
+    def test_negative_sort_column_is_rejected(self, dash_app, study):
+        with pytest.raises(InvalidUsage) as error:
+            self.get(dash_app, {"order[0][column]": "-1"})
+        assert error.value.status_code == 400
+
+    def test_sort_column_past_the_end_is_rejected(self, dash_app, study):
+        with pytest.raises(InvalidUsage) as error:
+            self.get(dash_app, {"order[0][column]": "3"})
+        assert error.value.status_code == 400
+
+    def test_non_numeric_sort_column_is_rejected(self, dash_app, study):
+        with pytest.raises(InvalidUsage) as error:
+            self.get(dash_app, {"order[0][column]": "name"})
+        assert error.value.status_code == 400
+
+    def get(self, app, args):
+        user = Mock(access_scope_id=None)
+        user.has_study_access.return_value = True
+        with app.test_request_context(query_string=args):
+            with patch.object(views, "current_user", user):
+                return views.timepoint_table.__wrapped__("STUDY1")
+
+    @pytest.fixture
+    def study(self, dash_db):
+        return add_studies({"STUDY1": {"CMH": []}})[0]
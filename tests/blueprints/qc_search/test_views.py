@@ -42,6 +42,36 @@ class TestGetTags:
         return tags
 
 
+class TestGenerateCsv:
+
+    def test_header_is_first_line(self):
+        lines = list(views.generate_csv([]))
+        assert lines == ["scan,approved,comment\r\n"]
+
+    def test_yields_one_line_per_record(self):
+        records = [
+            {"id": 1, "name": "STUDY1_CMH_0001_01_01_T1_02",
+             "approved": True, "comment": None},
+            {"id": 2, "name": "STUDY1_CMH_0001_01_01_T2_03",
+             "approved": False, "comment": "bad, really bad"},
+        ]
+        lines = list(views.generate_csv(records))
+        assert lines[1:] == [
+            "STUDY1_CMH_0001_01_01_T1_02,True,\r\n",
+            'STUDY1_CMH_0001_01_01_T2_03,False,"bad, really bad"\r\n'
+        ]
+
+    def test_consumes_records_lazily(self):
+        def records():
+            yield {"id": 1, "name": "scan1", "approved": True,
+                   "comment": None}
+            raise AssertionError("Read past the first record")
+
+        lines = views.generate_csv(records())
+        next(lines)
+        assert next(lines) == "scan1,True,\r\n"
+
+
 @pytest.fixture(autouse=True)
 def records(dash_db):
     """Adds some user records and tags for testing.
@@ -0,0 +1,91 @@
+import pytest
+from mock import patch, Mock
+
+import dashboard.blueprints.scans.utils as utils
+
+
+class TestSendNifti:
+
+    def test_sets_strong_etag_and_last_modified(self, dash_app, nifti):
+        with dash_app.test_request_context("/"):
+            response = utils.send_nifti(nifti, "scan.nii.gz")
+            etag, weak = response.get_etag()
+
+        assert response.status_code == 200
+        assert etag and not weak
+        assert response.last_modified is not None
+        assert response.cache_control.private
+        assert not response.cache_control.public
+
+    def test_unchanged_file_gets_not_modified(self, dash_app, nifti):
+        with dash_app.test_request_context("/"):
+            etag, _ = utils.send_nifti(nifti, "scan.nii.gz").get_etag()
+
+        with dash_app.test_request_context(
+                "/", headers={"If-None-Match": f'"{etag}"'}):
+            response = utils.send_nifti(nifti, "scan.nii.gz")
+        assert response.status_code == 304
+
+    def test_etag_changes_when_file_changes(self, dash_app, nifti):
+        with dash_app.test_request_context("/"):
+            first, _ = utils.send_nifti(nifti, "scan.nii.gz").get_etag()
+
+        with open(nifti, "ab") as fh:
+            fh.write(b"more data")
+
+        with dash_app.test_request_context("/"):
+            second, _ = utils.send_nifti(nifti, "scan.nii.gz").get_etag()
+        assert first != second
+
+    def test_range_request_gets_partial_content(self, dash_app, nifti):
+        with dash_app.test_request_context(
+                "/", headers={"Range": "bytes=0-9"}):
+            response = utils.send_nifti(nifti, "scan.nii.gz")
+
+        assert response.status_code == 206
+        assert response.headers["Content-Range"] == "bytes 0-9/1024"
+        assert response.content_length == 10
+
+    def test_missing_file_raises_os_error(self, dash_app, tmp_path):
+        with dash_app.test_request_context("/"):
+            with pytest.raises(OSError):
+                utils.send_nifti(str(tmp_path / "missing.nii.gz"),
+                                 "missing.nii.gz")
+
+    @pytest.fixture
+    def nifti(self, tmp_path):
+        nifti = tmp_path / "STUDY_SITE_0001_01_01_T1_02_SagT1.nii.gz"
+        nifti.write_bytes(bytes(range(256)) * 4)
+        return str(nifti)
+
+
+class TestGetNiftiPath:
+
+    def test_path_is_reused(self, find_path):
+        scan = Mock(id=1)
+        utils.get_nifti_path(scan)
+        assert utils.get_nifti_path(scan) == "/nii/scan_1.nii.gz"
+        assert find_path.call_count == 1
+
+    def test_expired_path_is_found_again(self, find_path):
+        scan = Mock(id=1)
+        with patch.object(utils, "NIFTI_PATH_TTL", 0):
+            utils.get_nifti_path(scan)
+            utils.get_nifti_path(scan)
+        assert find_path.call_count == 2
+
+    def test_forgotten_path_is_found_again(self, find_path):
+        scan = Mock(id=1)
+        utils.get_nifti_path(scan)
+        utils.forget_nifti_path(scan)
+        utils.get_nifti_path(scan)
+        assert find_path.call_count == 2
+
+    @pytest.fixture
+    def find_path(self):
+        utils._nifti_paths.clear()
+        with patch.object(utils, "find_nifti_path",
+                          side_effect=lambda s: f"/nii/scan_{s.id}.nii.gz"
+                          ) as mock_find:
+            yield mock_find
+        utils._nifti_paths.clear()
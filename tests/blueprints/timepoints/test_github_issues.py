@@ -0,0 +1,199 @@
+import hashlib
+import hmac
+import json
+from datetime import datetime, timezone
+
+import pytest
+from mock import patch, Mock
+
+import dashboard.blueprints.timepoints.utils as utils
+from dashboard.models import GithubIssue
+
+CREATED = datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+
+
+def make_issue(number, title, body=None, updated=CREATED, **kwargs):
+    issue = {
+        "number": number,
+        "title": title,
+        "body": body,
+        "state": "open",
+        "comments": 0,
+        "html_url": f"https://github.com/owner/repo/issues/{number}",
+        "created_at": CREATED,
+        "updated_at": updated,
+        "closed_at": None
+    }
+    issue.update(kwargs)
+    return issue
+
+
+class TestGithubIssue:
+
+    def test_find_timepoints_strips_session_and_scan_parts(self):
+        found = GithubIssue.find_timepoints(
+            "STUDY_CMH_0001_01 - see also STUDY_CMH_0002_01_02.")
+        assert found == {"STUDY_CMH_0001_01", "STUDY_CMH_0002_01"}
+
+    def test_find_timepoints_ignores_other_words(self):
+        assert GithubIssue.find_timepoints("Scanner down for a week") == set()
+        assert GithubIssue.find_timepoints(None) == set()
+
+    def test_issue_stored_under_each_timepoint_mentioned(self, dash_db):
+        GithubIssue.save([
+            make_issue(1, "STUDY_CMH_0001_01 - Bad T1",
+                       body="Same problem as STUDY_CMH_0002_01")
+        ])
+        assert [i.number for i in GithubIssue.find("STUDY_CMH_0001_01")] \
+            == [1]
+        assert [i.number for i in GithubIssue.find("STUDY_CMH_0002_01")] \
+            == [1]
+
+    def test_saving_again_replaces_issue(self, dash_db):
+        GithubIssue.save([make_issue(1, "STUDY_CMH_0001_01 - Bad T1")])
+        GithubIssue.save([make_issue(1, "STUDY_CMH_0002_01 - Bad T1",
+                                     state="closed", closed_at=CREATED)])
+
+        assert GithubIssue.find("STUDY_CMH_0001_01") == []
+        found = GithubIssue.find("STUDY_CMH_0002_01")
+        assert len(found) == 1
+        assert found[0].state == "closed"
+
+    def test_last_updated_gives_latest_update_time(self, dash_db):
+        assert GithubIssue.last_updated() is None
+        later = datetime(2024, 2, 1, tzinfo=timezone.utc)
+        GithubIssue.save([
+            make_issue(1, "STUDY_CMH_0001_01"),
+            make_issue(2, "STUDY_CMH_0002_01", updated=later)
+        ])
+        assert GithubIssue.last_updated() == later
+
+
+class TestSyncIssues:
+
+    def test_only_requests_issues_updated_since_last_sync(
+            self, dash_db, repo):
+        later = datetime(2024, 2, 1, tzinfo=timezone.utc)
+        GithubIssue.save([make_issue(1, "STUDY_CMH_0001_01", updated=later)])
+
+        utils.sync_issues(token="abc")
+
+        options = repo.get_issues.call_args.kwargs
+        assert options["since"] == later
+
+    def test_full_sync_requests_every_issue(self, dash_db, repo):
+        GithubIssue.save([make_issue(1, "STUDY_CMH_0001_01")])
+        utils.sync_issues(token="abc", full=True)
+        assert "since" not in repo.get_issues.call_args.kwargs
+
+    def test_pull_requests_are_ignored(self, dash_db, repo):
+        repo.get_issues.return_value = [
+            Mock(pull_request=None, **make_issue(1, "STUDY_CMH_0001_01")),
+            Mock(pull_request=Mock(), **make_issue(2, "STUDY_CMH_0001_01"))
+        ]
+
+        assert utils.sync_issues(token="abc") == 1
+        assert [i.number for i in GithubIssue.find("STUDY_CMH_0001_01")] \
+            == [1]
+
+    @pytest.fixture
+    def repo(self):
+        repo = Mock()
+        repo.get_issues.return_value = []
+        with patch.object(utils, "get_issues_repo", return_value=repo):
+            yield repo
+
+
+class TestCanViewIssues:
+
+    def test_public_repo_issues_visible_without_check(self, dash_app):
+        dash_app.config["GITHUB_PUBLIC"] = True
+        with dash_app.test_request_context():
+            with patch.object(utils, "get_issues_repo") as mock_repo:
+                assert utils.can_view_issues("token")
+        assert mock_repo.call_count == 0
+
+    def test_private_repo_hidden_without_access(self, private_repo):
+        private_repo.side_effect = Exception("Not Found")
+        assert not utils.can_view_issues("token")
+
+    def test_private_repo_access_checked_once(self, private_repo):
+        assert utils.can_view_issues("token")
+        assert utils.can_view_issues("token")
+        assert private_repo.call_count == 1
+
+    @pytest.fixture
+    def private_repo(self, dash_app):
+        dash_app.config["GITHUB_PUBLIC"] = False
+        with dash_app.test_request_context():
+            with patch.object(utils, "get_issues_repo") as mock_repo:
+                yield mock_repo
+        dash_app.config["GITHUB_PUBLIC"] = True
+
+
+class TestGithubWebhook:
+
+    url = "/timepoint/github_webhook"
+    webhook_secret = "webhook-secret"
+
+    def test_disabled_without_secret(self, dash_app, dash_db):
+        dash_app.config["GITHUB_WEBHOOK_SECRET"] = None
+        response = self.post(dash_app, "issues", {})
+        assert response.status_code == 404
+
+    def test_rejects_bad_signature(self, dash_app, dash_db, secret):
+        response = self.post(dash_app, "issues", {}, signature="sha256=0")
+        assert response.status_code == 401
+
+    def test_opened_issue_is_saved(self, dash_app, dash_db, secret):
+        response = self.post(dash_app, "issues", {
+            "action": "opened",
+            "issue": self.issue_json(7, "STUDY_CMH_0001_01 - Bad T1")
+        })
+        assert response.status_code == 200
+        assert [i.number for i in GithubIssue.find("STUDY_CMH_0001_01")] \
+            == [7]
+
+    def test_deleted_issue_is_removed(self, dash_app, dash_db, secret):
+        GithubIssue.save([make_issue(7, "STUDY_CMH_0001_01 - Bad T1")])
+        response = self.post(dash_app, "issues", {
+            "action": "deleted",
+            "issue": self.issue_json(7, "STUDY_CMH_0001_01 - Bad T1")
+        })
+        assert response.status_code == 200
+        assert GithubIssue.find("STUDY_CMH_0001_01") == []
+
+    def test_pull_request_comments_are_ignored(
+            self, dash_app, dash_db, secret):
+        issue = self.issue_json(8, "STUDY_CMH_0001_01 - Fix")
+        issue["pull_request"] = {}
+        response = self.post(dash_app, "issue_comment", {
+            "action": "created",
+            "issue": issue
+        })
+        assert response.status_code == 200
+        assert GithubIssue.find("STUDY_CMH_0001_01") == []
+
+    def post(self, app, event, payload, signature=None):
+        body = json.dumps(payload).encode("utf-8")
+        if signature is None:
+            signature = "sha256=" + hmac.new(
+                self.webhook_secret.encode("utf-8"), body, hashlib.sha256
+            ).hexdigest()
+        with app.test_client() as client:
+            return client.post(self.url, data=body, headers={
+                "Content-Type": "application/json",
+                "X-GitHub-Event": event,
+                "X-Hub-Signature-256": signature
+            })
+
+    def issue_json(self, number, title):
+        issue = make_issue(number, title)
+        issue["created_at"] = issue["updated_at"] = "2024-01-02T03:04:05Z"
+        return issue
+
+    @pytest.fixture
+    def secret(self, dash_app):
+        dash_app.config["GITHUB_WEBHOOK_SECRET"] = self.webhook_secret
+        yield self.webhook_secret
+        dash_app.config["GITHUB_WEBHOOK_SECRET"] = None
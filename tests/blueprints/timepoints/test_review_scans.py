@@ -0,0 +1,123 @@
+import pytest
+from mock import patch
+
+import dashboard.blueprints.timepoints.views as views
+from dashboard import models
+from dashboard.exceptions import InvalidUsage
+from tests.utils import add_studies, add_scans, query_db, Session, Scan
+
+CMH_T1 = "STUDY1_CMH_0001_01_01_T1_02"
+CMH_T2 = "STUDY1_CMH_0001_01_01_T2_03"
+UTO_T1 = "STUDY1_UTO_0001_01_01_T1_02"
+LINK = "STUDY2_CMH_0001_01_01_T1_02"
+
+
+class TestReviewScans:
+
+    def test_reviews_are_applied_in_one_transaction(self, dash_app, scans):
+        with patch.object(models.db.session, "commit",
+                          wraps=models.db.session.commit) as mock_commit:
+            results = self.post(dash_app, scans, [
+                {"scan": scans[CMH_T1], "approve": True},
+                {"scan": scans[CMH_T2], "approve": False,
+                 "comment": "Motion"}
+            ])
+
+        assert mock_commit.call_count == 1
+        assert [result["success"] for result in results] == [True, True]
+        assert self.get_scan(CMH_T1).signed_off()
+        assert self.get_scan(CMH_T2).blacklisted()
+        assert self.get_scan(CMH_T2).get_comment() == "Motion"
+
+    def test_inaccessible_scans_are_reported(self, dash_app, scans):
+        results = self.post(dash_app, scans, [
+            {"scan": scans[UTO_T1], "approve": True},
+            {"scan": scans[CMH_T1], "approve": True},
+            {"scan": 9999, "approve": True}
+        ])
+
+        assert [(result["scan"], result["success"]) for result in results] \
+            == [(scans[UTO_T1], False), (scans[CMH_T1], True), (9999, False)]
+        assert self.get_scan(UTO_T1).is_new()
+        assert self.get_scan(CMH_T1).signed_off()
+
+    def test_scan_listed_twice_gets_one_entry(self, dash_app, scans):
+        results = self.post(dash_app, scans, [
+            {"scan": scans[CMH_T1], "approve": True},
+            {"scan": scans[CMH_T1], "approve": False, "comment": "Motion"}
+        ])
+
+        assert [result["success"] for result in results] == [True, True]
+        assert query_db("SELECT count(*) FROM scan_checklist")[0][0] == 1
+        assert self.get_scan(CMH_T1).blacklisted()
+
+    def test_link_reviewed_with_its_source_gets_one_entry(
+            self, dash_app, scans):
+        link = self.add_link(scans[CMH_T1])
+        results = self.post(dash_app, scans, [
+            {"scan": scans[CMH_T1], "approve": True},
+            {"scan": link.id, "approve": True}
+        ])
+
+        assert [result["scan"] for result in results] == \
+            [scans[CMH_T1], link.id]
+        assert [result["success"] for result in results] == [True, True]
+        assert query_db("SELECT count(*) FROM scan_checklist")[0][0] == 1
+        assert self.get_scan(CMH_T1).signed_off()
+        assert self.get_scan(LINK).signed_off()
+
+    def test_study_restricts_accepted_scans(self, dash_app, scans):
+        results = self.post(dash_app, scans, [
+            {"scan": scans[CMH_T1], "approve": True}
+        ], study="STUDY2")
+        assert results[0]["success"] is False
+
+    def test_reviews_must_have_scan_ids(self, dash_app, scans):
+        with pytest.raises(InvalidUsage):
+            self.post(dash_app, scans, [{"approve": True}])
+
+    def test_body_must_hold_list_of_reviews(self, dash_app, scans):
+        with pytest.raises(InvalidUsage):
+            self.post(dash_app, scans, {"scan": scans[CMH_T1]})
+
+    def post(self, app, scans, reviews, study=None):
+        user = models.db.session.get(models.User, 1)
+        body = {"reviews": reviews}
+        if study:
+            body["study"] = study
+        with app.test_request_context(json=body):
+            with patch.object(views, "current_user", user):
+                response = views.review_scans.__wrapped__()
+        return response.get_json()["results"]
+
+    def add_link(self, source_id):
+        study = models.db.session.get(models.Study, "STUDY2")
+        timepoint = models.Timepoint("STUDY2_CMH_0001_01", "CMH")
+        study.add_timepoint(timepoint)
+        session = timepoint.add_session(1)
+        return session.add_scan(LINK, 2, "T1", source_id=source_id)
+
+    def get_scan(self, name):
+        return models.Scan.query.filter(models.Scan.name == name).one()
+
+    @pytest.fixture
+    def scans(self, dash_db):
+        user = models.User("Donald", "Duck")
+        dash_db.session.add(user)
+        dash_db.session.commit()
+
+        study1, study2 = add_studies({
+            "STUDY1": {"CMH": ["T1", "T2"], "UTO": ["T1"]},
+            "STUDY2": {"CMH": ["T1"]}
+        })
+        user.add_studies({"STUDY1": ["CMH"], "STUDY2": []})
+
+        added = add_scans(study1, {
+            Session("STUDY1_CMH_0001_01", "CMH", 1): [
+                Scan(CMH_T1, 2, "T1"), Scan(CMH_T2, 3, "T2")
+            ],
+            Session("STUDY1_UTO_0001_01", "UTO", 1): [
+                Scan(UTO_T1, 2, "T1")
+            ]
+        })
+        return {scan.name: scan.id for scan in added}
@@ -15,6 +15,8 @@ import dashboard
 def dash_app(request):
     app = dashboard.create_app()
     app.config["TESTING"] = True
+    # The listener's connection would stop the test database being dropped
+    app.config["REFERENCE_DATA_LISTEN"] = False
     app.config["SQLALCHEMY_DATABASE_URI"] = app.config[
         "SQLALCHEMY_TEST_DATABASE_URI"
     ]
@@ -41,8 +43,10 @@ def read_only_db(dash_app):
 def _make_db(dash_app):
     with dash_app.app_context():
         dashboard.models.db.create_all()
+        dashboard.reference_data.invalidate()
         yield dashboard.models.db
         # If you remove this line the session will remain open and
         # the tables wont be able to drop, causing the tests to freeze
         dashboard.models.db.session.remove()
         dashboard.models.db.drop_all()
+        dashboard.reference_data.invalidate()
@@ -1,26 +1,25 @@
-from mock import patch, Mock
+import os
+
+import pytest
+from mock import patch
 
 import dashboard.blueprints.main.utils as utils
 
 
-class TestMakeHeaderMsg:
+class TestRunLogHeader:
 
     done_regex = ": Done."
     error_regex = "- ERROR -"
 
-    def test_detects_if_nightly_run_unfinished(self):
+    def test_detects_if_nightly_run_unfinished(self, tmp_path):
         log_contents = """
         Sat 04 Jun 2022 01:08:41 AM EDT: Running pipelines for study: STUDY1
         Sat 04 Jun 2022 01:09:04 AM EDT: Get new scans...
         """
-        result = utils.make_header_msg(
-            log_contents,
-            self.done_regex,
-            self.error_regex
-        )
-        assert result == "Running..."
+        run_log = self.read(tmp_path, log_contents)
+        assert run_log.header == "Running..."
 
-    def test_counts_errors_in_logs_if_finished(self):
+    def test_counts_errors_in_logs_if_finished(self, tmp_path):
         log_contents = """
         Sat 04 Jun 2022 01:08:41 AM EDT: Running pipelines for study: STUDY1
         Sat 04 Jun 2022 01:09:04 AM EDT: Get new scans...
@@ -28,54 +27,142 @@ class TestMakeHeaderMsg:
         2022-06-04 03:40:18,945 - script1.py - STUDY1 - ERROR - Invalid session
         Sat 04 Jun 2022 03:41:40 AM EDT: Done.
         """  # NOQA: E501
-        result = utils.make_header_msg(
-            log_contents,
-            self.done_regex,
-            self.error_regex
-        )
-        assert result == "2 errors reported"
+        run_log = self.read(tmp_path, log_contents)
+        assert run_log.header == "2 errors reported"
 
-    def test_correct_grammar_when_one_error_exists(self):
+    def test_correct_grammar_when_one_error_exists(self, tmp_path):
         log_contents = """
         Sat 04 Jun 2022 01:08:41 AM EDT: Running pipelines for study: STUDY1
         Sat 04 Jun 2022 01:09:04 AM EDT: Get new scans...
         2022-06-04 03:40:18,945 - script1.py - STUDY1 - ERROR - Invalid session
         Sat 04 Jun 2022 03:41:40 AM EDT: Done.
         """
-        result = utils.make_header_msg(
-            log_contents,
-            self.done_regex,
-            self.error_regex
-        )
-        assert result == "1 error reported"
+        run_log = self.read(tmp_path, log_contents)
+        assert run_log.header == "1 error reported"
 
+    def read(self, tmp_path, contents):
+        log_file = tmp_path / "STUDY1_latest.log"
+        log_file.write_text(contents)
+        run_log = utils.RunLog(str(log_file), self.done_regex,
+                               self.error_regex)
+        run_log.refresh()
+        return run_log
 
-class TestReadLog:
 
-    @patch("builtins.open")
-    def test_escapes_html_present_in_logfile(self, mock_open):
-        mock_fh = Mock()
-        mock_fh.readlines.return_value = [
-            "<textarea> Sometext goes here </textarea>\n",
-            "<h3>A header</h3>\n",
+class TestRunLog:
+
+    def test_escapes_html_present_in_logfile(self, log_file):
+        log_file.write_text(
+            "<textarea> Sometext goes here </textarea>\n"
+            "<h3>A header</h3>\n"
             "Sat 04 Jun 2022 01:08:41 AM EDT: Normal log line\n"
+        )
+        run_log = self.read(log_file)
+
+        assert run_log.get_lines()["lines"] == [
+            "&lt;textarea&gt; Sometext goes here &lt;/textarea&gt;",
+            "&lt;h3&gt;A header&lt;/h3&gt;",
+            "Sat 04 Jun 2022 01:08:41 AM EDT: Normal log line"
         ]
-        mock_open.return_value.__enter__.return_value = mock_fh
-        result = utils.read_log("/tmp/some_fake_file.txt")
 
-        expected = "&lt;textarea&gt; Sometext goes here &lt;/textarea&gt;" + \
-                   "<br><br>&lt;h3&gt;A header&lt;/h3&gt;<br><br>Sat 04 " + \
-                   "Jun 2022 01:08:41 AM EDT: Normal log line<br>"
-        assert result == expected
+    def test_unchanged_log_isnt_read_again(self, log_file):
+        log_file.write_text("line 1\n")
+        run_log = self.read(log_file)
+
+        with patch("builtins.open") as mock_open:
+            run_log.refresh()
+        assert mock_open.call_count == 0
+
+    def test_only_reads_new_bytes_when_log_grows(self, log_file):
+        log_file.write_text("line 1\nline 2\n")
+        run_log = self.read(log_file)
+        self.append(log_file, "line 3 - ERROR - \n")
+
+        with patch.object(utils.RunLog, "_reset") as mock_reset:
+            run_log.refresh()
+
+        assert mock_reset.call_count == 0
+        assert run_log.get_lines()["lines"] == ["line 1", "line 2",
+                                                "line 3 - ERROR - "]
+        assert run_log.errors == 1
+
+    def test_rereads_log_when_replaced(self, log_file):
+        log_file.write_text("old line - ERROR - \n")
+        run_log = self.read(log_file)
+
+        os.remove(log_file)
+        log_file.write_text("new line\n")
+        run_log.refresh()
+
+        assert run_log.get_lines()["lines"] == ["new line"]
+        assert run_log.errors == 0
+
+    def test_incomplete_last_line_shown_but_not_duplicated(self, log_file):
+        log_file.write_text("line 1\nline")
+        run_log = self.read(log_file)
+        assert run_log.get_lines()["lines"] == ["line 1", "line"]
+
+        self.append(log_file, " 2\n")
+        run_log.refresh()
+        assert run_log.get_lines()["lines"] == ["line 1", "line 2"]
+
+    def test_get_lines_returns_end_of_log_by_default(self, log_file):
+        log_file.write_text("".join(f"line {i}\n" for i in range(10)))
+        run_log = self.read(log_file)
+
+        page = run_log.get_lines(limit=3)
+
+        assert page == {"start": 7, "total": 10,
+                        "lines": ["line 7", "line 8", "line 9"]}
+
+    def test_get_lines_pages_from_start(self, log_file):
+        log_file.write_text("".join(f"line {i}\n" for i in range(10)))
+        run_log = self.read(log_file)
+
+        page = run_log.get_lines(start=2, limit=2)
+
+        assert page == {"start": 2, "total": 10,
+                        "lines": ["line 2", "line 3"]}
+
+    def read(self, log_file):
+        run_log = utils.RunLog(str(log_file), ": Done.", "- ERROR -")
+        assert run_log.refresh()
+        return run_log
+
+    def append(self, log_file, text):
+        with open(log_file, "a") as fh:
+            fh.write(text)
+        # Make sure the change is seen even on file systems with coarse
+        # timestamps
+        stat = os.stat(log_file)
+        os.utime(log_file, ns=(stat.st_atime_ns,
+                               stat.st_mtime_ns + 1_000_000_000))
+
+    @pytest.fixture
+    def log_file(self, tmp_path):
+        return tmp_path / "STUDY1_latest.log"
 
 
 class TestGetRunLog:
 
-    @patch("dashboard.blueprints.main.utils.read_log")
-    def test_doesnt_try_to_read_file_when_log_dir_not_set(self, mock_read):
+    @patch("dashboard.blueprints.main.utils.RunLog")
+    def test_doesnt_try_to_read_file_when_log_dir_not_set(self, mock_log):
         utils.get_run_log("", "STUDY1", ": Done.", "- ERROR -")
-        assert mock_read.call_count == 0
+        assert mock_log.call_count == 0
 
-    def test_returns_correctly_formatted_dict_when_log_dir_not_set(self):
+    def test_returns_none_when_log_dir_not_set(self):
         result = utils.get_run_log("", "STUDY1", ": Done.", "- ERROR -")
-        assert result == {"contents": "", "header": ""}
+        assert result is None
+
+    def test_returns_none_when_log_doesnt_exist(self, tmp_path):
+        result = utils.get_run_log(str(tmp_path), "STUDY1", ": Done.",
+                                   "- ERROR -")
+        assert result is None
+
+    def test_reuses_reader_for_same_log(self, tmp_path):
+        (tmp_path / "STUDY1_latest.log").write_text("line 1\n")
+        first = utils.get_run_log(str(tmp_path), "STUDY1", ": Done.",
+                                  "- ERROR -")
+        second = utils.get_run_log(str(tmp_path), "STUDY1", ": Done.",
+                                   "- ERROR -")
+        assert first is second
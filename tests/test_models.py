@@ -2,9 +2,12 @@
 """
 
 import pytest
+import sqlalchemy
+from mock import patch, Mock
 
-from tests.utils import query_db, add_studies
+from tests.utils import query_db, add_studies, count_queries
 from dashboard import models
+from dashboard.exceptions import InvalidDataException
 
 
 class TestUser:
@@ -80,10 +83,777 @@ class TestUser:
         )
         assert result == expected
 
+    def test_has_study_access_respects_site_restrictions(self):
+        user = models.db.session.get(models.User, 1)
+        assert user.has_study_access("STUDY1")
+        assert user.has_study_access("STUDY1", "CMH")
+        assert not user.has_study_access("STUDY1", "UTO")
+        assert user.has_study_access("STUDY2", "CMH")
+        assert not user.has_study_access("STUDY4")
+
+    def test_permission_checks_reuse_compiled_access(self):
+        user = models.db.session.get(models.User, 1)
+        user.has_study_access("STUDY1")
+        with count_queries() as statements:
+            for study in ["STUDY1", "STUDY2", "STUDY3"]:
+                user.has_study_access(study, "CMH")
+                user.is_study_admin(study)
+                user.does_qc(study, "CMH")
+            user.get_sites()
+            user.get_disabled_sites()
+        assert statements == []
+
+    def test_specific_permissions_are_checked(self):
+        user = models.db.session.get(models.User, 1)
+        models.db.session.execute(sqlalchemy.text(
+            "UPDATE study_users SET does_qc = true"
+            "  WHERE user_id = 1 AND study = 'STUDY1'"))
+        models.db.session.commit()
+        user.clear_access()
+
+        assert user.does_qc("STUDY1", "CMH")
+        assert not user.does_qc("STUDY2", "CMH")
+        assert not user.is_study_admin("STUDY1")
+
+    def test_get_disabled_sites_lists_inaccessible_sites(self):
+        user = models.db.session.get(models.User, 1)
+        assert user.get_disabled_sites() == {"STUDY1": ["UTO"]}
+
+    def test_add_studies_updates_access(self):
+        user = models.db.session.get(models.User, 1)
+        assert not user.has_study_access("STUDY1", "UTO")
+
+        user.add_studies({"STUDY1": ["UTO"]})
+
+        assert user.has_study_access("STUDY1", "UTO")
+        assert user.get_disabled_sites() == {}
+
+    def test_remove_studies_updates_access(self):
+        user = models.db.session.get(models.User, 1)
+        assert [study.id for study in user.get_studies()] == [
+            "STUDY1", "STUDY2", "STUDY3"]
+
+        user.remove_studies({"STUDY2": []})
+
+        assert not user.has_study_access("STUDY2")
+        assert [study.id for study in user.get_studies()] == [
+            "STUDY1", "STUDY3"]
+
     def get_result(self, sql_query):
         return [item[0] for item in query_db(sql_query)]
 
 
+class TestStudyTimepointSummary:
+
+    def test_counts_humans_and_phantoms(self, timepoints):
+        study = models.db.session.get(models.Study, "STUDY1")
+        summary = study.get_timepoint_summary()
+        assert summary["human"] == 3
+        assert summary["phantom"] == 1
+
+    def test_qc_complete_matches_timepoint_is_qcd(self, timepoints):
+        study = models.db.session.get(models.Study, "STUDY1")
+        summary = study.get_timepoint_summary()
+
+        result = {item["name"]: item["qc_complete"]
+                  for item in summary["timepoints"]}
+        expected = {tp.name: tp.is_qcd() for tp in study.timepoints}
+        assert result == expected
+
+    def test_phantom_flag_reported_per_timepoint(self, timepoints):
+        study = models.db.session.get(models.Study, "STUDY1")
+        summary = study.get_timepoint_summary()
+
+        phantoms = [item["name"] for item in summary["timepoints"]
+                    if item["is_phantom"]]
+        assert phantoms == ["STUDY1_CMH_PHA_FBN0001"]
+
+    def test_timepoints_are_sorted_by_name(self, timepoints):
+        study = models.db.session.get(models.Study, "STUDY1")
+        names = [item["name"] for item in
+                 study.get_timepoint_summary()["timepoints"]]
+        assert names == sorted(names)
+
+    def test_summary_uses_a_single_query(self, timepoints):
+        study = models.db.session.get(models.Study, "STUDY1")
+        with count_queries() as statements:
+            study.get_timepoint_summary()
+        assert len(statements) == 1
+
+    def test_num_timepoints_uses_summary(self, timepoints):
+        study = models.db.session.get(models.Study, "STUDY1")
+        assert study.num_timepoints("human") == 3
+        assert study.num_timepoints("phantom") == 1
+        assert study.num_timepoints() == 4
+
+    def test_page_only_includes_sites_user_can_access(self, timepoints):
+        study = models.db.session.get(models.Study, "STUDY1")
+        page = study.get_timepoint_page(user_id=1)
+
+        assert page["total"] == 3
+        assert "STUDY1_UTO_0003_01" not in [
+            item["name"] for item in page["timepoints"]]
+
+    def test_admin_scope_includes_every_site(self, timepoints):
+        admin = models.db.session.get(models.User, 2)
+        study = models.db.session.get(models.Study, "STUDY1")
+        page = study.get_timepoint_page(user_id=admin.access_scope_id)
+
+        assert page["total"] == 4
+
+    def test_page_is_limited_to_requested_length(self, timepoints):
+        study = models.db.session.get(models.Study, "STUDY1")
+        page = study.get_timepoint_page(start=1, length=2)
+
+        assert page["total"] == 4
+        assert page["filtered"] == 4
+        assert [item["name"] for item in page["timepoints"]] == [
+            "STUDY1_CMH_0002_01", "STUDY1_CMH_PHA_FBN0001"
+        ]
+
+    def test_page_search_filters_by_name(self, timepoints):
+        study = models.db.session.get(models.Study, "STUDY1")
+        page = study.get_timepoint_page(search="cmh_0")
+
+        assert page["total"] == 4
+        assert page["filtered"] == 2
+        assert [item["name"] for item in page["timepoints"]] == [
+            "STUDY1_CMH_0001_01", "STUDY1_CMH_0002_01"
+        ]
+
+    def test_page_search_treats_wildcards_literally(self, timepoints):
+        study = models.db.session.get(models.Study, "STUDY1")
+        page = study.get_timepoint_page(search="%")
+        assert page["filtered"] == 0
+        assert page["timepoints"] == []
+
+    def test_page_sorts_by_requested_field(self, timepoints):
+        study = models.db.session.get(models.Study, "STUDY1")
+        page = study.get_timepoint_page(sort="qc_complete", descending=True)
+
+        assert [item["qc_complete"] for item in page["timepoints"]] == [
+            True, True, True, False
+        ]
+
+    def test_page_rejects_unknown_sort_field(self, timepoints):
+        study = models.db.session.get(models.Study, "STUDY1")
+        with pytest.raises(InvalidDataException):
+            study.get_timepoint_page(sort="bad_column; drop table")
+
+    def test_page_past_the_end_still_reports_filtered_count(self, timepoints):
+        study = models.db.session.get(models.Study, "STUDY1")
+        page = study.get_timepoint_page(start=10, length=5, search="CMH")
+        assert page["filtered"] == 3
+        assert page["timepoints"] == []
+
+    @pytest.fixture
+    def timepoints(self, user_records):
+        study = models.db.session.get(models.Study, "STUDY1")
+
+        # Signed off
+        done = models.Timepoint("STUDY1_CMH_0001_01", "CMH")
+        study.add_timepoint(done)
+        done.add_session(1)
+        done.sessions[1].sign_off(1)
+
+        # One of two sessions signed off
+        partial = models.Timepoint("STUDY1_CMH_0002_01", "CMH")
+        study.add_timepoint(partial)
+        partial.add_session(1)
+        partial.add_session(2)
+        partial.sessions[1].sign_off(1)
+
+        # No sessions at all
+        study.add_timepoint(models.Timepoint("STUDY1_UTO_0003_01", "UTO"))
+
+        phantom = models.Timepoint(
+            "STUDY1_CMH_PHA_FBN0001", "CMH", is_phantom=True)
+        study.add_timepoint(phantom)
+        phantom.add_session(1)
+
+        return study
+
+
+class TestStudyQcSummary:
+
+    def test_new_session_is_reported(self, study):
+        timepoint = self.add_timepoint(study, "STUDY2_CMH_0001_01")
+        timepoint.add_session(1)
+
+        assert self.get_flags("STUDY2") == {
+            ("STUDY2_CMH_0001_01", 1): (True, False, True)
+        }
+
+    def test_sign_off_clears_new_flag(self, study):
+        timepoint = self.add_timepoint(study, "STUDY2_CMH_0001_01")
+        timepoint.add_session(1)
+        timepoint.sessions[1].sign_off(1)
+
+        is_new, _, _ = self.get_flags("STUDY2")[("STUDY2_CMH_0001_01", 1)]
+        assert is_new is False
+
+    def test_redcap_record_without_scans_is_missing_scans(self, study):
+        timepoint = self.add_timepoint(study, "STUDY2_CMH_0001_01")
+        session = timepoint.add_session(1)
+        self.add_redcap(session)
+
+        assert self.get_flags("STUDY2") == {
+            ("STUDY2_CMH_0001_01", 1): (True, True, False)
+        }
+
+    def test_adding_scan_clears_missing_scans(self, study):
+        timepoint = self.add_timepoint(study, "STUDY2_CMH_0001_01")
+        session = timepoint.add_session(1)
+        self.add_redcap(session)
+        session.add_scan("STUDY2_CMH_0001_01_01_T1_02", 2, "T1")
+
+        _, missing_scans, _ = self.get_flags(
+            "STUDY2")[("STUDY2_CMH_0001_01", 1)]
+        assert missing_scans is False
+
+    def test_ignoring_missing_scans_clears_flag(self, study):
+        timepoint = self.add_timepoint(study, "STUDY2_CMH_0001_01")
+        session = timepoint.add_session(1)
+        self.add_redcap(session)
+        timepoint.ignore_missing_scans(1, 1, "Participant withdrew")
+
+        _, missing_scans, _ = self.get_flags(
+            "STUDY2")[("STUDY2_CMH_0001_01", 1)]
+        assert missing_scans is False
+
+    def test_phantoms_are_excluded(self, study):
+        timepoint = models.Timepoint(
+            "STUDY2_CMH_PHA_FBN0001", "CMH", is_phantom=True)
+        study.add_timepoint(timepoint)
+        timepoint.add_session(1)
+
+        assert self.get_flags("STUDY2") == {}
+
+    def test_outstanding_issues_read_from_summary(self, study):
+        timepoint = self.add_timepoint(study, "STUDY2_CMH_0001_01")
+        timepoint.add_session(1)
+
+        issues = study.outstanding_issues()
+        assert list(issues) == ["STUDY2_CMH_0001_01"]
+        assert "NEW" in issues["STUDY2_CMH_0001_01"][0]
+        assert "Missing REDCap" in issues["STUDY2_CMH_0001_01"][3]
+
+    def test_summary_matches_live_queries(self, study):
+        first = self.add_timepoint(study, "STUDY2_CMH_0001_01")
+        self.add_redcap(first.add_session(1))
+        second = self.add_timepoint(study, "STUDY2_CMH_0002_01")
+        second.add_session(1)
+        second.sessions[1].sign_off(1)
+
+        assert models.StudyQcSummary.find_inconsistencies(study) == {}
+
+    def test_rebuild_restores_deleted_rows(self, study):
+        timepoint = self.add_timepoint(study, "STUDY2_CMH_0001_01")
+        timepoint.add_session(1)
+        models.db.session.execute(
+            sqlalchemy.text("DELETE FROM study_qc_summary"))
+        models.db.session.commit()
+        assert models.StudyQcSummary.find_inconsistencies(study)
+
+        models.StudyQcSummary.rebuild("STUDY2")
+        assert models.StudyQcSummary.find_inconsistencies(study) == {}
+
+    def test_deleting_review_keeps_summary_consistent(self, study):
+        timepoint = self.add_timepoint(study, "STUDY2_CMH_0001_01")
+        session = timepoint.add_session(1)
+        scan = session.add_scan("STUDY2_CMH_0001_01_01_T1_02", 2, "T1")
+        scan.add_checklist_entry(1, sign_off=True)
+
+        scan.get_checklist_entry().delete()
+
+        assert scan.is_new()
+        assert models.StudyQcSummary.find_inconsistencies(study) == {}
+
+    def test_deleting_last_scan_reports_missing_scans(self, study):
+        timepoint = self.add_timepoint(study, "STUDY2_CMH_0001_01")
+        session = timepoint.add_session(1)
+        self.add_redcap(session)
+        scan = session.add_scan("STUDY2_CMH_0001_01_01_T1_02", 2, "T1")
+
+        scan.delete()
+
+        _, missing_scans, _ = self.get_flags(
+            "STUDY2")[("STUDY2_CMH_0001_01", 1)]
+        assert missing_scans is True
+        assert models.StudyQcSummary.find_inconsistencies(study) == {}
+
+    def add_timepoint(self, study, name):
+        timepoint = models.Timepoint(name, "CMH")
+        study.add_timepoint(timepoint)
+        return timepoint
+
+    def add_redcap(self, session):
+        session.add_redcap(
+            "1", "2026-01-01", project=1, url="https://redcap.fake/",
+            instrument="scan_completed")
+
+    def get_flags(self, study_id):
+        records = query_db(
+            "SELECT name, num, is_new, missing_scans, missing_redcap"
+            "  FROM study_qc_summary"
+            f"  WHERE study = '{study_id}'"
+        )
+        return {(name, num): (new, scans, redcap)
+                for name, num, new, scans, redcap in records}
+
+    @pytest.fixture
+    def study(self, user_records):
+        study = models.db.session.get(models.Study, "STUDY2")
+        study.update_site("CMH", redcap=True)
+        models.db.session.add(models.Scantype("T1"))
+        study.update_scantype("CMH", "T1", create=True)
+        return study
+
+
+class TestMetricValue:
+
+    def test_numeric_value_is_stored_as_numbers(self, metric):
+        metric.value = "1.5::2"
+        assert metric.numbers == [1.5, 2.0]
+        assert metric._value == "1.5::2"
+
+    def test_text_value_has_no_numbers(self, metric):
+        metric.value = "good"
+        assert metric.numbers is None
+        assert metric.value == "good"
+
+    def test_value_matches_old_text_decoding(self, metric):
+        for raw in ["3", "1::2::3", "-4e2", "n/a"]:
+            metric.value = raw
+            assert metric.value == models.MetricValue.decode(raw)
+
+    def test_value_read_from_text_when_not_backfilled(self, metric):
+        metric._value = "7::8"
+        metric.numbers = None
+        assert metric.value == [7.0, 8.0]
+
+    def test_backfill_converts_numeric_rows_only(self, metric):
+        self.add_raw_values(metric, ["1", "2::3", "bad", " .5 "])
+
+        updated = models.MetricValue.backfill(batch_size=2)
+
+        assert updated == 3
+        result = query_db(
+            "SELECT value, numbers FROM scan_metrics ORDER BY id")
+        assert [tuple(row) for row in result] == [
+            ("1", [1.0]), ("2::3", [2.0, 3.0]), ("bad", None),
+            (" .5 ", [0.5])
+        ]
+
+    def test_backfill_is_a_noop_when_rerun(self, metric):
+        self.add_raw_values(metric, ["1", "bad"])
+        models.MetricValue.backfill()
+        assert models.MetricValue.backfill() == 0
+
+    def test_decode_all_prefers_numbers(self):
+        result = models.MetricValue.decode_all(
+            ["1", "2::3", "ok"], [[1.0], None, None])
+        assert result == [1.0, [2.0, 3.0], "ok"]
+
+    def test_to_array_returns_flat_array_for_scalars(self):
+        result = models.MetricValue.to_array([[1.0], [2.0]])
+        assert result.shape == (2,)
+        assert result.tolist() == [1.0, 2.0]
+
+    def test_to_array_returns_2d_array_for_vectors(self):
+        result = models.MetricValue.to_array([[1.0, 2.0], [3.0, 4.0]])
+        assert result.shape == (2, 2)
+
+    def test_to_array_rejects_ragged_values(self):
+        with pytest.raises(InvalidDataException):
+            models.MetricValue.to_array([[1.0], [2.0, 3.0]])
+
+    def test_to_array_rejects_non_numeric_values(self):
+        with pytest.raises(InvalidDataException):
+            models.MetricValue.to_array([[1.0], None])
+
+    def test_bulk_upsert_creates_missing_metric_types(self, metric):
+        count = models.MetricValue.bulk_upsert([
+            ("STUDY1_CMH_0001_01_01_T1_02", "fwhm", "2.5"),
+            ("STUDY1_CMH_0001_01_01_T1_02", "motion", [0.1, 0.2]),
+        ])
+
+        assert count == 2
+        result = query_db(
+            "SELECT mt.name, mt.scantype, sm.value, sm.numbers"
+            "  FROM scan_metrics sm, metrictypes mt"
+            "  WHERE sm.metric_type = mt.id"
+            "  ORDER BY mt.name")
+        assert [tuple(row) for row in result] == [
+            ("fwhm", "T1", "2.5", [2.5]),
+            ("motion", "T1", "0.1::0.2", [0.1, 0.2]),
+            ("snr", "T1", "0", [0.0])
+        ]
+
+    def test_bulk_upsert_replaces_existing_values(self, metric):
+        models.MetricValue.bulk_upsert([
+            ("STUDY1_CMH_0001_01_01_T1_02", "snr", 5),
+            ("STUDY1_CMH_0001_01_01_T1_02", "snr", 6),
+        ])
+
+        result = query_db("SELECT value FROM scan_metrics")
+        assert [row[0] for row in result] == ["6"]
+        assert query_db("SELECT count(*) FROM metrictypes")[0][0] == 1
+
+    def test_bulk_upsert_saves_nothing_if_a_scan_is_missing(self, metric):
+        with pytest.raises(InvalidDataException):
+            models.MetricValue.bulk_upsert([
+                ("STUDY1_CMH_0001_01_01_T1_02", "fwhm", 1),
+                ("STUDY1_CMH_9999_01_01_T1_02", "fwhm", 1),
+            ])
+        assert query_db("SELECT count(*) FROM scan_metrics")[0][0] == 1
+        assert query_db("SELECT count(*) FROM metrictypes")[0][0] == 1
+
+    def test_bulk_upsert_uses_a_constant_number_of_queries(self, metric):
+        counts = []
+        for size in [1, 50]:
+            records = [("STUDY1_CMH_0001_01_01_T1_02",
+                        "metric{}_{}".format(size, i), i)
+                       for i in range(size)]
+            with count_queries() as statements:
+                models.MetricValue.bulk_upsert(records)
+            counts.append(len(statements))
+
+        # Scan lookup, metric type insert + lookup, the upsert and the three
+        # statements that refresh the affected summaries
+        assert counts == [7, 7]
+
+    def add_raw_values(self, metric, values):
+        # Mimic rows written before the typed column existed. Each value
+        # needs its own metric type, as a scan holds one value per type.
+        models.db.session.delete(metric)
+        for num, raw in enumerate(values):
+            metrictype = models.Metrictype(name="raw{}".format(num),
+                                           scantype_id="T1")
+            models.db.session.add(metrictype)
+            models.db.session.flush()
+            models.db.session.add(models.MetricValue(
+                scan_id=metric.scan_id,
+                metrictype_id=metrictype.id,
+                _value=raw))
+        models.db.session.commit()
+
+    @pytest.fixture
+    def metric(self, user_records):
+        models.db.session.add(models.Scantype("T1"))
+        study = models.db.session.get(models.Study, "STUDY1")
+        timepoint = models.Timepoint("STUDY1_CMH_0001_01", "CMH")
+        study.add_timepoint(timepoint)
+        timepoint.add_session(1)
+        scan = timepoint.sessions[1].add_scan(
+            "STUDY1_CMH_0001_01_01_T1_02", 2, "T1")
+
+        metrictype = models.Metrictype(name="snr", scantype_id="T1")
+        models.db.session.add(metrictype)
+        models.db.session.flush()
+
+        metric = models.MetricValue(scan_id=scan.id,
+                                    metrictype_id=metrictype.id)
+        metric.value = "0"
+        models.db.session.add(metric)
+        models.db.session.commit()
+        return metric
+
+
+class TestMetricSummary:
+
+    def test_bulk_upsert_updates_summary(self, scans):
+        models.MetricValue.bulk_upsert([
+            ("STUDY1_CMH_0001_01_01_T1_02", "snr", 1),
+            ("STUDY1_CMH_0002_01_01_T1_02", "snr", 3),
+        ])
+
+        summary = self.get_summary()
+        assert summary.count == 2
+        assert summary.mean == 2
+        assert summary.minimum == 1
+        assert summary.maximum == 3
+        assert summary.quantiles[2] == 2
+
+    def test_values_from_failed_scans_are_excluded(self, scans):
+        models.MetricValue.bulk_upsert([
+            ("STUDY1_CMH_0001_01_01_T1_02", "snr", 1),
+            ("STUDY1_CMH_0002_01_01_T1_02", "snr", 3),
+        ])
+
+        scans[1].add_checklist_entry(1, "bad", False)
+
+        summary = self.get_summary()
+        assert summary.count == 1
+        assert summary.maximum == 1
+
+    def test_deleting_failed_review_restores_values(self, scans):
+        models.MetricValue.bulk_upsert([
+            ("STUDY1_CMH_0001_01_01_T1_02", "snr", 1),
+            ("STUDY1_CMH_0002_01_01_T1_02", "snr", 3),
+        ])
+        scans[1].add_checklist_entry(1, "bad", False)
+
+        scans[1].get_checklist_entry().delete()
+
+        summary = self.get_summary()
+        assert summary.count == 2
+        assert summary.maximum == 3
+
+    def test_deleted_scans_values_are_removed(self, scans):
+        models.MetricValue.bulk_upsert([
+            ("STUDY1_CMH_0001_01_01_T1_02", "snr", 1),
+            ("STUDY1_CMH_0002_01_01_T1_02", "snr", 3),
+        ])
+
+        scans[1].delete()
+
+        summary = self.get_summary()
+        assert summary.count == 1
+        assert summary.maximum == 1
+
+        scans[0].delete()
+        assert self.get_summary() is None
+
+    def test_multi_value_metrics_are_not_summarized(self, scans):
+        models.MetricValue.bulk_upsert([
+            ("STUDY1_CMH_0001_01_01_T1_02", "motion", [1, 2]),
+        ])
+        assert models.MetricSummary.query.count() == 0
+
+    def test_only_affected_groups_are_refreshed(self, scans):
+        models.MetricValue.bulk_upsert([
+            ("STUDY1_CMH_0001_01_01_T1_02", "snr", 1),
+            ("STUDY1_CMH_0001_01_01_T1_02", "fwhm", 5),
+        ])
+        # Simulate an out of date row that a refresh shouldn't touch
+        fwhm = models.Metrictype.query.filter_by(name="fwhm").first()
+        models.db.session.execute(sqlalchemy.text(
+            "UPDATE metric_summary SET count = 99"
+            "  WHERE metrictype = {}".format(fwhm.id)))
+        models.db.session.commit()
+
+        models.MetricValue.bulk_upsert([
+            ("STUDY1_CMH_0002_01_01_T1_02", "snr", 3),
+        ])
+
+        result = query_db(
+            "SELECT mt.name, ms.count"
+            "  FROM metric_summary ms, metrictypes mt"
+            "  WHERE ms.metrictype = mt.id")
+        assert dict(result) == {"snr": 2, "fwhm": 99}
+
+    def test_rebuild_recalculates_everything(self, scans):
+        models.MetricValue.bulk_upsert([
+            ("STUDY1_CMH_0001_01_01_T1_02", "snr", 1),
+        ])
+        models.db.session.execute(
+            sqlalchemy.text("DELETE FROM metric_summary"))
+        models.db.session.commit()
+
+        models.MetricSummary.rebuild()
+
+        assert self.get_summary().count == 1
+
+    def get_summary(self):
+        snr = models.Metrictype.query.filter_by(name="snr").first()
+        return models.MetricSummary.query.filter_by(
+            study_id="STUDY1", site_id="CMH", scantype_id="T1",
+            metrictype_id=snr.id, is_phantom=False).first()
+
+    @pytest.fixture
+    def scans(self, user_records):
+        models.db.session.add(models.Scantype("T1"))
+        study = models.db.session.get(models.Study, "STUDY1")
+        output = []
+        for name in ["STUDY1_CMH_0001_01", "STUDY1_CMH_0002_01"]:
+            timepoint = models.Timepoint(name, "CMH")
+            study.add_timepoint(timepoint)
+            timepoint.add_session(1)
+            output.append(timepoint.sessions[1].add_scan(
+                name + "_01_T1_02", 2, "T1"))
+        return output
+
+
+class TestDbBatch:
+
+    def test_changes_are_committed_once(self, timepoint):
+        with patch.object(models.db.session, "commit",
+                          wraps=models.db.session.commit) as mock_commit:
+            with models.db_batch():
+                session = timepoint.sessions[1]
+                session.add_scan("STUDY1_CMH_0001_01_01_T1_02", 2, "T1")
+                session.add_scan("STUDY1_CMH_0001_01_01_T1_03", 3, "T1")
+                session.sign_off(1)
+                assert mock_commit.call_count == 0
+        assert mock_commit.call_count == 1
+        assert len(query_db("SELECT * FROM scans")) == 2
+
+    def test_nothing_is_saved_if_the_block_raises(self, timepoint):
+        with pytest.raises(RuntimeError):
+            with models.db_batch():
+                timepoint.sessions[1].add_scan(
+                    "STUDY1_CMH_0001_01_01_T1_02", 2, "T1")
+                raise RuntimeError("Failed")
+        assert query_db("SELECT * FROM scans") == []
+
+    def test_caught_failures_are_reported_on_exit(self, timepoint):
+        session = timepoint.sessions[1]
+        with pytest.raises(InvalidDataException,
+                           match="1 change\\(s\\) failed"):
+            with models.db_batch():
+                session.add_scan("STUDY1_CMH_0001_01_01_T1_02", 2, "T1")
+                try:
+                    session.add_scan("STUDY1_CMH_0001_01_01_T1_03", 3,
+                                     "NOT_A_TAG")
+                except InvalidDataException:
+                    pass
+                session.add_scan("STUDY1_CMH_0001_01_01_T1_04", 4, "T1")
+        assert query_db("SELECT * FROM scans") == []
+
+    def test_nested_batch_joins_outer_batch(self, timepoint):
+        with patch.object(models.db.session, "commit",
+                          wraps=models.db.session.commit) as mock_commit:
+            with models.db_batch() as outer:
+                with models.db_batch() as inner:
+                    timepoint.sessions[1].add_scan(
+                        "STUDY1_CMH_0001_01_01_T1_02", 2, "T1")
+                assert inner is outer
+                assert mock_commit.call_count == 0
+        assert mock_commit.call_count == 1
+
+    def test_after_commit_work_waits_for_commit(self, timepoint):
+        callback = Mock(__name__="callback")
+        with models.db_batch():
+            models.utils.after_commit(callback, 1, key="a")
+            assert not callback.called
+        callback.assert_called_once_with(1, key="a")
+
+    def test_after_commit_work_skipped_when_batch_fails(self, timepoint):
+        callback = Mock(__name__="callback")
+        with pytest.raises(RuntimeError):
+            with models.db_batch():
+                models.utils.after_commit(callback)
+                raise RuntimeError("Failed")
+        assert not callback.called
+
+    def test_qc_emails_wait_for_commit(self, emailing_study):
+        study = emailing_study
+        with patch.object(models.utils, "schedule_email") as mock_email:
+            with models.db_batch():
+                study.add_timepoint(
+                    models.Timepoint("STUDY1_CMH_0002_01", "CMH"))
+                assert not mock_email.called
+        assert mock_email.call_count == 1
+        assert mock_email.call_args.args[1][3] == "STUDY1_CMH_0002_01"
+
+    def test_qc_emails_not_sent_when_batch_fails(self, emailing_study):
+        study = emailing_study
+        with patch.object(models.utils, "schedule_email") as mock_email:
+            with pytest.raises(RuntimeError):
+                with models.db_batch():
+                    study.add_timepoint(
+                        models.Timepoint("STUDY1_CMH_0002_01", "CMH"))
+                    raise RuntimeError("Failed")
+        assert not mock_email.called
+        assert models.db.session.get(
+            models.Timepoint, "STUDY1_CMH_0002_01") is None
+
+    def test_methods_commit_immediately_outside_batch(self, timepoint):
+        timepoint.sessions[1].add_scan("STUDY1_CMH_0001_01_01_T1_02", 2, "T1")
+        models.db.session.rollback()
+        assert len(query_db("SELECT * FROM scans")) == 1
+
+    @pytest.fixture
+    def timepoint(self, user_records):
+        models.db.session.add(models.Scantype("T1"))
+        study = models.db.session.get(models.Study, "STUDY1")
+        study.update_scantype("CMH", "T1", create=True)
+        timepoint = models.Timepoint("STUDY1_CMH_0001_01", "CMH")
+        study.add_timepoint(timepoint)
+        timepoint.add_session(1)
+        return timepoint
+
+    @pytest.fixture
+    def emailing_study(self, user_records):
+        study = models.db.session.get(models.Study, "STUDY1")
+        study.email_qc = True
+        models.db.session.commit()
+        qcer = models.db.session.get(models.User, 1)
+        with patch.object(models.Study, "get_QCers", return_value=[qcer]):
+            yield study
+
+
+class TestSessionSignOff:
+
+    def test_only_unreviewed_scans_are_approved(self, session):
+        t1, t2 = session.scans
+        t2.add_checklist_entry(1, "Motion", True)
+
+        approved = session.sign_off_scans(2)
+
+        assert approved == [t1]
+        assert session.signed_off and session.reviewer_id == 2
+        assert t1.signed_off()
+        assert t1.get_checklist_entry().user_id == 2
+        assert t2.flagged()
+        assert t2.get_comment() == "Motion"
+
+    def test_changes_are_committed_once(self, session):
+        with patch.object(models.db.session, "commit",
+                          wraps=models.db.session.commit) as mock_commit:
+            session.sign_off_scans(1)
+        assert mock_commit.call_count == 1
+        assert len(query_db("SELECT * FROM scan_checklist")) == 2
+
+    def test_sessions_of_linked_sources_are_refreshed(self, session):
+        source = session.scans[0]
+        timepoint = models.Timepoint("STUDY1_CMH_0002_01", "CMH")
+        models.db.session.get(models.Study, "STUDY1").add_timepoint(timepoint)
+        other = timepoint.add_session(1)
+        other.add_scan("STUDY1_CMH_0002_01_01_T1_02", 2, "T1",
+                       source_id=source.id)
+
+        with patch.object(models.StudyQcSummary, "refresh",
+                          wraps=models.StudyQcSummary.refresh) as mock_refresh:
+            other.sign_off_scans(1)
+
+        refreshed = {(call.kwargs["name"], call.kwargs["num"])
+                     for call in mock_refresh.call_args_list}
+        assert refreshed == {("STUDY1_CMH_0001_01", 1),
+                             ("STUDY1_CMH_0002_01", 1)}
+        assert source.signed_off()
+
+    def test_xnat_updated_once_for_whole_session(self, session, dash_app):
+        study = models.db.session.get(models.Study, "STUDY1")
+        study.update_site("CMH", xnat_url="https://xnat.fake",
+                          xnat_archive="ARCHIVE")
+        dash_app.config.update(XNAT_ENABLED=True, XNAT_USER="user",
+                               XNAT_PASS="pass")
+        try:
+            with patch.object(models.utils.xnat_sync.worker,
+                              "submit") as mock_xnat:
+                session.sign_off_scans(1)
+        finally:
+            dash_app.config["XNAT_ENABLED"] = False
+
+        assert mock_xnat.call_count == 1
+        updates = mock_xnat.call_args.args[-1]
+        assert updates == [(2, "", "usable"), (3, "", "usable")]
+
+    @pytest.fixture
+    def session(self, user_records):
+        models.db.session.add(models.Scantype("T1"))
+        study = models.db.session.get(models.Study, "STUDY1")
+        study.update_scantype("CMH", "T1", create=True)
+        timepoint = models.Timepoint("STUDY1_CMH_0001_01", "CMH")
+        study.add_timepoint(timepoint)
+        session = timepoint.add_session(1)
+        session.add_scan("STUDY1_CMH_0001_01_01_T1_02", 2, "T1")
+        session.add_scan("STUDY1_CMH_0001_01_01_T1_03", 3, "T1")
+        return session
+
+
 @pytest.fixture(autouse=True)
 def user_records(dash_db):
     """Adds some user records and access permissions for testing.
@@ -0,0 +1,140 @@
+import os
+import shutil
+
+import pytest
+from mock import patch, Mock
+
+import datman.config
+import dashboard
+import dashboard.datman_utils as dm_utils
+import dashboard.qc_manifests as qc_manifests
+
+FIXTURES = os.path.join(os.path.split(os.path.realpath(__file__))[0],
+                        "fixtures/test_datman_utils")
+
+DTI_SCAN = "STUDY_SITE_0001_01_01_DTI60-1000_05"
+DTI_MANIFEST = f"{DTI_SCAN}_Ax-DTI-60plus5_manifest.json"
+
+
+class TestGetManifests:
+
+    def test_matches_manifests_read_from_disk(self, timepoint):
+        expected = dm_utils.get_manifests(timepoint)
+        assert qc_manifests.get_manifests(timepoint) == expected
+
+    def test_manifests_are_added_to_index(self, timepoint):
+        qc_manifests.get_manifests(timepoint)
+        records = dashboard.models.QcManifest.find(timepoint.name)
+        assert [(record.num, record.scan) for record in records] == [
+            (1, "STUDY_SITE_0001_01_01_DTI60-1000_05"),
+            (1, "STUDY_SITE_0001_01_01_T1_02"),
+            (2, "STUDY_SITE_0001_01_02_DTI60-1000_04")
+        ]
+
+    def test_image_order_is_preserved(self, timepoint):
+        qc_manifests.get_manifests(timepoint)
+        manifests = qc_manifests.get_manifests(timepoint)
+        assert [
+            settings["order"] for settings in manifests[1][DTI_SCAN].values()
+        ] == [1, 2, 3]
+
+    def test_unmodified_manifests_arent_read_again(self, timepoint):
+        qc_manifests.get_manifests(timepoint)
+
+        with patch.object(dm_utils, "read_manifest",
+                          Mock(wraps=dm_utils.read_manifest)) as mock_read:
+            qc_manifests.get_manifests(timepoint)
+        assert not mock_read.called
+
+    def test_modified_manifest_is_reindexed(self, timepoint, qc_dir):
+        qc_manifests.get_manifests(timepoint)
+
+        manifest = os.path.join(qc_dir, DTI_MANIFEST)
+        with open(manifest, "w") as fh:
+            fh.write('{"new_image.png": {"order": 1}}')
+        mtime = os.stat(manifest).st_mtime
+        os.utime(manifest, (mtime + 10, mtime + 10))
+
+        manifests = qc_manifests.get_manifests(timepoint)
+        assert list(manifests[1][DTI_SCAN]) == ["new_image.png"]
+
+    def test_deleted_manifest_is_removed_from_index(self, timepoint, qc_dir):
+        qc_manifests.get_manifests(timepoint)
+        os.remove(os.path.join(qc_dir, DTI_MANIFEST))
+
+        manifests = qc_manifests.get_manifests(timepoint)
+
+        assert DTI_SCAN not in manifests[1]
+        records = dashboard.models.QcManifest.find(timepoint.name)
+        assert len(records) == 2
+
+    def test_unreadable_qc_folder_gives_no_manifests(self, tmp_path):
+        not_a_dir = tmp_path / "STUDY_SITE_0002_01"
+        not_a_dir.write_text("")
+        assert dm_utils.find_manifests(str(not_a_dir)) == {}
+
+    def test_unparseable_manifest_isnt_read_again(self, timepoint, qc_dir):
+        with open(os.path.join(qc_dir, "notes_manifest.json"), "w") as fh:
+            fh.write("{}")
+        qc_manifests.get_manifests(timepoint)
+
+        with patch.object(dm_utils, "read_manifest",
+                          Mock(wraps=dm_utils.read_manifest)) as mock_read:
+            qc_manifests.get_manifests(timepoint)
+        assert not mock_read.called
+
+    def test_manifest_indexed_once_its_session_is_added(self, timepoint,
+                                                        qc_dir):
+        shutil.copy(os.path.join(qc_dir, DTI_MANIFEST),
+                    os.path.join(qc_dir, DTI_MANIFEST.replace("_01_01_",
+                                                              "_01_03_")))
+        qc_manifests.get_manifests(timepoint)
+
+        with patch.object(dm_utils, "read_manifest",
+                          Mock(wraps=dm_utils.read_manifest)) as mock_read:
+            assert 3 not in qc_manifests.get_manifests(timepoint)
+        assert not mock_read.called
+
+        timepoint.add_session(3)
+        manifests = qc_manifests.get_manifests(timepoint)
+        assert list(manifests[3]) == ["STUDY_SITE_0001_01_03_DTI60-1000_05"]
+
+    @pytest.fixture(autouse=True)
+    def ignored(self):
+        qc_manifests._ignored.clear()
+        yield qc_manifests._ignored
+        qc_manifests._ignored.clear()
+
+    @pytest.fixture
+    def qc_dir(self, tmp_path):
+        qc_dir = tmp_path / "STUDY_SITE_0001_01"
+        shutil.copytree(os.path.join(FIXTURES, "STUDY_SITE_0001_01"), qc_dir)
+        return str(qc_dir)
+
+    @pytest.fixture(autouse=True)
+    def config(self, qc_dir):
+
+        def get_path(key):
+            if key == "qc":
+                return os.path.dirname(qc_dir)
+            raise datman.exceptions.UndefinedSetting
+
+        mock_conf = Mock(spec=datman.config.config)
+        mock_conf.get_path = get_path
+        with patch("datman.config.config") as patch_config:
+            patch_config.return_value = mock_conf
+            yield mock_conf
+
+
+@pytest.fixture
+def timepoint(dash_db):
+    study = dashboard.models.Study("STUDY")
+    dash_db.session.add(study)
+    dash_db.session.commit()
+    study.update_site("SITE", create=True)
+
+    timepoint = dashboard.models.Timepoint("STUDY_SITE_0001_01", "SITE")
+    study.add_timepoint(timepoint)
+    timepoint.add_session(1)
+    timepoint.add_session(2)
+    return timepoint
@@ -1,7 +1,7 @@
 import pytest
 
-from tests.utils import (add_studies, add_scans, query_db, Session, Scan,
-                         QcReview)
+from tests.utils import (add_studies, add_scans, query_db, count_queries,
+                         Session, Scan, QcReview)
 import dashboard.queries
 
 
@@ -72,6 +72,128 @@ class TestGetStudies:
         return [study1, study2, study3]
 
 
+class TestSearch:
+
+    def test_exact_subject_id_returns_only_that_subject(self):
+        result = dashboard.queries.search("STUDY1_CMH_0001_01")
+        assert [(r.kind, r.name) for r in result] == [
+            ("subject", "STUDY1_CMH_0001_01")]
+
+    def test_exact_match_ignores_case(self):
+        result = dashboard.queries.search("study1_cmh_0001_01")
+        assert [r.name for r in result] == ["STUDY1_CMH_0001_01"]
+
+    def test_exact_session_id_returns_session(self):
+        result = dashboard.queries.search("STUDY1_CMH_0001_01_02")
+        assert len(result) == 1
+        assert result[0].kind == "session"
+        assert result[0].timepoint == "STUDY1_CMH_0001_01"
+        assert result[0].num == 2
+
+    def test_exact_scan_name_returns_scan(self):
+        result = dashboard.queries.search("STUDY1_CMH_0001_01_01_T1_02")
+        assert len(result) == 1
+        assert result[0].kind == "scan"
+        assert result[0].scan_id is not None
+
+    def test_fuzzy_search_finds_all_kinds(self):
+        result = dashboard.queries.search("CMH_0002")
+        assert {r.kind for r in result} == {"subject", "session", "scan"}
+        assert all("CMH_0002" in r.name for r in result)
+
+    def test_fuzzy_results_ordered_by_similarity(self):
+        result = dashboard.queries.search("0001_01_01_t1")
+        assert result[0].name == "STUDY1_CMH_0001_01_01_T1_02"
+        ranks = [r.rank for r in result]
+        assert ranks == sorted(ranks, reverse=True)
+
+    def test_percent_acts_as_wildcard(self):
+        result = dashboard.queries.search("STUDY1%UTO")
+        assert result
+        assert all(r.timepoint == "STUDY1_UTO_0003_01" for r in result)
+
+    def test_limit_restricts_fuzzy_results(self):
+        result = dashboard.queries.search("STUDY1", limit=2)
+        assert len(result) == 2
+
+    def test_returns_empty_list_when_nothing_matches(self):
+        assert dashboard.queries.search("NOTHING_HERE") == []
+
+    def test_blank_search_returns_nothing(self):
+        assert dashboard.queries.search("   ") == []
+
+    def test_results_include_a_study_id(self):
+        result = dashboard.queries.search("UTO_0003")
+        assert result
+        assert all(r.study_id == "STUDY1" for r in result)
+
+    def test_timepoint_in_multiple_studies_returned_once(self):
+        result = dashboard.queries.search("CMH_0002")
+        assert len([r for r in result if r.kind == "subject"]) == 1
+
+    def test_user_id_excludes_inaccessible_sites(self):
+        result = dashboard.queries.search("STUDY1", user_id=1)
+        assert result
+        assert all(r.timepoint.startswith("STUDY1_CMH") for r in result)
+
+    def test_exact_match_respects_user_access(self):
+        result = dashboard.queries.search("STUDY1_UTO_0003_01", user_id=1)
+        assert all(r.timepoint != "STUDY1_UTO_0003_01" for r in result)
+
+    def test_study_id_is_one_the_user_can_access(self):
+        result = dashboard.queries.search("STUDY1_CMH_0002_01", user_id=2)
+        assert [(r.name, r.study_id) for r in result] == [
+            ("STUDY1_CMH_0002_01", "STUDY2")]
+
+    def test_returns_nothing_for_user_without_access(self):
+        assert dashboard.queries.search("STUDY1", user_id=3) == []
+
+    @pytest.fixture(autouse=True, scope="class")
+    def records(self, read_only_db):
+        """Add scans to search.
+
+        STUDY1_CMH_0002_01 belongs to both STUDY1 and STUDY2. User 1 can
+        only access STUDY1's CMH site, user 2 can only access STUDY2 and
+        user 3 can't access anything.
+        """
+        study, study2 = add_studies({
+            "STUDY1": {
+                "CMH": ["T1"],
+                "UTO": ["T1"]
+            },
+            "STUDY2": {
+                "CMH": ["T1"]
+            }
+        })
+
+        add_scans(study, {
+            Session("STUDY1_CMH_0001_01", "CMH", 1): [
+                Scan("STUDY1_CMH_0001_01_01_T1_02", 2, "T1")
+            ],
+            Session("STUDY1_CMH_0002_01", "CMH", 1): [
+                Scan("STUDY1_CMH_0002_01_01_T1_02", 2, "T1")
+            ],
+            Session("STUDY1_UTO_0003_01", "UTO", 1): [
+                Scan("STUDY1_UTO_0003_01_01_T1_02", 2, "T1")
+            ]
+        })
+
+        timepoint = read_only_db.session.get(
+            dashboard.models.Timepoint, "STUDY1_CMH_0001_01")
+        timepoint.add_session(2)
+        timepoint.sessions[2].add_scan("STUDY1_CMH_0001_01_02_T1_02", 2, "T1")
+
+        study2.timepoints.append(read_only_db.session.get(
+            dashboard.models.Timepoint, "STUDY1_CMH_0002_01"))
+        read_only_db.session.commit()
+
+        users = [dashboard.models.User("User", str(num)) for num in range(3)]
+        read_only_db.session.add_all(users)
+        read_only_db.session.commit()
+        users[0].add_studies({"STUDY1": ["CMH"]})
+        users[1].add_studies({"STUDY2": []})
+
+
 class TestGetScanQc:
 
     def test_finds_all_reviewed_human_scans_when_no_search_terms(self):
@@ -379,6 +501,47 @@ class TestGetScanQc:
         result_names = [item['name'] for item in result]
         assert result_names == expected
 
+    def test_limit_restricts_number_of_records_returned(self):
+        result = dashboard.queries.get_scan_qc(limit=2)
+        expected = self.get_records(
+            "SELECT s.name"
+            "  FROM scans as s, scan_checklist as sc, timepoints as t"
+            "  WHERE s.id = sc.scan_id"
+            "      AND t.name = s.timepoint"
+            "      AND t.is_phantom = false"
+            "  ORDER BY s.name, s.id"
+            "  LIMIT 2;"
+        )
+
+        assert [item['name'] for item in result] == expected
+
+    def test_pages_combine_to_the_full_sorted_result(self):
+        expected = dashboard.queries.get_scan_qc(sort=True)
+
+        pages = []
+        after = None
+        while True:
+            page = dashboard.queries.get_scan_qc(after=after, limit=2)
+            if not page:
+                break
+            pages.extend(page)
+            after = (page[-1]['name'], page[-1]['id'])
+
+        assert pages == expected
+
+    def test_after_cursor_respects_other_search_terms(self):
+        first = dashboard.queries.get_scan_qc(site="CMH", limit=1)
+        rest = dashboard.queries.get_scan_qc(
+            site="CMH", after=(first[0]['name'], first[0]['id']))
+
+        assert first + rest == dashboard.queries.get_scan_qc(
+            site="CMH", sort=True)
+
+    def test_stream_yields_same_records_as_list(self):
+        result = dashboard.queries.get_scan_qc(sort=True, stream=True)
+        assert not isinstance(result, list)
+        assert list(result) == dashboard.queries.get_scan_qc(sort=True)
+
     def test_returns_list_of_dicts(self):
         result = dashboard.queries.get_scan_qc()
         for item in result:
@@ -491,3 +654,178 @@ class TestGetScanQc:
         })
 
         return read_only_db
+
+
+class TestGetMetricValues:
+
+    def test_returns_one_column_per_field(self):
+        result = dashboard.queries.get_metric_values()
+        assert list(result) == dashboard.queries.METRIC_FIELDS
+        lengths = {len(column) for column in result.values()}
+        assert lengths == {4}
+
+    def test_excludes_values_from_blacklisted_scans(self):
+        result = dashboard.queries.get_metric_values()
+        assert "STUDY1_CMH_0002_01_01_T1_02" not in result["scan_name"]
+
+    def test_includes_blacklisted_scans_when_requested(self):
+        result = dashboard.queries.get_metric_values(
+            include_blacklisted=True)
+        assert "STUDY1_CMH_0002_01_01_T1_02" in result["scan_name"]
+
+    def test_rows_line_up_across_columns(self):
+        result = dashboard.queries.get_metric_values(
+            scans=["STUDY1_UTO_0003_01_01_T1_02"], byname=True)
+        assert result["value"] == [12.5]
+        assert result["metrictype"] == ["snr"]
+        assert result["site_name"] == ["UTO"]
+        assert result["study_name"] == ["STUDY1"]
+        assert result["session_name"] == ["STUDY1_UTO_0003_01"]
+        assert result["session_num"] == [1]
+
+    def test_decodes_list_and_string_values(self):
+        result = dashboard.queries.get_metric_values(
+            metrictypes=["motion", "label"], byname=True)
+        assert sorted(result["value"], key=str) == [[0.1, 0.2], "good"]
+
+    def test_filters_metric_types_by_id(self):
+        snr = dashboard.models.Metrictype.query.filter_by(name="snr").first()
+        result = dashboard.queries.get_metric_values(metrictypes=[snr.id])
+        assert set(result["metrictype"]) == {"snr"}
+        assert len(result["value"]) == 2
+
+    def test_filters_by_site(self):
+        result = dashboard.queries.get_metric_values(sites=["UTO"])
+        assert set(result["site_name"]) == {"UTO"}
+
+    def test_empty_result_still_has_every_column(self):
+        result = dashboard.queries.get_metric_values(sites=["NONE"])
+        assert result == {
+            field: [] for field in dashboard.queries.METRIC_FIELDS
+        }
+
+    def test_restricts_values_to_user_access(self):
+        result = dashboard.queries.get_metric_values(user_id=1)
+        assert result["site_name"] == ["CMH"] * 3
+
+    def test_summaries_restricted_to_user_access(self):
+        result = dashboard.queries.get_metric_summaries(user_id=1)
+        assert result["site_name"]
+        assert set(result["site_name"]) == {"CMH"}
+
+    def test_uses_a_single_query(self):
+        with count_queries() as statements:
+            dashboard.queries.get_metric_values()
+        assert len(statements) == 1
+
+    def test_stream_batches_combine_to_full_result(self):
+        expected = dashboard.queries.get_metric_values()
+        batches = list(dashboard.queries.stream_metric_values(batch_size=3))
+
+        assert len(batches) == 2
+        combined = {field: [] for field in expected}
+        for batch in batches:
+            for field in batch:
+                combined[field].extend(batch[field])
+        assert combined == expected
+
+    @pytest.fixture(autouse=True, scope="class")
+    def records(self, read_only_db):
+        """Add scans with metrics to search.
+
+        ===============================  ====== =========== ===========
+        Scan                             Review Metric      Value
+        ===============================  ====== =========== ===========
+        STUDY1_CMH_0001_01_01_T1_02             snr         10
+        STUDY1_CMH_0001_01_01_T1_02             motion      0.1::0.2
+        STUDY1_CMH_0001_01_01_T1_02             label       good
+        STUDY1_CMH_0002_01_01_T1_02      fail   snr         3
+        STUDY1_UTO_0003_01_01_T1_02      pass   snr         12.5
+        ===============================  ====== =========== ===========
+        """
+        user = dashboard.models.User("Jane", "Doe")
+        read_only_db.session.add(user)
+        read_only_db.session.commit()
+
+        study = add_studies({
+            "STUDY1": {
+                "CMH": ["T1"],
+                "UTO": ["T1"]
+            }
+        })[0]
+
+        scans = add_scans(study, {
+            Session("STUDY1_CMH_0001_01", "CMH", 1): [
+                Scan("STUDY1_CMH_0001_01_01_T1_02", 2, "T1")
+            ],
+            Session("STUDY1_CMH_0002_01", "CMH", 1): [
+                Scan("STUDY1_CMH_0002_01_01_T1_02", 2, "T1",
+                     QcReview(user.id, False, "bad"))
+            ],
+            Session("STUDY1_UTO_0003_01", "UTO", 1): [
+                Scan("STUDY1_UTO_0003_01_01_T1_02", 2, "T1",
+                     QcReview(user.id, True))
+            ]
+        })
+
+        metrictypes = {}
+        for name in ["snr", "motion", "label"]:
+            metrictypes[name] = dashboard.models.Metrictype(
+                name=name, scantype_id="T1")
+            read_only_db.session.add(metrictypes[name])
+        read_only_db.session.flush()
+
+        values = [
+            (scans[0], "snr", "10"),
+            (scans[0], "motion", "0.1::0.2"),
+            (scans[0], "label", "good"),
+            (scans[1], "snr", "3"),
+            (scans[2], "snr", "12.5"),
+        ]
+        for scan, metric, value in values:
+            read_only_db.session.add(dashboard.models.MetricValue(
+                scan_id=scan.id,
+                metrictype_id=metrictypes[metric].id,
+                value=value))
+        read_only_db.session.commit()
+        dashboard.models.MetricSummary.rebuild()
+        user.add_studies({"STUDY1": ["CMH"]})
+
+
+class TestGetMetricValuesForSharedTimepoint:
+
+    def test_returns_each_value_once(self, records):
+        result = dashboard.queries.get_metric_values()
+        assert result["value"] == [10]
+        assert result["study_name"] == ["STUDY1"]
+
+    def test_stream_returns_each_value_once(self, records):
+        batches = list(dashboard.queries.stream_metric_values())
+        assert [batch["value"] for batch in batches] == [[10]]
+
+    def test_study_filter_returns_value_for_that_study(self, records):
+        result = dashboard.queries.get_metric_values(studies=["STUDY2"])
+        assert result["value"] == [10]
+        assert result["study_name"] == ["STUDY2"]
+
+    @pytest.fixture
+    def records(self, dash_db):
+        """Add one metric value to a timepoint shared by two studies.
+        """
+        study1, study2 = add_studies({
+            "STUDY1": {"CMH": ["T1"]},
+            "STUDY2": {"CMH": ["T1"]}
+        })
+        scan = add_scans(study1, {
+            Session("STUDY1_CMH_0001_01", "CMH", 1): [
+                Scan("STUDY1_CMH_0001_01_01_T1_02", 2, "T1")
+            ]
+        })[0]
+        study2.add_timepoint(scan.session.timepoint)
+
+        metrictype = dashboard.models.Metrictype(name="snr", scantype_id="T1")
+        dash_db.session.add(metrictype)
+        dash_db.session.flush()
+        dash_db.session.add(dashboard.models.MetricValue(
+            scan_id=scan.id, metrictype_id=metrictype.id, value="10"))
+        dash_db.session.commit()
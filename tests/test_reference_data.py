@@ -0,0 +1,93 @@
+import pytest
+
+from tests.utils import add_studies, count_queries
+import dashboard.queries
+import dashboard.reference_data
+
+
+class TestReferenceData:
+
+    def test_finds_studies_by_code(self, ref_data):
+        assert ref_data.find_studies(tag="STU01") == ["STUDY1"]
+
+    def test_finds_studies_by_alt_code(self, ref_data):
+        assert ref_data.find_studies(tag="ALT01") == ["STUDY1"]
+        assert ref_data.find_studies(tag="ALT01", site="CMH") == []
+
+    def test_finds_studies_by_site(self, ref_data):
+        assert ref_data.find_studies(site="CMH") == ["STUDY1", "STUDY2"]
+
+    def test_indexes_expected_scans_by_study_and_site(self, ref_data):
+        expected = ref_data.expected_scans[("STUDY1", "CMH")]
+        assert set(expected) == {"T1", "T2"}
+
+    def test_records_cant_be_modified(self, ref_data):
+        with pytest.raises(TypeError):
+            ref_data.studies["STUDY3"] = None
+        with pytest.raises(AttributeError):
+            ref_data.studies["STUDY1"].name = "New name"
+
+    def test_snapshot_is_reused(self, ref_data):
+        assert dashboard.reference_data.get() is ref_data
+
+    def test_committed_changes_replace_snapshot(self, dash_db, ref_data):
+        study = dash_db.session.get(dashboard.models.Study, "STUDY2")
+        study.update_site("UTO", code="STU02", create=True)
+
+        assert dashboard.reference_data.get() is not ref_data
+        assert dashboard.reference_data.get().find_studies(tag="STU02") == [
+            "STUDY2"]
+
+    @pytest.fixture
+    def ref_data(self, dash_db):
+        studies = add_studies({
+            "STUDY1": {"CMH": ["T1", "T2"], "UTO": ["T1"]},
+            "STUDY2": {"CMH": ["T1"]}
+        })
+        studies[0].update_site("CMH", code="STU01")
+        alt_code = dashboard.models.AltStudyCode()
+        alt_code.study_id = "STUDY1"
+        alt_code.site_id = "UTO"
+        alt_code.code = "ALT01"
+        dash_db.session.add(alt_code)
+        dash_db.session.commit()
+        return dashboard.reference_data.get()
+
+
+class TestCachedLookups:
+
+    def test_get_tag_counts_doesnt_query_database(self, study):
+        study.update_scantype("CMH", "T1", num=2, pha_num=1)
+        study.get_tag_counts("CMH")
+
+        with count_queries() as queries:
+            assert study.get_tag_counts("CMH") == {"T1": 2}
+            assert study.get_tag_counts("CMH", pha=True) == {"T1": 1}
+        assert len(queries) == 0
+
+    def test_get_tag_counts_raises_key_error_for_unknown_site(self, study):
+        with pytest.raises(KeyError):
+            study.get_tag_counts("UTO")
+
+    def test_unknown_scantype_doesnt_query_database(self, study):
+        dashboard.queries.get_scantypes("T1")
+
+        with count_queries() as queries:
+            assert dashboard.queries.get_scantypes("T2") == []
+        assert len(queries) == 0
+
+    def test_redcap_config_found_by_project(self, dash_db):
+        config = dashboard.models.RedcapConfig.get_config(
+            project=1234, instrument="form", url="https://redcap.ca",
+            create=True
+        )
+        found = dashboard.models.RedcapConfig.get_config(
+            project="1234", instrument="form", url="https://redcap.ca"
+        )
+        assert found.id == config.id
+
+    @pytest.fixture
+    def study(self, dash_db):
+        study = add_studies({"STUDY1": {"CMH": ["T1"]}})[0]
+        dash_db.session.commit()
+        return study
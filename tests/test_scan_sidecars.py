@@ -0,0 +1,100 @@
+import os
+import json
+
+import pytest
+from mock import patch
+
+import dashboard
+from dashboard.queries import get_scan
+import dashboard.scan_sidecars as scan_sidecars
+from tests.utils import add_studies, add_scans, Session, Scan
+
+T1 = "STUDY_CMH_0001_01_01_T1_02"
+DTI = "STUDY_CMH_0001_01_01_DTI60-1000_05"
+
+
+class TestLoadSidecars:
+
+    def test_sidecars_are_added_to_scans(self, scans, nii_dir):
+        t1_json = self.write(nii_dir, T1, {"EchoTime": 0.003})
+        self.write(nii_dir, DTI, {"EchoTime": 0.08})
+
+        assert scan_sidecars.load_sidecars("STUDY", processes=0) == 2
+
+        scan = self.get_scan(T1)
+        assert scan.json_contents == {"EchoTime": 0.003}
+        assert scan.json_path == t1_json
+        assert int(scan.json_created.timestamp()) == \
+            int(os.stat(t1_json).st_ctime)
+
+    def test_unchanged_sidecars_arent_read_again(self, scans, nii_dir):
+        self.write(nii_dir, T1, {"EchoTime": 0.003})
+        scan_sidecars.load_sidecars("STUDY", processes=0)
+
+        with patch.object(scan_sidecars, "_read_file",
+                          wraps=scan_sidecars._read_file) as mock_read:
+            assert scan_sidecars.load_sidecars("STUDY", processes=0) == 0
+        assert mock_read.call_count == 0
+
+    def test_force_reloads_unchanged_sidecars(self, scans, nii_dir):
+        self.write(nii_dir, T1, {"EchoTime": 0.003})
+        scan_sidecars.load_sidecars("STUDY", processes=0)
+        assert scan_sidecars.load_sidecars(
+            "STUDY", processes=0, force=True) == 1
+
+    def test_unreadable_sidecars_are_skipped(self, scans, nii_dir):
+        self.write(nii_dir, T1, {"EchoTime": 0.003})
+        with open(os.path.join(nii_dir, f"{DTI}_Ax-DTI-60plus5.json"),
+                  "w") as fh:
+            fh.write("{not json")
+
+        assert scan_sidecars.load_sidecars("STUDY", processes=0) == 1
+        assert self.get_scan(DTI).json_contents is None
+
+    def test_files_for_unknown_scans_are_ignored(self, scans, nii_dir):
+        self.write(nii_dir, "STUDY_CMH_0001_01_01_T2_03", {"EchoTime": 0.1})
+        with open(os.path.join(nii_dir, "notes.json"), "w") as fh:
+            fh.write("{}")
+        assert scan_sidecars.load_sidecars("STUDY", processes=0) == 0
+
+    def test_updates_are_batched(self, scans, nii_dir):
+        self.write(nii_dir, T1, {"EchoTime": 0.003})
+        self.write(nii_dir, DTI, {"EchoTime": 0.08})
+
+        with patch.object(dashboard.models.db.session, "commit",
+                          wraps=dashboard.models.db.session.commit) \
+                as mock_commit:
+            scan_sidecars.load_sidecars("STUDY", processes=0, batch_size=1)
+        assert mock_commit.call_count == 2
+
+    def test_parses_in_process_pool(self, scans, nii_dir):
+        self.write(nii_dir, T1, {"EchoTime": 0.003})
+        assert scan_sidecars.load_sidecars("STUDY", processes=1) == 1
+        assert self.get_scan(T1).json_contents == {"EchoTime": 0.003}
+
+    def write(self, nii_dir, scan_name, contents):
+        path = os.path.join(nii_dir, f"{scan_name}_Description.json")
+        with open(path, "w") as fh:
+            json.dump(contents, fh)
+        return path
+
+    def get_scan(self, name):
+        return get_scan(name)[0]
+
+    @pytest.fixture
+    def nii_dir(self, tmp_path):
+        nii_dir = tmp_path / "nii" / "STUDY_CMH_0001_01"
+        nii_dir.mkdir(parents=True)
+        with patch.object(scan_sidecars.dm_utils, "get_nii_path",
+                          return_value=str(tmp_path / "nii")):
+            yield str(nii_dir)
+
+    @pytest.fixture
+    def scans(self, dash_db):
+        study = add_studies({"STUDY": {"CMH": ["T1", "DTI60-1000"]}})[0]
+        return add_scans(study, {
+            Session("STUDY_CMH_0001_01", "CMH", 1): [
+                Scan(T1, 2, "T1"),
+                Scan(DTI, 5, "DTI60-1000")
+            ]
+        })
@@ -0,0 +1,154 @@
+import time
+
+import pytest
+from mock import Mock, patch
+
+from tests.utils import add_studies, add_scans, count_queries, Session, Scan
+import dashboard.queries
+import dashboard.search_index
+import dashboard.blueprints.main.views as views
+from dashboard.search_index import PrefixIndex
+
+
+class TestPrefixIndex:
+
+    def test_finds_names_starting_with_prefix(self, index):
+        result = index.complete("STUDY1_CMH_0001")
+        assert [entry.name for entry, _ in result] == [
+            "STUDY1_CMH_0001_01",
+            "STUDY1_CMH_0001_01_01",
+            "STUDY1_CMH_0001_01_01_T1_02"
+        ]
+
+    def test_prefix_is_not_case_sensitive(self, index):
+        result = index.complete("study1_uto")
+        assert [entry.name for entry, _ in result] == ["STUDY1_UTO_0002_01"]
+
+    def test_finds_bids_names(self, index):
+        result = index.complete("sub-CMH0001")
+        assert len(result) == 1
+        entry, _ = result[0]
+        assert entry.kind == "scan"
+        assert entry.scan_id == 1
+
+    def test_limit_restricts_number_of_matches(self, index):
+        assert len(index.complete("STUDY", limit=2)) == 2
+
+    def test_blank_prefix_returns_nothing(self, index):
+        assert index.complete("  ") == []
+
+    def test_pairs_matches_with_first_accessible_study(self, index):
+        result = index.complete("STUDY1_CMH_0001_01",
+                                has_access=lambda study, site: True)
+        assert {study for _, study in result} == {"STUDY1"}
+
+        result = index.complete("STUDY1_CMH_0001_01",
+                                has_access=lambda study, _: study == "STUDY2")
+        assert {study for _, study in result} == {"STUDY2"}
+
+    def test_excludes_inaccessible_sites(self, index):
+        result = index.complete("STUDY1",
+                                has_access=lambda _, site: site == "UTO")
+        assert [entry.name for entry, _ in result] == ["STUDY1_UTO_0002_01"]
+
+    def test_added_records_can_be_found(self, index):
+        index.add_timepoint("STUDY1_CMH_0003_01", "CMH", "STUDY1")
+        index.add_session("STUDY1_CMH_0003_01", 1)
+        index.add_scan(5, "STUDY1_CMH_0003_01_01_T1_02", "STUDY1_CMH_0003_01",
+                       1)
+        result = index.complete("STUDY1_CMH_0003")
+        assert [entry.kind for entry, _ in result] == [
+            "subject", "session", "scan"]
+
+    def test_adding_existing_record_doesnt_duplicate_it(self, index):
+        index.add_session("STUDY1_CMH_0001_01", 1)
+        assert len(index.complete("STUDY1_CMH_0001_01_01")) == 2
+
+    def test_ignores_additions_until_loaded(self):
+        index = PrefixIndex()
+        index.add_timepoint("STUDY1_CMH_0001_01", "CMH", "STUDY1")
+        assert index.complete("STUDY1") == []
+        assert index.built is None
+
+    @pytest.fixture
+    def index(self):
+        index = PrefixIndex()
+        index.load(
+            [("STUDY1_CMH_0001_01", "CMH", "STUDY2"),
+             ("STUDY1_CMH_0001_01", "CMH", "STUDY1"),
+             ("STUDY1_UTO_0002_01", "UTO", "STUDY1")],
+            [("STUDY1_CMH_0001_01", 1)],
+            [(1, "STUDY1_CMH_0001_01_01_T1_02", "sub-CMH0001_T1w",
+              "STUDY1_CMH_0001_01", 1)]
+        )
+        return index
+
+
+class TestLoadSearchIndex:
+
+    def test_loads_existing_records(self, records):
+        index = dashboard.queries.load_search_index()
+        assert [entry.name for entry, _ in index.complete("STUDY1")] == [
+            "STUDY1_CMH_0001_01",
+            "STUDY1_CMH_0001_01_01",
+            "STUDY1_CMH_0001_01_01_T1_02"
+        ]
+
+    def test_new_records_are_added_to_loaded_index(self, records):
+        index = dashboard.queries.load_search_index()
+        add_scans(records, {
+            Session("STUDY1_CMH_0002_01", "CMH", 1): [
+                Scan("STUDY1_CMH_0002_01_01_T1_02", 2, "T1")
+            ]
+        })
+        assert [entry.kind for entry, _ in index.complete("STUDY1_CMH_0002")] \
+            == ["subject", "session", "scan"]
+
+
+class TestStart:
+
+    def test_index_is_loaded_on_start(self, dash_app, records):
+        dashboard.search_index.start(dash_app)
+        assert len(dashboard.search_index.index.complete("STUDY1")) == 3
+
+    def test_index_is_reloaded_in_background(self, dash_app, records):
+        dash_app.config["SEARCH_INDEX_MAX_AGE"] = 0.05
+        dashboard.search_index.start(dash_app)
+        dashboard.search_index.index.load([], [], [])
+
+        end = time.monotonic() + 5
+        while not dashboard.search_index.index.complete("STUDY1"):
+            assert time.monotonic() < end, "Index wasn't reloaded"
+            time.sleep(0.01)
+
+    def test_suggestions_dont_query_database(self, dash_app, records):
+        dashboard.search_index.start(dash_app)
+        user = Mock(access_scope_id=None)
+        with dash_app.test_request_context("/search/suggest?q=study1_cmh"):
+            with patch.object(views, "current_user", user):
+                with count_queries() as statements:
+                    response = views.search_suggest.__wrapped__()
+
+        assert len(response.get_json()) == 3
+        assert statements == []
+
+    @pytest.fixture(autouse=True)
+    def stop(self, dash_app, dash_db):
+        # The reload thread must be stopped before the tables are dropped
+        max_age = dash_app.config["SEARCH_INDEX_MAX_AGE"]
+        yield
+        dashboard.search_index.stop(5)
+        dash_app.config["SEARCH_INDEX_MAX_AGE"] = max_age
+
+
+@pytest.fixture
+def records(dash_db):
+    study = add_studies({"STUDY1": {"CMH": ["T1"]}})[0]
+    add_scans(study, {
+        Session("STUDY1_CMH_0001_01", "CMH", 1): [
+            Scan("STUDY1_CMH_0001_01_01_T1_02", 2, "T1")
+        ]
+    })
+    dashboard.search_index.index.built = None
+    yield study
+    dashboard.search_index.index.built = None
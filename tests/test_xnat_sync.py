@@ -0,0 +1,203 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qsl
+
+import pytest
+
+from dashboard.xnat_sync import XnatSyncWorker
+
+ARCHIVE = "ARCHIVE"
+EXP = "STUDY_CMH_0001_01_SE01_MR"
+
+
+class TestXnatSyncWorker:
+
+    def test_updates_for_an_experiment_share_one_lookup(self, fake_xnat,
+                                                        worker):
+        worker.submit(fake_xnat.url, "user", "pass", ARCHIVE, EXP, [
+            (2, "", "usable"),
+            (3, "Motion", "unusable")
+        ])
+        worker.stop()
+
+        assert len(fake_xnat.requests("GET", "/scans")) == 1
+        assert fake_xnat.updates() == {
+            "2": {"xnat:mrScanData/quality": "usable"},
+            "3": {"xnat:mrScanData/quality": "unusable",
+                  "xnat:mrScanData/note": "Motion"}
+        }
+        assert worker.stats()["pushed"] == 2
+
+    def test_repeated_updates_to_a_series_are_coalesced(
+            self, fake_xnat, worker):
+        worker.window = 60
+        worker.submit(fake_xnat.url, "user", "pass", ARCHIVE, EXP,
+                      [(2, "", "usable")])
+        worker.submit(fake_xnat.url, "user", "pass", ARCHIVE, EXP,
+                      [(2, "Artifact", "questionable")])
+        assert worker.stats()["queued"] == 1
+        worker.stop()
+
+        assert len(fake_xnat.requests("PUT", "/scans/")) == 1
+        assert fake_xnat.updates()["2"]["xnat:mrScanData/quality"] == \
+            "questionable"
+        assert worker.stats()["coalesced"] == 1
+
+    def test_connections_are_reused(self, fake_xnat, worker):
+        for exp in [EXP, "STUDY_CMH_0002_01_SE01_MR"]:
+            worker.submit(fake_xnat.url, "user", "pass", ARCHIVE, exp,
+                          [(2, "", "usable")])
+            wait_for(lambda: worker.stats()["queued"] == 0)
+        assert worker.stats()["connections"] == 1
+        worker.stop()
+
+        assert len(fake_xnat.requests("GET", "/data/auth")) == 1
+        assert worker.stats()["connections"] == 0
+
+    def test_failed_pushes_are_retried(self, fake_xnat, worker):
+        fake_xnat.failures = 1
+        worker.submit(fake_xnat.url, "user", "pass", ARCHIVE, EXP,
+                      [(2, "", "usable")])
+        wait_for(lambda: worker.stats()["pushed"] == 1)
+
+        stats = worker.stats()
+        assert stats["retried"] == 1
+        assert stats["failed"] == 0
+
+    def test_gives_up_after_max_retries(self, fake_xnat, worker):
+        fake_xnat.failures = 10
+        worker.submit(fake_xnat.url, "user", "pass", ARCHIVE, EXP,
+                      [(2, "", "usable")])
+        wait_for(lambda: worker.stats()["failed"] == 1)
+
+        assert worker.stats()["retried"] == worker.retries
+        assert not fake_xnat.updates()
+
+    def test_updates_are_dropped_when_queue_is_full(self, fake_xnat,
+                                                    worker):
+        worker.window = 60
+        worker.max_pending = 1
+        assert worker.submit(fake_xnat.url, "user", "pass", ARCHIVE, EXP,
+                             [(2, "", "usable")])
+        assert not worker.submit(fake_xnat.url, "user", "pass", ARCHIVE, EXP,
+                                 [(3, "", "usable")])
+        worker.stop()
+
+        assert list(fake_xnat.updates()) == ["2"]
+        assert worker.stats()["dropped"] == 1
+
+    def test_unknown_series_are_skipped(self, fake_xnat, worker):
+        worker.submit(fake_xnat.url, "user", "pass", ARCHIVE, EXP,
+                      [(2, "", "usable"), (9, "", "usable")])
+        worker.stop()
+
+        assert list(fake_xnat.updates()) == ["2"]
+        assert worker.stats()["missing"] == 1
+
+    def test_long_comments_are_truncated(self, fake_xnat, worker):
+        worker.submit(fake_xnat.url, "user", "pass", ARCHIVE, EXP,
+                      [(2, "x" * 300, "usable")])
+        worker.stop()
+
+        note = fake_xnat.updates()["2"]["xnat:mrScanData/note"]
+        assert note.endswith(" [...]")
+        assert len(note) < 255
+
+    @pytest.fixture
+    def worker(self):
+        worker = XnatSyncWorker(window=0, retries=2, backoff=0.01)
+        yield worker
+        worker.stop(5)
+
+    @pytest.fixture
+    def fake_xnat(self):
+        server = FakeXnat()
+        yield server
+        server.shutdown()
+
+
+def wait_for(condition, timeout=5):
+    end = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > end:
+            raise AssertionError("Timed out waiting for XNAT sync worker")
+        time.sleep(0.01)
+
+
+class FakeXnat:
+    """A local XNAT server that knows of scans 2 and 3 in every experiment.
+
+    Attributes:
+        failures (int): The number of scan lookups to fail before
+            responding normally.
+    """
+
+    def __init__(self):
+        self.failures = 0
+        self.log = []
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0),
+                                           self._make_handler())
+        self.url = "http://127.0.0.1:{}".format(self._server.server_port)
+        threading.Thread(target=self._server.serve_forever,
+                         daemon=True).start()
+
+    def requests(self, method, path):
+        return [query for req_method, req_path, query in self.log
+                if req_method == method and path in req_path]
+
+    def updates(self):
+        updates = {}
+        for method, path, query in self.log:
+            if method == "PUT" and "/scans/" in path:
+                fields = {key: value for key, value in query.items()
+                          if key != "xsiType"}
+                updates.setdefault(path.split("/")[-1], {}).update(fields)
+        return updates
+
+    def shutdown(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def respond(self, method, path, query):
+        self.log.append((method, path, query))
+        if path == "/data/JSESSION":
+            return 200, "FAKESESSION"
+        if path == "/data/auth":
+            return 200, "User 'user' is logged in"
+        if method == "GET" and path.endswith("/scans"):
+            if self.failures:
+                self.failures -= 1
+                return 500, "Server error"
+            exp = path.split("/")[-2]
+            return 200, json.dumps({"ResultSet": {"Result": [{
+                "ID": str(num),
+                "xsiType": "xnat:mrScanData",
+                "URI": f"/data/experiments/{exp}/scans/{num}"
+            } for num in (2, 3)]}})
+        return 200, ""
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def handle_request(self):
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                self.rfile.read(length)
+                status, body = fake.respond(self.command, url.path,
+                                            dict(parse_qsl(url.query)))
+                body = body.encode()
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_PUT = do_POST = do_DELETE = handle_request
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
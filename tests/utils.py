@@ -1,6 +1,7 @@
 """Re-usable functions to help with testing.
 """
 from collections import namedtuple
+from contextlib import contextmanager
 import sqlalchemy
 
 from dashboard import models
@@ -101,3 +102,24 @@ def query_db(sql_query):
         models.db.session.rollback()
         raise
     return records
+
+
+@contextmanager
+def count_queries():
+    """Count the SQL statements issued to the database inside a with block.
+
+    Yields:
+        list: A list that will hold the text of each statement executed
+            while the context is active.
+    """
+    statements = []
+
+    def track(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = models.db.engine
+    sqlalchemy.event.listen(engine, "before_cursor_execute", track)
+    try:
+        yield statements
+    finally:
+        sqlalchemy.event.remove(engine, "before_cursor_execute", track)
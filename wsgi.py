@@ -5,9 +5,12 @@ This is used to start the app for debug / development on a local machine.
 
 This script is also used by flask migrate and srv_uwsgi.sh.
 """
-from dashboard import create_app
+from dashboard import create_app, search_index
 
 app = create_app()
 
+# Load the search bar's suggestions before any requests are served
+search_index.start(app)
+
 if __name__ == '__main__':
     app.run(threaded=True, host='0.0.0.0')